@@ -0,0 +1,377 @@
+import asyncio
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from app.core.config import (
+    MAX_OTP_ATTEMPTS,
+    MAX_OTP_REQUESTS_PER_HOUR,
+    MAX_OTP_REQUESTS_PER_IP_PER_HOUR,
+    MAX_OTP_ATTEMPTS_PER_IP_PER_HOUR,
+    OTP_STATE_FLUSH_SECONDS,
+    TRUSTED_PROXY_IPS,
+)
+from app.db.database import get_db
+
+logger = logging.getLogger(__name__)
+
+_HOUR = 3600
+# Keys tracked per window; the least recently used are forgotten first, so
+# a flood of distinct addresses cannot grow memory without bound
+_MAX_TRACKED_KEYS = 50000
+
+
+class SlidingWindow:
+    """At most ``limit`` events per key within the last ``window`` seconds."""
+
+    def __init__(self, limit: int, window: float, max_keys: int = _MAX_TRACKED_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events = OrderedDict()
+
+    def _recent(self, key: str, now: float) -> deque:
+        events = self._events.get(key)
+        if events is None:
+            return deque()
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        return events
+
+    def retry_after(self, key: str, now: float) -> float:
+        """0 if another event is allowed now, else seconds until one is."""
+        events = self._recent(key, now)
+        if len(events) < self.limit:
+            return 0.0
+        return events[0] + self.window - now
+
+    def record(self, key: str, now: float):
+        events = self._recent(key, now)
+        events.append(now)
+        self._events[key] = events
+        self._events.move_to_end(key)
+        while len(self._events) > self.max_keys:
+            self._events.popitem(last=False)
+
+    def __len__(self):
+        return len(self._events)
+
+
+class ActiveCode:
+    """The newest unused OTP of one email address."""
+
+    __slots__ = ("token_id", "token", "expires_at", "attempts")
+
+    def __init__(self, token_id: int, token: str, expires_at: float, attempts: int = 0):
+        self.token_id = token_id
+        self.token = token
+        self.expires_at = expires_at
+        self.attempts = attempts
+
+
+class OTPGuard:
+    """
+    In-memory OTP rate limits and attempt tracking.
+
+    Requests are limited per email (MAX_OTP_REQUESTS_PER_HOUR) and per
+    client IP; code guesses per active code (MAX_OTP_ATTEMPTS) and per
+    client IP. Each email's active code is kept here once issued (or read
+    once on a miss), so refused requests and wrong guesses cost no SQL
+    and, above all, no writes that would contend with provisioning for
+    the SQLite write lock.
+
+    Attempt counts and codes locked out by too many attempts are written
+    to ``otp_tokens`` behind the fact by a background task every
+    ``flush_seconds``. The email windows and active codes are reloaded
+    from ``otp_tokens`` at startup; the IP windows start empty. With more
+    than one portal process each keeps its own counts; a successful
+    verification is still single-use because it is recorded with a
+    conditional UPDATE.
+    """
+
+    def __init__(
+        self,
+        max_requests: int = MAX_OTP_REQUESTS_PER_HOUR,
+        max_attempts: int = MAX_OTP_ATTEMPTS,
+        max_ip_requests: int = MAX_OTP_REQUESTS_PER_IP_PER_HOUR,
+        max_ip_attempts: int = MAX_OTP_ATTEMPTS_PER_IP_PER_HOUR,
+        flush_seconds: float = OTP_STATE_FLUSH_SECONDS,
+    ):
+        self.max_attempts = max_attempts
+        self.flush_seconds = flush_seconds
+        self._email_requests = SlidingWindow(max_requests, _HOUR)
+        self._ip_requests = SlidingWindow(max_ip_requests, _HOUR)
+        self._ip_attempts = SlidingWindow(max_ip_attempts, _HOUR)
+        self._active = OrderedDict()
+        self._lock = threading.Lock()
+        # Write-behind state: token id -> attempts, and locked-out token ids
+        self._pending_attempts = {}
+        self._pending_lockouts = set()
+        self._task = None
+        self._counters = {
+            "requests_allowed": 0,
+            "requests_refused": 0,
+            "verified": 0,
+            "rejected_guesses": 0,
+            "lockouts": 0,
+            "ip_refusals": 0,
+            "code_lookups": 0,
+            "flushed_rows": 0,
+        }
+
+    # --- Lifecycle ---
+
+    def load(self):
+        """Seed the email windows and active codes from ``otp_tokens``."""
+        now = time.time()
+        since = datetime.fromtimestamp(now - _HOUR, timezone.utc)
+        db = get_db()
+        try:
+            issued = db.execute(
+                "SELECT email, created_at FROM otp_tokens WHERE created_at > ? ORDER BY created_at",
+                (since,),
+            ).fetchall()
+            active = db.execute(
+                """SELECT id, email, token, expires_at, attempts FROM otp_tokens
+                   WHERE used = FALSE AND expires_at > ? ORDER BY created_at""",
+                (datetime.now(timezone.utc),),
+            ).fetchall()
+        finally:
+            db.close()
+        with self._lock:
+            for row in issued:
+                # Legacy rows whose timestamp cannot be parsed read as None
+                if row["created_at"] is not None:
+                    self._email_requests.record(
+                        row["email"], row["created_at"].timestamp()
+                    )
+            for row in active:
+                code = _active_from_row(row)
+                if code is not None:
+                    self._remember(row["email"], code)
+        logger.info(
+            f"OTP guard loaded {len(issued)} recent request(s), {len(active)} active code(s)."
+        )
+
+    def start(self):
+        """Must be called from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.error("Failed to persist OTP attempt counts", exc_info=True)
+
+    # --- Requests ---
+
+    def check_request(
+        self, email: str, client_ip: str = None, record: bool = False
+    ) -> tuple:
+        """
+        (allowed, message) for a new code. With ``record`` the request is
+        also counted, atomically with the check.
+        """
+        active = self._active_code(email)
+        now = time.time()
+        with self._lock:
+            if client_ip and self._ip_requests.retry_after(client_ip, now):
+                self._counters["ip_refusals"] += 1
+                return (
+                    False,
+                    "Too many access code requests from your network. Please try again later.",
+                )
+            if self._email_requests.retry_after(email, now):
+                self._counters["requests_refused"] += 1
+                return False, "Too many OTP requests. Please try again later."
+            remaining = active.expires_at - now if active is not None else 0
+            if remaining > 60:  # More than 1 minute remaining
+                self._counters["requests_refused"] += 1
+                return (
+                    False,
+                    f"Please wait {int(remaining / 60)} minutes before requesting a new OTP.",
+                )
+            if record:
+                self._email_requests.record(email, now)
+                if client_ip:
+                    self._ip_requests.record(client_ip, now)
+                self._counters["requests_allowed"] += 1
+        return True, ""
+
+    def issued(self, email: str, token_id: int, token: str, expires_at: datetime):
+        """Remember a newly issued code (older codes were invalidated by the caller)."""
+        with self._lock:
+            self._remember(email, ActiveCode(token_id, token, expires_at.timestamp()))
+
+    def discard(self, email: str):
+        """Forget the active code of ``email`` (already invalidated in the database)."""
+        with self._lock:
+            self._active.pop(email, None)
+
+    # --- Verification ---
+
+    def verify(self, email: str, code: str, client_ip: str = None) -> tuple:
+        """
+        (outcome, token_id, message). ``outcome`` is 'match' if ``code`` is
+        the active code (the caller still has to mark it used), otherwise
+        'rejected'.
+        """
+        now = time.time()
+        if client_ip:
+            with self._lock:
+                if self._ip_attempts.retry_after(client_ip, now):
+                    self._counters["ip_refusals"] += 1
+                    return (
+                        "rejected",
+                        None,
+                        "Too many attempts from your network. Please try again later.",
+                    )
+                self._ip_attempts.record(client_ip, now)
+        active = self._active_code(email)
+        with self._lock:
+            if active is not None and self._active.get(email) is not active:
+                # Used or locked out by a concurrent request
+                active = None
+            if active is not None and active.expires_at <= now:
+                del self._active[email]
+                active = None
+            if active is None:
+                self._counters["rejected_guesses"] += 1
+                return "rejected", None, "Invalid or expired OTP"
+            if secrets.compare_digest(active.token, code):
+                del self._active[email]
+                return "match", active.token_id, ""
+            active.attempts += 1
+            self._pending_attempts[active.token_id] = active.attempts
+            self._counters["rejected_guesses"] += 1
+            if active.attempts >= self.max_attempts:
+                # Locked out; written to the database by the next flush
+                del self._active[email]
+                self._pending_lockouts.add(active.token_id)
+                self._counters["lockouts"] += 1
+                return (
+                    "rejected",
+                    None,
+                    "Too many incorrect attempts. Please request a new OTP.",
+                )
+        return "rejected", None, "Invalid or expired OTP"
+
+    def verified(self):
+        with self._lock:
+            self._counters["verified"] += 1
+
+    # --- Internals ---
+
+    def _remember(self, email: str, active: ActiveCode):
+        self._active[email] = active
+        self._active.move_to_end(email)
+        while len(self._active) > _MAX_TRACKED_KEYS:
+            self._active.popitem(last=False)
+
+    def _active_code(self, email: str):
+        """The cached active code, read from the database on a miss."""
+        with self._lock:
+            active = self._active.get(email)
+        if active is not None:
+            return active
+        db = get_db()
+        try:
+            row = db.execute(
+                """SELECT id, token, expires_at, attempts FROM otp_tokens
+                   WHERE email = ? AND used = FALSE AND expires_at > ?
+                   ORDER BY created_at DESC LIMIT 1""",
+                (email, datetime.now(timezone.utc)),
+            ).fetchone()
+        finally:
+            db.close()
+        with self._lock:
+            self._counters["code_lookups"] += 1
+            if row is None or row["id"] in self._pending_lockouts:
+                return None
+            active = _active_from_row(row)
+            if active is None:
+                return None
+            active.attempts = max(
+                active.attempts, self._pending_attempts.get(row["id"], 0)
+            )
+            if active.attempts >= self.max_attempts:
+                return None
+            # Issued meanwhile by this process; keep its in-memory attempts
+            return self._active.setdefault(email, active)
+
+    def flush(self):
+        """Write pending attempt counts and lockouts to ``otp_tokens``."""
+        with self._lock:
+            attempts, self._pending_attempts = self._pending_attempts, {}
+            lockouts, self._pending_lockouts = self._pending_lockouts, set()
+        if not attempts and not lockouts:
+            return
+        db = get_db()
+        try:
+            db.executemany(
+                "UPDATE otp_tokens SET attempts = MAX(attempts, ?) WHERE id = ?",
+                [(count, token_id) for token_id, count in attempts.items()],
+            )
+            db.executemany(
+                "UPDATE otp_tokens SET used = TRUE WHERE id = ?",
+                [(token_id,) for token_id in lockouts],
+            )
+            db.commit()
+        except BaseException:
+            # Keep the state for the next flush
+            with self._lock:
+                for token_id, count in attempts.items():
+                    self._pending_attempts[token_id] = max(
+                        count, self._pending_attempts.get(token_id, 0)
+                    )
+                self._pending_lockouts |= lockouts
+            raise
+        finally:
+            db.close()
+        with self._lock:
+            self._counters["flushed_rows"] += len(attempts) + len(lockouts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "active_codes": len(self._active),
+                "tracked_emails": len(self._email_requests),
+                "tracked_ips": len(self._ip_requests) + len(self._ip_attempts),
+                "pending_writes": len(self._pending_attempts)
+                + len(self._pending_lockouts),
+            }
+
+
+def _active_from_row(row):
+    """None for a code whose deadline cannot be read; it is treated as expired."""
+    if row["expires_at"] is None:
+        return None
+    return ActiveCode(
+        row["id"], row["token"], row["expires_at"].timestamp(), row["attempts"]
+    )
+
+
+def client_ip(request) -> str:
+    """The client address, taken from X-Real-IP only when set by a trusted proxy."""
+    peer = request.client.host if request.client else None
+    if peer in TRUSTED_PROXY_IPS:
+        return request.headers.get("x-real-ip", peer).strip()
+    return peer
+
+
+# Global guard used by the OTP service
+otp_guard = OTPGuard()
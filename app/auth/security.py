@@ -1,35 +1,127 @@
 # filepath: /Users/mani/work/rstudio-portal/app/auth/security.py
+import secrets
+import threading
+import time
 from fastapi import Request, HTTPException, status, Depends
 from datetime import datetime, timedelta, timezone
+from jose import jwt, JWTError
 from app.db.database import get_db
-from app.core.config import DEFAULT_SESSION_HOURS, REMEMBER_ME_SESSION_DAYS
+from app.auth.user_cache import user_cache
+from app.core.config import (
+    DEFAULT_SESSION_HOURS,
+    REMEMBER_ME_SESSION_DAYS,
+    SESSION_SECRET_KEY,
+    SESSION_TOKEN_ALGORITHM,
+)
 
+SESSION_COOKIE_NAME = "session_token"
 
-def get_current_user(request: Request):
-    email = request.cookies.get("user_email")
-    if not email:
-        return None
+if not SESSION_SECRET_KEY:
+    # A per-process random key would log everyone out on every restart and
+    # make each worker reject the others' cookies
+    raise RuntimeError(
+        "SESSION_SECRET_KEY is not set. Generate one with: openssl rand -hex 32"
+    )
 
-    db = get_db()
-    try:
-        user = db.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
 
-        # Check if session is still valid
-        session_expires = request.cookies.get("session_expires")
-        if session_expires:
-            try:
-                expires_dt = datetime.fromisoformat(session_expires)
-                # Make expires_dt timezone-aware if it's naive
-                if expires_dt.tzinfo is None:
-                    expires_dt = expires_dt.replace(tzinfo=timezone.utc)
-                if datetime.now(timezone.utc) > expires_dt:
-                    return None  # Session expired
-            except ValueError:
-                return None  # Invalid date format
+class TokenRevocationList:
+    """
+    In-memory revocation list for session tokens.
+
+    Tokens are revoked by ``jti`` on logout. Rights are read from the user
+    record on every request, so changing them needs no revocation. Entries
+    are dropped once the tokens they cover expire.
+    """
+
+    def __init__(self):
+        self._revoked_jti = {}
+        self._lock = threading.Lock()
+
+    def revoke_token(self, jti: str, expires_at: float):
+        with self._lock:
+            self._revoked_jti[jti] = expires_at
+            self._purge()
+
+    def is_revoked(self, claims: dict) -> bool:
+        with self._lock:
+            return claims.get("jti") in self._revoked_jti
+
+    def _purge(self):
+        now = time.time()
+        self._revoked_jti = {
+            j: exp for j, exp in self._revoked_jti.items() if exp > now
+        }
+
+
+revocation_list = TokenRevocationList()
+
 
+def _load_user(email: str):
+    """Fetch a user row, served from the user cache when possible."""
+    user = user_cache.get(email)
+    if user is not None:
         return user
+
+    db = get_db()
+    try:
+        user = db.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
     finally:
         db.close()
+    if user is not None:
+        user_cache.set(email, user)
+    return user
+
+
+def decode_session_token(token: str):
+    """Verify a session token's signature, expiry and revocation. Returns claims or None."""
+    try:
+        claims = jwt.decode(
+            token, SESSION_SECRET_KEY, algorithms=[SESSION_TOKEN_ALGORITHM]
+        )
+    except JWTError:
+        return None
+    if claims.get("typ"):
+        # Same key, different purpose (e.g. extend links)
+        return None
+    if revocation_list.is_revoked(claims):
+        return None
+    return claims
+
+
+def get_current_user(request: Request):
+    # Resolve at most once per request: UserMiddleware and route
+    # dependencies share request.state
+    if getattr(request.state, "user_resolved", False):
+        return request.state.user
+
+    user = _resolve_user(request)
+    request.state.user = user
+    request.state.user_resolved = True
+    return user
+
+
+def _resolve_user(request: Request):
+    token = request.cookies.get(SESSION_COOKIE_NAME)
+    if not token:
+        return None
+
+    claims = decode_session_token(token)
+    if not claims:
+        return None
+
+    # Rights come from the user record (served from the user cache), so
+    # a user deleted, demoted or moved to another lab in the database
+    # loses the old rights within USER_CACHE_TTL_SECONDS
+    user = _load_user(claims["email"])
+    if user is None or user["id"] != int(claims["sub"]):
+        return None
+
+    return {
+        "id": user["id"],
+        "email": user["email"],
+        "is_admin": bool(user["is_admin"]),
+        "lab_name": user["lab_name"],
+    }
 
 
 def get_current_active_user(current_user: dict = Depends(get_current_user)):
@@ -43,7 +135,16 @@ def get_current_active_user(current_user: dict = Depends(get_current_user)):
 
 
 def create_user_session(email: str, remember_me: bool = False) -> dict:
-    """Create session data for authenticated user"""
+    """
+    Create a signed session token for an authenticated user.
+
+    The token identifies the user (id and email) and carries its expiry;
+    admin flag and lab are read from the cached user record per request.
+    """
+    user = _load_user(email)
+    if user is None:
+        raise ValueError(f"Unknown user: {email}")
+
     if remember_me:
         expires_at = datetime.now(timezone.utc) + timedelta(
             days=REMEMBER_ME_SESSION_DAYS
@@ -51,7 +152,53 @@ def create_user_session(email: str, remember_me: bool = False) -> dict:
     else:
         expires_at = datetime.now(timezone.utc) + timedelta(hours=DEFAULT_SESSION_HOURS)
 
-    return {"email": email, "expires_at": expires_at, "remember_me": remember_me}
+    claims = {
+        "sub": str(user["id"]),
+        "email": user["email"],
+        "iat": int(time.time()),
+        "exp": int(expires_at.timestamp()),
+        "jti": secrets.token_urlsafe(12),
+    }
+    token = jwt.encode(claims, SESSION_SECRET_KEY, algorithm=SESSION_TOKEN_ALGORITHM)
+
+    return {
+        "email": email,
+        "token": token,
+        "expires_at": expires_at,
+        "remember_me": remember_me,
+    }
+
+
+def revoke_session_token(token: str):
+    """Revoke a single session token (used on logout)."""
+    claims = decode_session_token(token)
+    if claims:
+        revocation_list.revoke_token(claims["jti"], claims["exp"])
+
+
+def create_extend_token(instance_id: int, expires_at: datetime) -> str:
+    """
+    Signed token for the extend link of an expiry warning.
+
+    It names the deadline it was issued for, so it extends the session at
+    most once, and it stops working when that deadline passes.
+    """
+    deadline = int(expires_at.timestamp())
+    claims = {"typ": "extend", "sub": str(instance_id), "dl": deadline, "exp": deadline}
+    return jwt.encode(claims, SESSION_SECRET_KEY, algorithm=SESSION_TOKEN_ALGORITHM)
+
+
+def decode_extend_token(token: str):
+    """(instance_id, deadline) of a valid extend token, else None."""
+    try:
+        claims = jwt.decode(
+            token, SESSION_SECRET_KEY, algorithms=[SESSION_TOKEN_ALGORITHM]
+        )
+    except JWTError:
+        return None
+    if claims.get("typ") != "extend":
+        return None
+    return int(claims["sub"]), datetime.fromtimestamp(claims["dl"], timezone.utc)
 
 
 def is_valid_nus_email(email: str) -> bool:
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.config import USER_CACHE_MAXSIZE, USER_CACHE_TTL_SECONDS
+
+
+class UserCache:
+    """
+    Small LRU cache of `users` rows keyed by email, with a TTL.
+
+    Anything that updates a user row (lab selection, login, admin flag
+    changes) must call invalidate() for that email so the next request
+    re-reads it from the database.
+    """
+
+    def __init__(
+        self, maxsize: int = USER_CACHE_MAXSIZE, ttl: float = USER_CACHE_TTL_SECONDS
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, email: str):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[email]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, email: str, user):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[email] = (user, time.monotonic())
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email: str):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+# Global user cache shared by the middleware and route dependencies
+user_cache = UserCache()
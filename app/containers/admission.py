@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+
+from app.core.config import MAX_CONCURRENT_SESSIONS
+from app.db.database import get_db
+from app.containers.ports import ACTIVE_STATUSES
+from app.containers.live_status import status_broadcaster
+from app.containers.resources import resource_scheduler, parse_limits
+
+logger = logging.getLogger(__name__)
+
+_STATUS_PLACEHOLDERS = ", ".join("?" for _ in ACTIVE_STATUSES)
+
+# The caller's newest active row and the number of slots in use
+_ADMISSION_QUERY = f"""
+    SELECT
+        (SELECT status FROM user_instances
+         WHERE user_id = ? AND status IN ({_STATUS_PLACEHOLDERS})
+         ORDER BY id DESC LIMIT 1) AS active_status,
+        (SELECT COUNT(*) FROM user_instances
+         WHERE status IN ({_STATUS_PLACEHOLDERS})) AS sessions
+"""
+
+
+class AdmissionRefused(Exception):
+    """
+    The request does not fit. ``category`` is the dashboard banner it is
+    shown in ('message' for informational, 'error' otherwise).
+    """
+
+    def __init__(self, message: str, category: str = "error"):
+        super().__init__(message)
+        self.category = category
+
+
+class AdmissionController:
+    """
+    Hands out the ``max_sessions`` session slots.
+
+    A slot is a user_instances row in ACTIVE_STATUSES ('requested',
+    'starting' or 'running'), so a request holds its slot from the moment
+    its row is inserted, before any Docker work. admit() takes SQLite's
+    write lock (BEGIN IMMEDIATE) before counting and inserts in the same
+    transaction, so concurrent requests from any process are serialized
+    and can never overshoot the limit. In the same transaction the
+    ResourceScheduler checks that the request's memory and CPU limits fit
+    in what the active sessions leave free on the host.
+
+    Slots are released by moving the row out of ACTIVE_STATUSES: a failed
+    or rejected start ('error'), a stop ('stopped'), expiry
+    ('stopped_expired') or a container exit seen by the events monitor.
+    release() covers requests abandoned before any of those ran.
+    """
+
+    def __init__(self, max_sessions: int = MAX_CONCURRENT_SESSIONS):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._counters = {
+            "admitted": 0,
+            "refused_capacity": 0,
+            "refused_active": 0,
+            "refused_resources": 0,
+            "refused_invalid": 0,
+            "released": 0,
+            "lock_wait_seconds": 0.0,
+            "max_lock_wait_seconds": 0.0,
+        }
+
+    def _count(self, key: str, amount=1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def admit(self, user_id: int, columns: dict) -> int:
+        """
+        Insert a 'requested' user_instances row with ``columns`` if the user
+        has no active instance, a slot is free and its ``memory_limit`` and
+        ``cpu_limit`` fit. Returns the row id or raises AdmissionRefused.
+        """
+        try:
+            memory, cpus = parse_limits(columns["memory_limit"], columns["cpu_limit"])
+        except ValueError:
+            self._count("refused_invalid")
+            raise AdmissionRefused(
+                "Invalid resource limits. Use a memory size such as '16g' and a "
+                "positive number of CPUs such as '2.0'."
+            ) from None
+        names = ", ".join(columns)
+        placeholders = ", ".join("?" for _ in columns)
+        db = get_db()
+        try:
+            started = time.monotonic()
+            db.execute("BEGIN IMMEDIATE")
+            waited = time.monotonic() - started
+            with self._lock:
+                self._counters["lock_wait_seconds"] += waited
+                self._counters["max_lock_wait_seconds"] = max(
+                    self._counters["max_lock_wait_seconds"], waited
+                )
+            try:
+                row = db.execute(
+                    _ADMISSION_QUERY, (user_id, *ACTIVE_STATUSES, *ACTIVE_STATUSES)
+                ).fetchone()
+                self._check(row)
+                reason = resource_scheduler.fits(db, memory, cpus)
+                if reason is not None:
+                    self._count("refused_resources")
+                    raise AdmissionRefused(reason)
+                cursor = db.execute(
+                    f"""INSERT INTO user_instances (user_id, status, {names})
+                        VALUES (?, 'requested', {placeholders})""",
+                    (user_id, *columns.values()),
+                )
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+        finally:
+            db.close()
+        self._count("admitted")
+        status_broadcaster.changed([cursor.lastrowid])
+        return cursor.lastrowid
+
+    def _check(self, row):
+        if row["active_status"] is not None:
+            self._count("refused_active")
+            if row["active_status"] == "running":
+                raise AdmissionRefused(
+                    "You already have a running instance. "
+                    "Please stop the current one before launching a new one.",
+                    category="message",
+                )
+            raise AdmissionRefused(
+                "An instance is currently being set up for you. "
+                "Please check the dashboard again shortly.",
+                category="message",
+            )
+        if row["sessions"] >= self.max_sessions:
+            self._count("refused_capacity")
+            raise AdmissionRefused(
+                f"System capacity reached. Currently {row['sessions']}/{self.max_sessions} sessions are running or starting. "
+                "Please wait for another user to stop their session before requesting a new one."
+            )
+
+    def release(self, instance_id: int):
+        """Give back the slot of a request that will not be started."""
+        db = get_db()
+        try:
+            cursor = db.execute(
+                "UPDATE user_instances SET status = 'error' "
+                "WHERE id = ? AND status = 'requested'",
+                (instance_id,),
+            )
+            db.commit()
+        finally:
+            db.close()
+        if cursor.rowcount:
+            self._count("released")
+            status_broadcaster.changed([instance_id])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["lock_wait_seconds"] = round(stats["lock_wait_seconds"], 4)
+        stats["max_lock_wait_seconds"] = round(stats["max_lock_wait_seconds"], 4)
+        stats["max_sessions"] = self.max_sessions
+        return stats
+
+
+# Global admission controller shared by every launch path
+admission_controller = AdmissionController()
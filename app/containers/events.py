@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from app.core.config import DOCKER_EVENTS_RECONNECT_SECONDS
+from app.db.database import get_db
+from app.containers.runtime import docker_client, DockerUnavailableError
+from app.containers.ports import port_allocator
+from app.containers.reaper import expiry_reaper
+from app.containers.live_status import status_broadcaster
+
+logger = logging.getLogger(__name__)
+
+WATCHED_EVENTS = ("start", "die", "oom", "destroy")
+
+# Exit codes of a container that was asked to stop (SIGTERM) or exited cleanly
+_CLEAN_EXIT_CODES = {"0", "143"}
+_STATUS_COUNTERS = {
+    "stopped": "stopped",
+    "error": "failed",
+    "stopped_expired": "expired",
+}
+
+
+def _finish_running_instances(container_names: list, new_status: str) -> list:
+    """
+    Move live ('starting'/'running') rows for the given containers to ``new_status`` in one
+    transaction. Rows already past ``expires_at`` become 'stopped_expired' instead:
+    their container was stopped by an expiry sweep in another process (the cleanup
+    script), which this process cannot tell from an ordinary exit. Returns the
+    changed rows as dicts with id, port, container_name and the status written.
+    """
+    if not container_names:
+        return []
+    placeholders = ", ".join("?" for _ in container_names)
+    now = datetime.now(timezone.utc)
+    db = get_db()
+    try:
+        rows = [
+            {
+                "id": row["id"],
+                "port": row["port"],
+                "container_name": row["container_name"],
+                "status": (
+                    "stopped_expired"
+                    if row["expires_at"] is not None and row["expires_at"] <= now
+                    else new_status
+                ),
+            }
+            for row in db.execute(
+                f"""SELECT id, port, container_name, expires_at FROM user_instances
+                    WHERE status IN ('starting', 'running')
+                    AND container_name IN ({placeholders})""",
+                container_names,
+            ).fetchall()
+        ]
+        if rows:
+            db.executemany(
+                """UPDATE user_instances
+                   SET status = ?, stopped_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status IN ('starting', 'running')""",
+                [(row["status"], row["id"]) for row in rows],
+            )
+            db.commit()
+            status_broadcaster.changed([row["id"] for row in rows])
+        return rows
+    finally:
+        db.close()
+
+
+def _running_container_names() -> list:
+    db = get_db()
+    try:
+        rows = db.execute(
+            "SELECT container_name FROM user_instances "
+            "WHERE status IN ('starting', 'running')"
+        ).fetchall()
+        return [row["container_name"] for row in rows]
+    finally:
+        db.close()
+
+
+class ContainerEventMonitor:
+    """
+    Keeps user_instances in step with what the Docker daemon reports.
+
+    A daemon thread follows the ``/events`` stream for container die, oom,
+    destroy and start events. A container that exits on its own (the user
+    quits, the process crashes, the kernel OOM-kills it) moves its row out
+    of 'running' straight away, releasing its port and its slot under
+    MAX_CONCURRENT_SESSIONS. Whenever the stream is (re)opened a full
+    reconcile against the running container list catches anything missed
+    while it was down.
+    """
+
+    def __init__(self, reconnect_seconds: float = DOCKER_EVENTS_RECONNECT_SECONDS):
+        self.reconnect_seconds = reconnect_seconds
+        self._loop = None
+        self._thread = None
+        self._conn = None
+        self._stopping = threading.Event()
+        self._oom_killed = set()
+        self._counters = {
+            "events": 0,
+            "stopped": 0,
+            "failed": 0,
+            "expired": 0,
+            "reconciled": 0,
+            "reconnects": 0,
+        }
+        self._last_event_at = None
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Start following events. Must be called from the running event loop."""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._follow, name="docker-events", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        conn = self._conn
+        if conn is not None:
+            conn.shutdown()
+        self._thread = None
+
+    # --- Reconciliation ---
+
+    def reconcile(self) -> int:
+        """
+        Mark live rows whose container is no longer running as stopped.
+        Returns the number of rows changed. Raises DockerUnavailableError if
+        the daemon cannot be listed, so nothing is changed on a blind guess.
+        """
+        # Rows first: a container started after Docker is listed would
+        # otherwise have a live row that the listing does not show
+        live = _running_container_names()
+        running = {
+            name.lstrip("/")
+            for container in docker_client.list_containers()
+            for name in container.get("Names", [])
+        }
+        missing = [name for name in live if name not in running]
+        rows = _finish_running_instances(missing, "stopped")
+        self._release(rows)
+        if rows:
+            self._counters["reconciled"] += len(rows)
+            logger.warning(
+                f"Reconciled {len(rows)} instance(s) whose container is no longer "
+                f"running: {', '.join(row['container_name'] for row in rows)}"
+            )
+        return len(rows)
+
+    def _release(self, rows):
+        for row in rows:
+            port_allocator.release(row["port"])
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(expiry_reaper.cancel, row["id"])
+            else:
+                expiry_reaper.cancel(row["id"])
+
+    # --- Event stream ---
+
+    def _follow(self):
+        while not self._stopping.is_set():
+            since = int(time.time())
+            try:
+                conn, events = docker_client.open_event_stream(
+                    filters={"type": ["container"], "event": list(WATCHED_EVENTS)},
+                    since=since,
+                )
+                self._conn = conn
+                # Anything that changed before the subscription is caught here
+                self.reconcile()
+                try:
+                    for event in events:
+                        if self._stopping.is_set():
+                            break
+                        self._handle(event)
+                finally:
+                    self._conn = None
+                    conn.close()
+            except DockerUnavailableError as e:
+                logger.warning(f"Docker events stream unavailable: {e}")
+            except Exception:
+                if self._stopping.is_set():
+                    break
+                logger.error("Docker events stream failed", exc_info=True)
+
+            if self._stopping.wait(self.reconnect_seconds):
+                break
+            self._counters["reconnects"] += 1
+
+    def _handle(self, event: dict):
+        action = event.get("Action") or event.get("status")
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        name = attributes.get("name")
+        if not name:
+            return
+        self._counters["events"] += 1
+        self._last_event_at = time.time()
+
+        if action == "oom":
+            # The die event that follows carries only the exit code
+            self._oom_killed.add(name)
+            return
+        if action == "start":
+            self._oom_killed.discard(name)
+            logger.debug(f"Container {name} started")
+            return
+
+        if docker_client.stop_requested(name):
+            # Stopped by the portal itself (user stop, expiry); the caller
+            # records the final status
+            self._oom_killed.discard(name)
+            return
+
+        if action == "die":
+            exit_code = attributes.get("exitCode", "")
+            oom = name in self._oom_killed
+            self._oom_killed.discard(name)
+            new_status = (
+                "stopped" if exit_code in _CLEAN_EXIT_CODES and not oom else "error"
+            )
+        else:  # destroy without a die we saw
+            self._oom_killed.discard(name)
+            new_status = "stopped"
+
+        rows = _finish_running_instances([name], new_status)
+        if not rows:
+            return
+        self._release(rows)
+        final_status = rows[0]["status"]
+        self._counters[_STATUS_COUNTERS[final_status]] += 1
+        logger.info(
+            f"Container {name} {action} (exit {attributes.get('exitCode', '-')}); "
+            f"instance {rows[0]['id']} marked '{final_status}'."
+        )
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "connected": self._conn is not None,
+            "last_event_at": self._last_event_at,
+        }
+
+
+# Global event monitor, started with the application
+container_event_monitor = ContainerEventMonitor()
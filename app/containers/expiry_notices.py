@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import (
+    EXPIRY_WARNING_MINUTES,
+    EXPIRY_WARNING_INTERVAL_SECONDS,
+    EXPIRY_EXTEND_HOURS,
+    EXPIRY_MAX_EXTENSIONS,
+    PORTAL_BASE_URL,
+)
+from app.db.database import get_db
+from app.auth.security import create_extend_token
+from app.containers.instance_types import INSTANCE_TYPES
+from app.containers.live_status import status_broadcaster
+from app.containers.reaper import expiry_reaper
+from app.mail.notifications import notify_many
+
+logger = logging.getLogger(__name__)
+
+
+def _claim_expiring(window_seconds: float) -> list:
+    """
+    Running instances that stop within ``window_seconds`` and whose owner
+    was not warned yet, marked as warned in the same transaction.
+    """
+    now = datetime.now(timezone.utc)
+    db = get_db()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        # One range scan of idx_user_instances_status_expires
+        rows = db.execute(
+            """SELECT ui.id, ui.container_name, ui.instance_type, ui.expires_at,
+                      ui.extension_count, u.email AS owner_email
+               FROM user_instances ui JOIN users u ON u.id = ui.user_id
+               WHERE ui.status = 'running' AND ui.expires_at > ? AND ui.expires_at <= ?
+               AND ui.expiry_warned_at IS NULL""",
+            (now, now + timedelta(seconds=window_seconds)),
+        ).fetchall()
+        if rows:
+            db.executemany(
+                "UPDATE user_instances SET expiry_warned_at = ? WHERE id = ?",
+                [(now, row["id"]) for row in rows],
+            )
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return rows
+
+
+def _unclaim(instance_ids: list):
+    """Warnings that could not be queued; the next run tries again."""
+    db = get_db()
+    try:
+        db.executemany(
+            "UPDATE user_instances SET expiry_warned_at = NULL WHERE id = ?",
+            [(instance_id,) for instance_id in instance_ids],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_extendable(instance_id: int, deadline: datetime):
+    """The running instance an extend link for ``deadline`` points at, or None."""
+    db = get_db()
+    try:
+        return db.execute(
+            """SELECT id, container_name, instance_type, expires_at, extension_count
+               FROM user_instances WHERE id = ? AND status = 'running' AND expires_at = ?""",
+            (instance_id, deadline),
+        ).fetchone()
+    finally:
+        db.close()
+
+
+def _label(row) -> str:
+    spec = INSTANCE_TYPES.get(row["instance_type"])
+    label = spec.label if spec is not None else row["instance_type"]
+    return f"{label} ({row['container_name']})"
+
+
+def _extend(instance_id: int, deadline: datetime, hours: int, max_extensions: int):
+    """
+    Push the deadline of a running instance back by ``hours``, if it is
+    still ``deadline`` and was extended fewer than ``max_extensions``
+    times. Returns (container_name, expires_at) or None.
+    """
+    db = get_db()
+    try:
+        cursor = db.execute(
+            """UPDATE user_instances
+               SET expires_at = datetime(expires_at, ?), expiry_warned_at = NULL,
+                   extension_count = extension_count + 1
+               WHERE id = ? AND status = 'running' AND expires_at = ?
+               AND extension_count < ?""",
+            (f"+{int(hours)} hours", instance_id, deadline, max_extensions),
+        )
+        db.commit()
+        if cursor.rowcount != 1:
+            return None
+        row = db.execute(
+            "SELECT container_name, expires_at FROM user_instances WHERE id = ?",
+            (instance_id,),
+        ).fetchone()
+    finally:
+        db.close()
+    status_broadcaster.changed([instance_id])
+    return row["container_name"], row["expires_at"]
+
+
+def _remaining(expires_at: datetime, now: datetime) -> str:
+    minutes = max(1, round((expires_at - now).total_seconds() / 60))
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if minutes:
+        parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
+    return "in " + " ".join(parts)
+
+
+class ExpiryNotifier:
+    """
+    Warns owners by email before their sessions are stopped.
+
+    Every ``interval_seconds`` one range query finds the running instances
+    that stop within ``window_seconds`` and records the warning on them
+    (``expiry_warned_at``), so each deadline is warned about once even
+    with several portal processes. A user with several expiring sessions
+    gets a single email listing them, and the emails of a run are queued
+    in the outbox together. Each session in the email has a signed link
+    to a page that extends it by ``extend_hours`` (the link itself changes
+    nothing, as mail scanners fetch links), at most ``max_extensions``
+    times per session. Extending clears the warning, so the new deadline
+    is warned about again.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = EXPIRY_WARNING_MINUTES * 60,
+        interval_seconds: float = EXPIRY_WARNING_INTERVAL_SECONDS,
+        extend_hours: int = EXPIRY_EXTEND_HOURS,
+        max_extensions: int = EXPIRY_MAX_EXTENSIONS,
+    ):
+        self.window_seconds = window_seconds
+        self.interval_seconds = interval_seconds
+        self.extend_hours = extend_hours
+        self.max_extensions = max(0, max_extensions)
+        self._task = None
+        self._lock = threading.Lock()
+        self._counters = {"runs": 0, "warned_sessions": 0, "emails": 0, "extended": 0}
+
+    def start(self):
+        """Must be called from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception:
+                logger.error("Expiry warning run failed", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def run_once(self) -> int:
+        """Queue the warnings that are due; returns the number of emails."""
+        rows = _claim_expiring(self.window_seconds)
+        with self._lock:
+            self._counters["runs"] += 1
+        if not rows:
+            return 0
+        now = datetime.now(timezone.utc)
+        by_owner = defaultdict(list)
+        for row in rows:
+            by_owner[row["owner_email"]].append(row)
+        notices = []
+        for email, owned in by_owner.items():
+            owned.sort(key=lambda row: row["expires_at"])
+            sessions = [self._session(row, now) for row in owned]
+            # Pointless once the first of them has stopped
+            notices.append(
+                (
+                    email,
+                    owned[0]["expires_at"],
+                    {"sessions": sessions, "extend_hours": self.extend_hours},
+                )
+            )
+        try:
+            notify_many("expiry_warning", notices)
+        except Exception:
+            _unclaim([row["id"] for row in rows])
+            raise
+        with self._lock:
+            self._counters["warned_sessions"] += len(rows)
+            self._counters["emails"] += len(notices)
+        logger.info(
+            f"Queued expiry warnings for {len(rows)} session(s) to {len(notices)} user(s)."
+        )
+        return len(notices)
+
+    def _session(self, row, now: datetime) -> dict:
+        extend_url = None
+        # No link once the session has used up its extensions
+        if row["extension_count"] < self.max_extensions:
+            token = create_extend_token(row["id"], row["expires_at"])
+            extend_url = f"{PORTAL_BASE_URL}/extend_instance/{row['id']}?token={token}"
+        return {
+            "label": _label(row),
+            "expires_at": row["expires_at"].strftime("%Y-%m-%d %H:%M UTC"),
+            "expires_in": _remaining(row["expires_at"], now),
+            "extend_url": extend_url,
+        }
+
+    async def extension_offer(self, instance_id: int, deadline: datetime):
+        """
+        What the extend page shows for a session warned about for
+        ``deadline``, or None if the link no longer applies.
+        """
+        row = await asyncio.to_thread(_load_extendable, instance_id, deadline)
+        if row is None:
+            return None
+        return {
+            "label": _label(row),
+            "expires_at": row["expires_at"],
+            "new_expires_at": row["expires_at"] + timedelta(hours=self.extend_hours),
+            "extensions_left": max(0, self.max_extensions - row["extension_count"]),
+        }
+
+    async def extend(self, instance_id: int, deadline: datetime):
+        """
+        Extend a session warned about for ``deadline``; returns the new
+        expires_at, or None if it already moved (extended, stopped or
+        deleted) or reached ``max_extensions``.
+        """
+        extended = await asyncio.to_thread(
+            _extend, instance_id, deadline, self.extend_hours, self.max_extensions
+        )
+        if extended is None:
+            return None
+        container_name, expires_at = extended
+        expiry_reaper.schedule(instance_id, container_name, expires_at)
+        with self._lock:
+            self._counters["extended"] += 1
+        return expires_at
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "window_seconds": self.window_seconds,
+                "extend_hours": self.extend_hours,
+                "max_extensions": self.max_extensions,
+            }
+
+
+# Global notifier, started with the application
+expiry_notifier = ExpiryNotifier()
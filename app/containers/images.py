@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from app.core.config import IMAGE_REFRESH_HOURS
+from app.db.database import get_db
+from app.containers.instance_types import INSTANCE_TYPES
+from app.containers.runtime import (
+    docker_client,
+    split_image_reference,
+    ContainerNotFoundError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _record_image(image: str, image_id: str, repo_digest: str):
+    """Remember that ``image`` resolved to ``image_id`` on this host."""
+    db = get_db()
+    try:
+        db.execute(
+            """INSERT INTO image_cache (image, image_id, repo_digest)
+               VALUES (?, ?, ?)
+               ON CONFLICT (image, image_id) DO UPDATE SET
+                   repo_digest = excluded.repo_digest,
+                   last_seen_at = CURRENT_TIMESTAMP""",
+            (image, image_id, repo_digest),
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_last_pins(images: list) -> dict:
+    """The most recently recorded image_id/repo_digest per configured image."""
+    if not images:
+        return {}
+    placeholders = ", ".join("?" for _ in images)
+    db = get_db()
+    try:
+        rows = db.execute(
+            f"""SELECT image, image_id, repo_digest, last_seen_at FROM image_cache
+                WHERE image IN ({placeholders})
+                ORDER BY last_seen_at""",
+            images,
+        ).fetchall()
+    finally:
+        db.close()
+    # Later rows win
+    return {row["image"]: row for row in rows}
+
+
+def _pin_reference(image: str, details: dict) -> str:
+    """
+    Digest reference for an inspected image: 'repo@sha256:...' when the
+    image came from a registry, otherwise its local image ID.
+    """
+    name, _ = split_image_reference(image)
+    repo_digests = details.get("RepoDigests") or []
+    for digest in repo_digests:
+        if digest.split("@", 1)[0] == name:
+            return digest
+    if repo_digests:
+        return repo_digests[0]
+    return details["Id"]
+
+
+class ImageManager:
+    """
+    Keeps the configured IDE images pulled and pins them by digest.
+
+    Images are pulled by a background task at startup and then every
+    ``refresh_hours``, never in a request. After each pull the image is
+    resolved to a digest, recorded in ``image_cache`` and used for every
+    container started until the next successful refresh, so a tag moving on
+    the registry does not change what users get mid-day. At startup the last
+    recorded digest is reused straight away if it is still present locally.
+
+    ``pinned_image`` returns None for a type whose image is not available
+    yet; callers refuse the request instead of pulling implicitly.
+    """
+
+    def __init__(self, images: dict, refresh_hours: float = IMAGE_REFRESH_HOURS):
+        self.images = dict(images)
+        self.refresh_hours = refresh_hours
+        self._pinned = {}
+        self._status = {
+            t: {"image": image, "pinned": None, "pulled_at": None, "error": None}
+            for t, image in self.images.items()
+        }
+        self._task = None
+        self._loop = None
+        self._listeners = []
+        self._counters = {"pulls": 0, "pull_failures": 0, "updated": 0}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # --- Lookup ---
+
+    def pinned_image(self, instance_type: str):
+        """Digest reference to start ``instance_type`` from, or None if not cached."""
+        return self._pinned.get(instance_type)
+
+    def add_listener(self, callback):
+        """Call ``callback()`` on the event loop whenever a new digest is pinned."""
+        self._listeners.append(callback)
+
+    # --- Refreshing ---
+
+    async def _run(self):
+        try:
+            await asyncio.to_thread(self._restore_pins)
+        except Exception:
+            logger.error("Failed to restore cached image pins", exc_info=True)
+        while True:
+            await self.refresh()
+            if self.refresh_hours <= 0:
+                return
+            await asyncio.sleep(self.refresh_hours * 3600)
+
+    def _restore_pins(self):
+        """Reuse the last recorded digests that are still present locally."""
+        last = _load_last_pins(list(set(self.images.values())))
+        for instance_type, image in self.images.items():
+            row = last.get(image)
+            if row is None:
+                continue
+            try:
+                docker_client.inspect_image(row["image_id"])
+            except ContainerNotFoundError:
+                continue
+            self._pin(instance_type, row["repo_digest"] or row["image_id"])
+            logger.info(
+                f"Using cached {instance_type} image {self._pinned[instance_type]}"
+            )
+
+    async def refresh(self):
+        """Pull every configured image once; images are pulled one at a time."""
+        for instance_type in self.images:
+            try:
+                await asyncio.to_thread(self._refresh_one, instance_type)
+            except Exception as e:
+                self._counters["pull_failures"] += 1
+                self._status[instance_type]["error"] = str(e)
+                logger.error(
+                    f"Failed to pull {self.images[instance_type]}: {e}; "
+                    f"keeping {self._pinned.get(instance_type) or 'no image'}"
+                )
+
+    def _refresh_one(self, instance_type: str):
+        image = self.images[instance_type]
+        started = time.monotonic()
+        try:
+            docker_client.pull_image(image)
+        except Exception as e:
+            if instance_type in self._pinned or not self._pin_local(instance_type, e):
+                raise
+            return
+        self._counters["pulls"] += 1
+        details = docker_client.inspect_image(image)
+        reference = _pin_reference(image, details)
+        _record_image(image, details["Id"], reference if "@" in reference else None)
+
+        status = self._status[instance_type]
+        status["pulled_at"] = datetime.now(timezone.utc).isoformat()
+        status["error"] = None
+        if self._pinned.get(instance_type) != reference:
+            if instance_type in self._pinned:
+                self._counters["updated"] += 1
+            self._pin(instance_type, reference)
+            logger.info(
+                f"Pinned {instance_type} image {image} to {reference} "
+                f"(pulled in {time.monotonic() - started:.1f}s)"
+            )
+
+    def _pin_local(self, instance_type: str, error: Exception) -> bool:
+        """
+        Pin the local copy of an image that could not be pulled and has no
+        earlier pin (offline host, tag only built locally). False if there
+        is no local copy either.
+        """
+        image = self.images[instance_type]
+        try:
+            details = docker_client.inspect_image(image)
+        except ContainerNotFoundError:
+            return False
+        reference = _pin_reference(image, details)
+        _record_image(image, details["Id"], reference if "@" in reference else None)
+        self._counters["pull_failures"] += 1
+        self._status[instance_type]["error"] = str(error)
+        self._pin(instance_type, reference)
+        logger.warning(
+            f"Failed to pull {image}: {error}; using the local image {reference}"
+        )
+        return True
+
+    def _pin(self, instance_type: str, reference: str):
+        self._pinned[instance_type] = reference
+        self._status[instance_type]["pinned"] = reference
+        if self._loop is not None:
+            for callback in self._listeners:
+                self._loop.call_soon_threadsafe(callback)
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "refresh_hours": self.refresh_hours,
+            "images": self._status,
+        }
+
+
+# Global image manager, started with the application
+image_manager = ImageManager(
+    {name: spec.image for name, spec in INSTANCE_TYPES.items()}
+)
@@ -0,0 +1,120 @@
+import secrets
+
+from app.core.config import (
+    RSTUDIO_DOCKER_IMAGE,
+    RSTUDIO_MIN_PORT,
+    RSTUDIO_MAX_PORT,
+    RSTUDIO_DEFAULT_MEMORY,
+    RSTUDIO_DEFAULT_CPUS,
+    RSTUDIO_USER_STORAGE_LIMIT,
+    JUPYTER_DOCKER_IMAGE,
+    JUPYTER_MIN_PORT,
+    JUPYTER_MAX_PORT,
+    JUPYTER_DEFAULT_MEMORY,
+    JUPYTER_DEFAULT_CPUS,
+)
+
+
+class InstanceType:
+    """
+    Everything that differs between the IDEs users can launch.
+
+    The request route, provisioning, the warm pool, port allocation and
+    the image manager all read these descriptors, so supporting another
+    IDE means adding an entry to INSTANCE_TYPES (and its settings in
+    config.py), not another route.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        label: str,
+        image: str,
+        internal_port: int,
+        mount_path: str,
+        port_range: tuple,
+        default_memory: str,
+        default_cpus: str,
+        default_storage: str,
+        secret_env: str,
+        secret_bytes: int = 12,
+        environment: dict = None,
+        data_uid: int = 1000,
+    ):
+        self.name = name
+        self.label = label
+        self.image = image
+        self.internal_port = internal_port
+        self.mount_path = mount_path
+        self.port_range = port_range
+        self.default_memory = default_memory
+        self.default_cpus = default_cpus
+        self.default_storage = default_storage
+        self.secret_env = secret_env
+        self.secret_bytes = secret_bytes
+        self.environment = dict(environment or {})
+        # Owner of the mounted workspace, i.e. the user the image runs as
+        self.data_uid = data_uid
+
+    def new_secret(self) -> str:
+        """A fresh password/token for one instance."""
+        return secrets.token_urlsafe(self.secret_bytes)
+
+    def container_name(self, username: str) -> str:
+        return f"{self.name}-{username}-{secrets.token_hex(4)}"
+
+    def run_options(
+        self, secret: str, data_dir: str, host_port: int, memory: str, cpus: str
+    ) -> dict:
+        """
+        Keyword arguments for DockerClient.run_container for one instance.
+
+        ``secret`` is the password or token and ``data_dir`` the host
+        directory mounted as the user's workspace.
+        """
+        return {
+            "environment": {self.secret_env: secret, **self.environment},
+            "volumes": {data_dir: self.mount_path},
+            "ports": {self.internal_port: host_port},
+            "memory": memory,
+            "cpus": cpus,
+        }
+
+
+INSTANCE_TYPES = {
+    # docker run -d --rm --memory --cpus -e PASSWORD -v <data>:/home/rstudio -p <port>:8787
+    "rstudio": InstanceType(
+        name="rstudio",
+        label="RStudio",
+        image=RSTUDIO_DOCKER_IMAGE,
+        internal_port=8787,
+        mount_path="/home/rstudio",
+        port_range=(RSTUDIO_MIN_PORT, RSTUDIO_MAX_PORT),
+        default_memory=RSTUDIO_DEFAULT_MEMORY,
+        default_cpus=RSTUDIO_DEFAULT_CPUS,
+        default_storage=RSTUDIO_USER_STORAGE_LIMIT,
+        secret_env="PASSWORD",
+    ),
+    "jupyterlab": InstanceType(
+        name="jupyterlab",
+        label="JupyterLab",
+        image=JUPYTER_DOCKER_IMAGE,
+        internal_port=8888,
+        mount_path="/home/jovyan/work",
+        port_range=(JUPYTER_MIN_PORT, JUPYTER_MAX_PORT),
+        default_memory=JUPYTER_DEFAULT_MEMORY,
+        default_cpus=JUPYTER_DEFAULT_CPUS,
+        default_storage=RSTUDIO_USER_STORAGE_LIMIT,
+        secret_env="JUPYTER_TOKEN",
+        secret_bytes=24,
+        environment={
+            "JUPYTER_ENABLE_LAB": "yes",
+            # The jupyter/docker-stacks images run as 'jovyan' (UID 1000);
+            # CHOWN_HOME/CHOWN_EXTRA_OPTS let the image fix permissions on the
+            # mounted work directory.
+            "CHOWN_HOME": "yes",
+            "CHOWN_EXTRA_OPTS": "-R",
+            # "GRANT_SUDO": "yes",  # Uncomment if sudo access is needed inside container
+        },
+    ),
+}
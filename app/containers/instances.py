@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from app.core.config import USER_DATA_BASE_DIR
+from app.db.database import get_db
+from app.containers.instance_types import InstanceType
+from app.containers.ports import port_allocator
+from app.containers.images import image_manager
+from app.containers.warm_pool import warm_pool
+from app.containers.reaper import expiry_reaper
+from app.containers.provisioning import ProvisioningJob, provisioning_queue
+from app.containers.live_status import status_broadcaster
+from app.containers.admission import admission_controller, AdmissionRefused
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceRequestError(Exception):
+    """
+    A launch request that was turned down. ``category`` is the dashboard
+    banner it is shown in ('message' for informational, 'error' otherwise).
+    """
+
+    def __init__(self, message: str, category: str = "error"):
+        super().__init__(message)
+        self.category = category
+
+
+def ensure_user_data_directory(user_dir: Path, uid: int = 1000) -> bool:
+    """
+    Ensure a user data directory exists for IDE containers.
+
+    Creates the directory if it doesn't exist. Attempts to set ownership to
+    ``uid`` (the user the images run as) but continues if this fails.
+
+    Returns:
+        True if directory exists and is usable, False otherwise
+    """
+    try:
+        # Ensure parent directory exists first
+        user_dir.parent.mkdir(parents=True, exist_ok=True)
+        # Create user-specific directory if it doesn't exist
+        user_dir.mkdir(parents=True, exist_ok=True)
+
+        # Try to set ownership to the container user - only if we can
+        try:
+            os.chown(user_dir, uid, uid)
+            os.chmod(user_dir, 0o755)
+            logger.info(f"Set ownership of '{user_dir}' to {uid}:{uid}")
+        except (PermissionError, OSError) as chown_err:
+            # Can't chown - try chmod to 777 as fallback
+            try:
+                os.chmod(user_dir, 0o777)
+                logger.warning(
+                    f"Could not chown '{user_dir}': {chown_err}. Set to 777 instead."
+                )
+            except (PermissionError, OSError):
+                # Can't even chmod - directory might still work if permissions are already OK
+                logger.warning(
+                    f"Could not change permissions on '{user_dir}'. Continuing anyway."
+                )
+
+        logger.info(f"User data directory '{user_dir}' is ready")
+        return True
+
+    except PermissionError as perm_err:
+        logger.error(
+            f"Permission denied for user data directory '{user_dir}': {perm_err}"
+        )
+        return False
+    except OSError as os_err:
+        logger.error(f"OS error with user data directory '{user_dir}': {os_err}")
+        return False
+    except Exception as e:
+        logger.error(
+            f"Unexpected error with user data directory '{user_dir}': {e}",
+            exc_info=True,
+        )
+        return False
+
+
+def _describe_base_dir() -> str:
+    """Permissions of USER_DATA_BASE_DIR, for logging a failed mkdir."""
+    try:
+        if USER_DATA_BASE_DIR.exists():
+            return oct(USER_DATA_BASE_DIR.stat().st_mode)
+        return "does not exist"
+    except (OSError, PermissionError):
+        return "cannot access (permission denied)"
+
+
+def _bind_warm(instance_id: int, warm, session_days: int):
+    """Point a 'requested' row at a claimed warm container; returns expires_at."""
+    db = get_db()
+    try:
+        db.execute(
+            """UPDATE user_instances
+               SET container_name = ?, container_id = ?, port = ?, password = ?,
+                   status = 'running', expires_at = datetime('now', ?),
+                   ready_at = CURRENT_TIMESTAMP, ready_seconds = ?
+               WHERE id = ?""",
+            (
+                warm.name,
+                warm.container_id,
+                warm.host_port,
+                warm.secret,
+                f"+{session_days} days",
+                round(warm.claim_seconds, 3),
+                instance_id,
+            ),
+        )
+        db.commit()
+        status_broadcaster.changed([instance_id])
+        return db.execute(
+            "SELECT expires_at FROM user_instances WHERE id = ?", (instance_id,)
+        ).fetchone()["expires_at"]
+    finally:
+        db.close()
+
+
+class InstanceService:
+    """
+    Launches an instance of any registered InstanceType for a user.
+
+    The container image must already be pinned by the image manager. A
+    session slot is reserved through the AdmissionController before any
+    Docker work. The request is then served from the warm pool when
+    possible, otherwise handed to the provisioning queue.
+    """
+
+    def __init__(self):
+        self._counters = {
+            "requested": 0,
+            "warm": 0,
+            "queued": 0,
+            "refused": 0,
+        }
+
+    async def request(
+        self,
+        user: dict,
+        spec: InstanceType,
+        memory: str,
+        cpus: str,
+        storage: str,
+        session_days: int,
+    ) -> str:
+        """Start a launch and return the message for the dashboard."""
+        self._counters["requested"] += 1
+        try:
+            return await self._request(user, spec, memory, cpus, storage, session_days)
+        except InstanceRequestError:
+            self._counters["refused"] += 1
+            raise
+
+    async def _request(self, user, spec, memory, cpus, storage, session_days) -> str:
+        email = user["email"]
+        # The part before '@' names the container and the data directory
+        username = email.split("@")[0] if "@" in email else email
+        container_name = spec.container_name(username)
+        user_dir = USER_DATA_BASE_DIR / username
+
+        if not ensure_user_data_directory(user_dir, spec.data_uid):
+            logger.error(
+                f"Failed to ensure user data directory '{user_dir}'. "
+                f"Parent directory '{USER_DATA_BASE_DIR}' permissions: {_describe_base_dir()}"
+            )
+            raise InstanceRequestError(
+                "Permission error: Unable to create user data directory. Please contact an administrator."
+            )
+
+        # Only start from an image that is already on this host
+        image = image_manager.pinned_image(spec.name)
+        if image is None:
+            raise InstanceRequestError(
+                f"The {spec.label} image is still being downloaded to this server. Please try again in a few minutes."
+            )
+
+        # Reserve a host port; released again if the instance fails or stops
+        host_port = port_allocator.reserve(spec.name)
+        if host_port is None:
+            raise InstanceRequestError(
+                f"No available ports for {spec.label}. Please try again later or contact an administrator."
+            )
+
+        secret = spec.new_secret()
+        try:
+            instance_id = await asyncio.to_thread(
+                admission_controller.admit,
+                user["id"],
+                {
+                    "container_name": container_name,
+                    "port": host_port,
+                    "password": secret,
+                    "instance_type": spec.name,
+                    "memory_limit": memory,
+                    "cpu_limit": cpus,
+                    "storage_limit": storage,
+                    "session_days": session_days,
+                },
+            )
+        except AdmissionRefused as e:
+            port_allocator.release(host_port)
+            raise InstanceRequestError(str(e), e.category) from None
+        except BaseException:
+            port_allocator.release(host_port)
+            raise
+
+        try:
+            return await self._start(
+                instance_id,
+                spec,
+                container_name,
+                user_dir,
+                image,
+                secret,
+                host_port,
+                memory,
+                cpus,
+                session_days,
+            )
+        except BaseException:
+            # Nothing will start this row; give its slot and port back
+            admission_controller.release(instance_id)
+            port_allocator.release(host_port)
+            raise
+
+    async def _start(
+        self,
+        instance_id,
+        spec,
+        container_name,
+        user_dir,
+        image,
+        secret,
+        host_port,
+        memory,
+        cpus,
+        session_days,
+    ) -> str:
+        # Serve the request from an idle pre-started container when possible
+        warm = await warm_pool.claim(spec.name, container_name, user_dir, memory, cpus)
+        if warm is not None:
+            try:
+                expires_at = await asyncio.to_thread(
+                    _bind_warm, instance_id, warm, session_days
+                )
+            except Exception:
+                await asyncio.to_thread(warm_pool.release_claimed, warm)
+                raise
+            # The row now owns the warm container's port
+            port_allocator.release(host_port)
+            expiry_reaper.schedule(instance_id, warm.name, expires_at)
+            self._counters["warm"] += 1
+            logger.info(
+                f"Bound warm {spec.name} container {warm.name} to instance {instance_id}"
+            )
+            return f"{spec.label} instance '{warm.name}' is ready."
+
+        # Hand the docker work to the provisioning workers so the event loop
+        # is not blocked while the container starts
+        job = ProvisioningJob(
+            instance_id,
+            container_name,
+            image,
+            spec.run_options(secret, str(user_dir.resolve()), host_port, memory, cpus),
+            host_port,
+            session_days,
+            spec.name,
+        )
+        if not provisioning_queue.submit(job):
+            logger.error(
+                f"Provisioning queue full; rejected {spec.label} instance {instance_id}"
+            )
+            raise InstanceRequestError(
+                f"Too many {spec.label} instances are being prepared right now. Please try again shortly."
+            )
+        self._counters["queued"] += 1
+        return f"{spec.label} instance '{container_name}' is being prepared."
+
+    def stats(self) -> dict:
+        return dict(self._counters)
+
+
+# Global instance service used by the request routes
+instance_service = InstanceService()
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import threading
+
+from app.core.config import EVENT_STREAM_QUEUE_SIZE, MAX_CONCURRENT_SESSIONS
+from app.db.database import get_db
+from app.containers.resources import resource_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """One open event stream. ``overflowed`` is set if events were dropped."""
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+
+def _load_instance_states(instance_ids: list) -> list:
+    placeholders = ", ".join("?" for _ in instance_ids)
+    db = get_db()
+    try:
+        return db.execute(
+            f"""SELECT id, user_id, status, instance_type, port, ready_seconds
+                FROM user_instances WHERE id IN ({placeholders})""",
+            instance_ids,
+        ).fetchall()
+    finally:
+        db.close()
+
+
+def capacity_snapshot() -> dict:
+    """
+    Session slots in use ('requested', 'starting' or 'running') and the
+    memory/CPU headroom the ResourceScheduler sees, as shown on dashboards.
+    """
+    db = get_db()
+    try:
+        usage = resource_scheduler.committed(db)
+    finally:
+        db.close()
+    return {
+        "current_sessions": usage["sessions"],
+        "max_sessions": MAX_CONCURRENT_SESSIONS,
+        **resource_scheduler.headroom(usage),
+    }
+
+
+class StatusBroadcaster:
+    """
+    Pushes instance state transitions and capacity changes to open
+    dashboards over Server-Sent Events.
+
+    Every code path that writes ``user_instances`` calls changed() with the
+    affected ids after committing (from the event loop or a worker thread;
+    on the loop the queries are handed to the default executor).
+    Only while someone is listening does it read the new state of those
+    rows, once, and hand an ``instance`` event to each of the owner's
+    streams plus a ``capacity`` event to every stream when the session
+    count or headroom moved. An idle
+    dashboard costs one open connection and no queries.
+    """
+
+    def __init__(self, queue_size: int = EVENT_STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._loop = None
+        self._subscribers = {}
+        # Written from worker threads, read by the event loop
+        self._lock = threading.Lock()
+        # Publishes one change at a time, so capacity events stay in order
+        self._publish_lock = threading.Lock()
+        self._capacity = None
+        self.closing = False
+        self._counters = {"published": 0, "dropped": 0, "connections": 0}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Must be called from the running event loop."""
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        """End every open stream so the server can shut down."""
+        self.closing = True
+        with self._lock:
+            subscribers = [s for subs in self._subscribers.values() for s in subs]
+        for subscriber in subscribers:
+            self._put(subscriber, None)
+
+    # --- Subscriptions ---
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        self._counters["connections"] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.user_id]
+
+    def current_capacity(self) -> dict:
+        if self._capacity is None:
+            self._capacity = capacity_snapshot()
+        return self._capacity
+
+    # --- Publishing ---
+
+    def changed(self, instance_ids: list = ()):
+        """Record that the given instances were written (and committed)."""
+        with self._lock:
+            listening = bool(self._subscribers)
+        if not listening or self._loop is None:
+            # Recomputed when the next stream connects
+            self._capacity = None
+            return
+        if self._on_loop():
+            # The queries below must not block the event loop
+            self._loop.run_in_executor(None, self._publish, list(instance_ids))
+        else:
+            self._publish(list(instance_ids))
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _publish(self, instance_ids: list):
+        """Read the current state of ``instance_ids`` and hand it to the loop."""
+        with self._publish_lock:
+            try:
+                rows = _load_instance_states(instance_ids) if instance_ids else []
+                capacity = capacity_snapshot()
+            except Exception:
+                logger.error(
+                    "Failed to load instance state for live updates", exc_info=True
+                )
+                return
+            events = [
+                (
+                    row["user_id"],
+                    "instance",
+                    {
+                        "id": row["id"],
+                        "status": row["status"],
+                        "instance_type": row["instance_type"],
+                        "port": row["port"],
+                        "ready_seconds": row["ready_seconds"],
+                    },
+                )
+                for row in rows
+            ]
+            if capacity != self._capacity:
+                self._capacity = capacity
+                events.append((None, "capacity", capacity))
+            if events:
+                self._loop.call_soon_threadsafe(self._dispatch, events)
+
+    def removed(self, user_id: int, instance_id: int):
+        """Record that an instance row was deleted."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(
+                self._dispatch,
+                [(user_id, "instance", {"id": instance_id, "status": "deleted"})],
+            )
+
+    def capacity_event(self) -> str:
+        return format_event("capacity", self.current_capacity())
+
+    def _dispatch(self, events: list):
+        with self._lock:
+            subscribers = {
+                user_id: list(subs) for user_id, subs in self._subscribers.items()
+            }
+        for user_id, name, payload in events:
+            if user_id is None:
+                targets = [s for subs in subscribers.values() for s in subs]
+            else:
+                targets = subscribers.get(user_id, [])
+            message = format_event(name, payload)
+            for subscriber in targets:
+                self._put(subscriber, message)
+
+    def _put(self, subscriber: Subscriber, message):
+        try:
+            subscriber.queue.put_nowait(message)
+            self._counters["published"] += 1
+        except asyncio.QueueFull:
+            # The client is not reading; it re-fetches everything on resync
+            subscriber.overflowed = True
+            self._counters["dropped"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            open_streams = sum(len(subs) for subs in self._subscribers.values())
+            users = len(self._subscribers)
+        return {
+            **self._counters,
+            "open_streams": open_streams,
+            "users": users,
+            "capacity": self._capacity["current_sessions"] if self._capacity else None,
+        }
+
+
+def format_event(name: str, payload: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+
+# Global broadcaster for the dashboards' event streams
+status_broadcaster = StatusBroadcaster()
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from app.db.database import get_db
+from app.containers.instance_types import INSTANCE_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Statuses whose rows own their host port
+ACTIVE_STATUSES = ("requested", "starting", "running")
+
+# Reservations younger than this survive a resync even if their row is not
+# committed yet
+_RESERVATION_GRACE_SECONDS = 60
+
+
+def _load_used_ports() -> set:
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    db = get_db()
+    try:
+        rows = db.execute(
+            f"SELECT port FROM user_instances WHERE status IN ({placeholders})",
+            ACTIVE_STATUSES,
+        ).fetchall()
+        return {row["port"] for row in rows}
+    finally:
+        db.close()
+
+
+class PortAllocator:
+    """
+    Constant-time host port allocation per instance type.
+
+    Each type has a FIFO free-list over its configured range. Reserving pops
+    the next free port and releasing appends it to the back, so a port that
+    was just released is the last to be handed out again. A single set of
+    ports in use is shared across types so overlapping ranges never collide.
+    """
+
+    def __init__(self, ranges: dict, loader=_load_used_ports):
+        self._ranges = ranges
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._in_use = set()
+        self._reserved_at = {}
+        self._held = set()
+        self._free = {}
+        self._free_sets = {}
+        self._reset(set())
+
+    def _reset(self, used: set):
+        self._in_use = set(used)
+        for instance_type, (low, high) in self._ranges.items():
+            ports = [p for p in range(low, high + 1) if p not in self._in_use]
+            self._free[instance_type] = deque(ports)
+            self._free_sets[instance_type] = set(ports)
+
+    def rebuild(self):
+        """Resynchronise with the ports held by active rows in the database."""
+        used = self._loader()
+        with self._lock:
+            now = time.monotonic()
+            pending = {
+                port
+                for port, reserved_at in self._reserved_at.items()
+                if now - reserved_at < _RESERVATION_GRACE_SECONDS
+            }
+            self._reserved_at = {
+                p: t for p, t in self._reserved_at.items() if p in pending
+            }
+            self._reset(used | pending | self._held)
+        logger.info(f"Port allocator rebuilt; {len(used)} port(s) in use.")
+
+    def _pop_free(self, instance_type: str):
+        free = self._free[instance_type]
+        free_set = self._free_sets[instance_type]
+        while free:
+            port = free.popleft()
+            free_set.discard(port)
+            # Ports shared with another type's range may already be taken
+            if port not in self._in_use:
+                self._in_use.add(port)
+                self._reserved_at[port] = time.monotonic()
+                return port
+        return None
+
+    def reserve(self, instance_type: str):
+        """
+        Reserve a free port for ``instance_type``. Returns None when the
+        range is exhausted, after one resync with the database (ports freed
+        by the out-of-process cleanup script are only visible there).
+        """
+        if instance_type not in self._ranges:
+            raise ValueError(f"Unknown instance type: {instance_type}")
+        with self._lock:
+            port = self._pop_free(instance_type)
+        if port is None:
+            self.rebuild()
+            with self._lock:
+                port = self._pop_free(instance_type)
+        return port
+
+    def hold(self, port: int):
+        """
+        Keep a reserved port out of rebuilds although no database row owns
+        it (e.g. warm pool containers). Cleared by release().
+        """
+        with self._lock:
+            if port in self._in_use:
+                self._held.add(port)
+
+    def release(self, port: int):
+        """Return a port to the free-lists of every range that contains it."""
+        if port is None:
+            return
+        with self._lock:
+            if port not in self._in_use:
+                return
+            self._in_use.discard(port)
+            self._reserved_at.pop(port, None)
+            self._held.discard(port)
+            for instance_type, (low, high) in self._ranges.items():
+                free_set = self._free_sets[instance_type]
+                if low <= port <= high and port not in free_set:
+                    self._free[instance_type].append(port)
+                    free_set.add(port)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                instance_type: {
+                    "range": [low, high],
+                    "free": len(self._free_sets[instance_type]),
+                }
+                for instance_type, (low, high) in self._ranges.items()
+            }
+            stats["in_use"] = len(self._in_use)
+            stats["held"] = len(self._held)
+        return stats
+
+
+# Global allocator; rebuilt from the database at application startup
+port_allocator = PortAllocator(
+    {name: spec.port_range for name, spec in INSTANCE_TYPES.items()}
+)
@@ -0,0 +1,417 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from app.core.config import (
+    PROVISIONING_CONCURRENCY,
+    PROVISIONING_JOB_TIMEOUT_SECONDS,
+    PROVISIONING_QUEUE_MAXSIZE,
+)
+from app.db.database import get_db
+from app.containers.runtime import docker_client, ContainerNotFoundError, DockerAPIError
+from app.containers.ports import port_allocator
+from app.containers.reaper import expiry_reaper
+from app.containers.readiness import wait_until_ready
+from app.containers.live_status import status_broadcaster
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisioningError(Exception):
+    """Raised when a container could not be started for a job."""
+
+
+class ProvisioningJob:
+    """
+    A queued container start for a user_instances row in 'requested' state.
+
+    ``run_options`` are keyword arguments for DockerClient.run_container
+    (environment, volumes, ports, memory, cpus).
+    """
+
+    def __init__(
+        self,
+        instance_id: int,
+        container_name: str,
+        image: str,
+        run_options: dict,
+        host_port: int,
+        session_days: int,
+        instance_type: str,
+    ):
+        self.instance_id = instance_id
+        self.container_name = container_name
+        self.image = image
+        self.run_options = run_options
+        self.host_port = host_port
+        self.session_days = session_days
+        self.instance_type = instance_type
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.outcome = "queued"
+        self.error = None
+        self.ready_seconds = None
+
+    def timings(self) -> dict:
+        queued = (self.started_at or time.monotonic()) - self.enqueued_at
+        run = None
+        if self.started_at is not None:
+            run = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "instance_id": self.instance_id,
+            "container_name": self.container_name,
+            "instance_type": self.instance_type,
+            "outcome": self.outcome,
+            "error": self.error,
+            "queued_seconds": round(queued, 3),
+            "run_seconds": round(run, 3) if run is not None else None,
+            "ready_seconds": (
+                round(self.ready_seconds, 3) if self.ready_seconds is not None else None
+            ),
+        }
+
+
+def _mark_starting(instance_id: int, container_id: str, session_days: int) -> str:
+    """
+    Move a 'requested' row to 'starting' and return its new expires_at.
+    None if the request was stopped meanwhile.
+    """
+    db = get_db()
+    try:
+        cursor = db.execute(
+            """UPDATE user_instances
+               SET container_id = ?, status = 'starting',
+                   expires_at = datetime('now', ?)
+               WHERE id = ? AND status = 'requested'""",
+            (container_id, f"+{session_days} days", instance_id),
+        )
+        db.commit()
+        if cursor.rowcount == 0:
+            return None
+        status_broadcaster.changed([instance_id])
+        row = db.execute(
+            "SELECT expires_at FROM user_instances WHERE id = ?", (instance_id,)
+        ).fetchone()
+        return row["expires_at"] if row else None
+    finally:
+        db.close()
+
+
+def _mark_ready(instance_id: int, ready_seconds: float) -> bool:
+    """Move a 'starting' row to 'running'. False if it was stopped meanwhile."""
+    db = get_db()
+    try:
+        cursor = db.execute(
+            """UPDATE user_instances
+               SET status = 'running', ready_at = CURRENT_TIMESTAMP, ready_seconds = ?
+               WHERE id = ? AND status = 'starting'""",
+            (round(ready_seconds, 3), instance_id),
+        )
+        db.commit()
+        status_broadcaster.changed([instance_id])
+        return cursor.rowcount > 0
+    finally:
+        db.close()
+
+
+def _fail_starting(instance_id: int) -> bool:
+    db = get_db()
+    try:
+        cursor = db.execute(
+            "UPDATE user_instances SET status = 'error' WHERE id = ? AND status = 'starting'",
+            (instance_id,),
+        )
+        db.commit()
+        status_broadcaster.changed([instance_id])
+        return cursor.rowcount > 0
+    finally:
+        db.close()
+
+
+def _mark_error(instance_id: int) -> bool:
+    """Move a 'requested' row to 'error'. False if it was stopped meanwhile."""
+    db = get_db()
+    try:
+        cursor = db.execute(
+            "UPDATE user_instances SET status = 'error' WHERE id = ? AND status = 'requested'",
+            (instance_id,),
+        )
+        db.commit()
+        status_broadcaster.changed([instance_id])
+        return cursor.rowcount > 0
+    finally:
+        db.close()
+
+
+def _remove_container(container_name: str):
+    """Force-remove a container this process started but no row owns."""
+    try:
+        docker_client.remove_container(container_name, force=True)
+    except ContainerNotFoundError:
+        pass
+    except DockerAPIError as e:
+        logger.error(f"Failed to remove container {container_name}: {e}")
+
+
+def fail_orphaned_requests() -> int:
+    """
+    Mark rows left in 'requested' by a previous process as 'error'.
+
+    Jobs live only in memory, so after a restart nothing will ever pick
+    these rows up again.
+    """
+    db = get_db()
+    try:
+        cursor = db.execute(
+            "UPDATE user_instances SET status = 'error' WHERE status = 'requested'"
+        )
+        db.commit()
+        status_broadcaster.changed()
+        return cursor.rowcount
+    finally:
+        db.close()
+
+
+def _load_starting_instances() -> list:
+    db = get_db()
+    try:
+        return db.execute(
+            """SELECT id, container_name, port, session_days, instance_type
+               FROM user_instances WHERE status = 'starting'"""
+        ).fetchall()
+    finally:
+        db.close()
+
+
+class ProvisioningQueue:
+    """
+    Bounded pool of asyncio workers that run container start jobs.
+
+    Routes only insert the 'requested' row and submit a job; the workers
+    start the container through the Docker Engine API in a worker thread and
+    move the row to 'starting' or 'error', so the event loop never blocks on
+    an image pull. A separate readiness task per instance then polls the
+    published port and moves the row to 'running' once the IDE answers,
+    leaving the worker free for the next job.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = PROVISIONING_CONCURRENCY,
+        timeout: float = PROVISIONING_JOB_TIMEOUT_SECONDS,
+        maxsize: int = PROVISIONING_QUEUE_MAXSIZE,
+        history: int = 50,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self._queue = None
+        self._workers = []
+        self._active = {}
+        self._probing = {}
+        self._recent = deque(maxlen=history)
+        self._counters = {
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "rejected": 0,
+            "cancelled": 0,
+            "ready": 0,
+            "not_ready": 0,
+        }
+
+    def start(self):
+        """Start the worker tasks. Must be called from the running event loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        orphaned = fail_orphaned_requests()
+        if orphaned:
+            logger.warning(
+                f"Marked {orphaned} orphaned 'requested' instance(s) as 'error'."
+            )
+        self._workers = [
+            asyncio.create_task(self._worker(n)) for n in range(self.concurrency)
+        ]
+        # Containers started by a previous process may still be coming up
+        for row in _load_starting_instances():
+            job = ProvisioningJob(
+                row["id"],
+                row["container_name"],
+                None,
+                {},
+                row["port"],
+                row["session_days"],
+                row["instance_type"],
+            )
+            job.outcome = "starting"
+            self._probing[job.instance_id] = asyncio.create_task(self._await_ready(job))
+        logger.info(f"Started {self.concurrency} provisioning worker(s).")
+
+    async def stop(self):
+        tasks = self._workers + list(self._probing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._probing = {}
+
+    def submit(self, job: ProvisioningJob) -> bool:
+        """Queue a job. Returns False if the queue is full or not started."""
+        if self._queue is None:
+            logger.error("Provisioning queue used before start().")
+            self._counters["rejected"] += 1
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            return False
+        self._counters["submitted"] += 1
+        logger.info(
+            f"Queued provisioning job for instance {job.instance_id} "
+            f"(queue depth {self._queue.qsize()})"
+        )
+        return True
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception:
+                logger.error(
+                    f"Provisioning worker {worker_id} crashed on instance {job.instance_id}",
+                    exc_info=True,
+                )
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: ProvisioningJob):
+        job.started_at = time.monotonic()
+        job.outcome = "running"
+        self._active[job.instance_id] = job
+        container_id = None
+        try:
+            container_id = await self._run(job)
+            expires_at = await asyncio.to_thread(
+                _mark_starting, job.instance_id, container_id, job.session_days
+            )
+            if expires_at is None:
+                # Stopped while queued; stopping it already released the port
+                job.outcome = "cancelled"
+                self._counters["cancelled"] += 1
+                await asyncio.to_thread(_remove_container, job.container_name)
+                return
+            expiry_reaper.schedule(job.instance_id, job.container_name, expires_at)
+            job.outcome = "starting"
+            self._counters["succeeded"] += 1
+            self._probing[job.instance_id] = asyncio.create_task(self._await_ready(job))
+        except Exception as e:
+            job.outcome = "failed"
+            job.error = str(e)
+            self._counters["failed"] += 1
+            logger.error(
+                f"Failed to start {job.instance_type} container {job.container_name}: {e}"
+            )
+            try:
+                if container_id is not None:
+                    await asyncio.to_thread(_remove_container, job.container_name)
+                # A request stopped meanwhile already released its port
+                if await asyncio.to_thread(_mark_error, job.instance_id):
+                    port_allocator.release(job.host_port)
+            except Exception as db_err:
+                logger.error(
+                    f"Failed to update instance {job.instance_id} to status 'error': {db_err}"
+                )
+        finally:
+            job.finished_at = time.monotonic()
+            self._active.pop(job.instance_id, None)
+            self._recent.append(job)
+            timing = job.timings()
+            logger.info(
+                f"Provisioning job for instance {job.instance_id} {job.outcome} "
+                f"(queued {timing['queued_seconds']}s, ran {timing['run_seconds']}s)"
+            )
+
+    async def _await_ready(self, job: ProvisioningJob):
+        """Poll the instance's port and mark it 'running' once the IDE answers."""
+        try:
+            ready_seconds = await wait_until_ready(job.host_port)
+            if ready_seconds is not None:
+                job.ready_seconds = ready_seconds
+                job.outcome = "ready"
+                self._counters["ready"] += 1
+                if await asyncio.to_thread(_mark_ready, job.instance_id, ready_seconds):
+                    logger.info(
+                        f"Instance {job.instance_id} ready after {ready_seconds:.1f}s"
+                    )
+                return
+
+            job.outcome = "not_ready"
+            self._counters["not_ready"] += 1
+            logger.error(
+                f"Instance {job.instance_id} ({job.container_name}) did not answer on "
+                f"port {job.host_port} in time; stopping it."
+            )
+            if await asyncio.to_thread(_fail_starting, job.instance_id):
+                try:
+                    await asyncio.to_thread(
+                        docker_client.stop_container, job.container_name
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Failed to stop unready container {job.container_name}: {e}"
+                    )
+                port_allocator.release(job.host_port)
+                expiry_reaper.cancel(job.instance_id)
+        except Exception:
+            logger.error(
+                f"Readiness probe for instance {job.instance_id} failed", exc_info=True
+            )
+        finally:
+            self._probing.pop(job.instance_id, None)
+
+    async def _run(self, job: ProvisioningJob) -> str:
+        logger.info(
+            f"Starting {job.instance_type} container {job.container_name} from {job.image}"
+        )
+        run = asyncio.ensure_future(
+            asyncio.to_thread(
+                docker_client.run_container,
+                job.container_name,
+                job.image,
+                # Images are pulled by the image manager, never here
+                pull_missing=False,
+                **job.run_options,
+            )
+        )
+        # asyncio.wait rather than wait_for: wait_for can swallow a shutdown
+        # cancel that races the thread finishing, leaving stop() hanging
+        done, _ = await asyncio.wait({run}, timeout=self.timeout)
+        if not done:
+            # The thread cannot be cancelled and may still create and start
+            # the container; wait for it (each API call has its own timeout)
+            # and remove what it started before the port is released
+            await asyncio.gather(run, return_exceptions=True)
+            await asyncio.to_thread(_remove_container, job.container_name)
+            raise ProvisioningError(f"timed out after {self.timeout}s")
+        # Docker typically shows short IDs
+        return run.result()[:12]
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "concurrency": self.concurrency,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_maxsize": self.maxsize,
+            "active": [job.timings() for job in self._active.values()],
+            "probing": len(self._probing),
+            "recent": [job.timings() for job in reversed(self._recent)],
+        }
+
+
+# Global provisioning queue, started with the application
+provisioning_queue = ProvisioningQueue()
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import time
+
+from app.core.config import (
+    READINESS_PROBE_HOST,
+    READINESS_TIMEOUT_SECONDS,
+    READINESS_MAX_INTERVAL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def probe_http(host: str, port: int, timeout: float = 2.0) -> bool:
+    """
+    Return True if an HTTP server answers on ``host:port``.
+
+    A bare TCP connect is not enough: Docker's port proxy accepts
+    connections before the IDE inside the container is listening, so the
+    probe waits for an HTTP status line. Any status below 500 counts
+    (RStudio and JupyterLab both redirect to their login pages).
+    """
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout=timeout
+        )
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(b"GET / HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+    parts = status_line.split()
+    return (
+        len(parts) >= 2
+        and parts[0].startswith(b"HTTP/")
+        and parts[1].isdigit()
+        and int(parts[1]) < 500
+    )
+
+
+async def wait_until_ready(
+    port: int,
+    host: str = READINESS_PROBE_HOST,
+    timeout: float = READINESS_TIMEOUT_SECONDS,
+    max_interval: float = READINESS_MAX_INTERVAL_SECONDS,
+):
+    """
+    Poll ``host:port`` with exponential backoff until it answers HTTP.
+    Returns the seconds it took, or None if it did not answer in time.
+    """
+    started = time.monotonic()
+    interval = 0.25
+    while True:
+        if await probe_http(host, port):
+            return time.monotonic() - started
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            return None
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timezone
+
+from app.core.config import REAPER_CONCURRENCY, REAPER_RETRY_SECONDS
+from app.db.database import get_db
+from app.containers.runtime import docker_client, ContainerNotFoundError
+from app.containers.ports import port_allocator
+from app.containers.live_status import status_broadcaster
+
+logger = logging.getLogger(__name__)
+
+
+def parse_db_timestamp(value) -> float:
+    """Convert a stored DATETIME ('YYYY-MM-DD HH:MM:SS', UTC) to epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _load_running_deadlines() -> list:
+    db = get_db()
+    try:
+        return db.execute(
+            """SELECT id, container_name, expires_at FROM user_instances
+               WHERE status IN ('starting', 'running') AND expires_at IS NOT NULL"""
+        ).fetchall()
+    finally:
+        db.close()
+
+
+def _claim_expired(instance_ids: list) -> list:
+    """
+    Re-read the due rows and return those still running and past expiry.
+    Rows stopped or extended since they were scheduled are skipped.
+    """
+    placeholders = ", ".join("?" for _ in instance_ids)
+    db = get_db()
+    try:
+        return db.execute(
+            f"""SELECT id, container_name, port, expires_at FROM user_instances
+                WHERE id IN ({placeholders}) AND status IN ('starting', 'running')
+                AND expires_at <= DATETIME('now')""",
+            instance_ids,
+        ).fetchall()
+    finally:
+        db.close()
+
+
+def _mark_expired(instance_ids: list):
+    """Record every reaped instance of a batch in one transaction."""
+    db = get_db()
+    try:
+        db.executemany(
+            """UPDATE user_instances
+               SET status = 'stopped_expired', container_id = NULL,
+                   stopped_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND status IN ('starting', 'running')""",
+            [(instance_id,) for instance_id in instance_ids],
+        )
+        db.commit()
+        status_broadcaster.changed(instance_ids)
+    finally:
+        db.close()
+
+
+def _stop_and_remove(container_name: str):
+    try:
+        docker_client.stop_container(container_name)
+    except ContainerNotFoundError:
+        return
+    try:
+        docker_client.remove_container(container_name, force=True)
+    except ContainerNotFoundError:
+        # Containers started with AutoRemove disappear on stop
+        pass
+
+
+class ExpiryReaper:
+    """
+    Stops instances at their ``expires_at`` deadline.
+
+    Deadlines live in a min-heap loaded once at startup; the provisioning
+    workers push new instances as they start. A single task sleeps until
+    the earliest deadline (or until an earlier one is scheduled) and stops
+    everything that is due in parallel, so no table polling is involved.
+    Stopped, deleted or extended instances are dropped lazily: only the
+    latest deadline recorded for an instance is acted on, and due rows are
+    re-checked in the database before their container is stopped.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = REAPER_CONCURRENCY,
+        retry_seconds: float = REAPER_RETRY_SECONDS,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.retry_seconds = retry_seconds
+        self._heap = []
+        self._deadlines = {}
+        self._wakeup = None
+        self._task = None
+        self._counters = {"reaped": 0, "failed": 0, "skipped": 0}
+        self._last_run = None
+
+    def start(self):
+        """Load running instances and start the reaper task."""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        for row in _load_running_deadlines():
+            try:
+                self.schedule(row["id"], row["container_name"], row["expires_at"])
+            except ValueError:
+                logger.warning(
+                    f"Instance {row['id']} has an unreadable expires_at "
+                    f"({row['expires_at']!r}); not scheduled for expiry."
+                )
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Expiry reaper started with {len(self._deadlines)} instance(s).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def schedule(self, instance_id: int, container_name: str, expires_at):
+        """Schedule (or reschedule) an instance to be stopped at ``expires_at``."""
+        deadline = parse_db_timestamp(expires_at)
+        self._deadlines[instance_id] = deadline
+        heapq.heappush(self._heap, (deadline, instance_id, container_name))
+        if self._wakeup is not None and self._heap[0][1] == instance_id:
+            # New earliest deadline; re-arm the sleeping task
+            self._wakeup.set()
+
+    def cancel(self, instance_id: int):
+        """Forget an instance that was stopped or deleted before it expired."""
+        self._deadlines.pop(instance_id, None)
+
+    def _pop_due(self, now: float) -> dict:
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            deadline, instance_id, container_name = heapq.heappop(self._heap)
+            if self._deadlines.get(instance_id) == deadline:
+                del self._deadlines[instance_id]
+                due[instance_id] = container_name
+        return due
+
+    async def _run(self):
+        while True:
+            due = self._pop_due(time.time())
+            if due:
+                try:
+                    await self._reap(due)
+                except Exception:
+                    logger.error("Expiry reaper batch failed", exc_info=True)
+                continue
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reap(self, due: dict):
+        started = time.monotonic()
+        rows = await asyncio.to_thread(_claim_expired, list(due))
+        self._counters["skipped"] += len(due) - len(rows)
+        if not rows:
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def stop_one(row):
+            async with semaphore:
+                await asyncio.to_thread(_stop_and_remove, row["container_name"])
+
+        results = await asyncio.gather(
+            *(stop_one(row) for row in rows), return_exceptions=True
+        )
+
+        reaped = []
+        for row, result in zip(rows, results):
+            if isinstance(result, Exception):
+                self._counters["failed"] += 1
+                logger.error(
+                    f"Failed to stop expired container {row['container_name']}: {result}"
+                )
+                # Try again later rather than leaving it running indefinitely
+                self.schedule(
+                    row["id"], row["container_name"], time.time() + self.retry_seconds
+                )
+            else:
+                reaped.append(row)
+
+        if reaped:
+            await asyncio.to_thread(_mark_expired, [row["id"] for row in reaped])
+            for row in reaped:
+                port_allocator.release(row["port"])
+            self._counters["reaped"] += len(reaped)
+
+        self._last_run = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "reaped": len(reaped),
+            "failed": len(rows) - len(reaped),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        logger.info(
+            f"Expiry reaper stopped {len(reaped)} of {len(rows)} expired instance(s) "
+            f"in {self._last_run['seconds']}s."
+        )
+
+    def stats(self) -> dict:
+        next_deadline = None
+        if self._deadlines:
+            next_deadline = datetime.fromtimestamp(
+                min(self._deadlines.values()), timezone.utc
+            ).isoformat()
+        return {
+            **self._counters,
+            "scheduled": len(self._deadlines),
+            "next_expiry": next_deadline,
+            "last_run": self._last_run,
+        }
+
+
+# Global expiry reaper, started with the application
+expiry_reaper = ExpiryReaper()
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+
+from app.core.config import (
+    HOST_MEMORY,
+    HOST_CPUS,
+    RESERVED_HOST_MEMORY,
+    MEMORY_OVERCOMMIT,
+    CPU_OVERCOMMIT,
+)
+from app.db.database import get_db
+from app.containers.runtime import parse_memory
+from app.containers.ports import ACTIVE_STATUSES
+from app.containers.instance_types import INSTANCE_TYPES
+from app.containers.warm_pool import warm_pool
+
+logger = logging.getLogger(__name__)
+
+_GB = 1024**3
+
+
+def read_host_memory() -> int:
+    """Total physical memory in bytes (MemTotal from /proc/meminfo)."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    # Not Linux, or /proc is not mounted
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def parse_limits(memory: str, cpus: str) -> tuple:
+    """
+    (bytes, cpus) for a request's limits. Raises ValueError for values
+    Docker would not accept.
+    """
+    memory_bytes = parse_memory(memory)
+    cpu_count = float(cpus)
+    if memory_bytes <= 0 or not 0 < cpu_count < float("inf"):
+        raise ValueError(f"limits must be positive (memory={memory!r}, cpus={cpus!r})")
+    return memory_bytes, cpu_count
+
+
+def format_gb(value: int) -> str:
+    return f"{value / _GB:.1f} GB"
+
+
+class ResourceScheduler:
+    """
+    Admits sessions by the memory and CPU they reserve rather than by count.
+
+    Every row in ACTIVE_STATUSES commits its memory_limit and cpu_limit,
+    as does every warm container (at its type's default limits). A request
+    fits if the commitments plus its own limits stay within the host's
+    capacity: physical memory less RESERVED_HOST_MEMORY times
+    MEMORY_OVERCOMMIT, and the CPU count times CPU_OVERCOMMIT. Memory is
+    not compressible, so its overcommit should stay at 1.0 unless the
+    sessions are known to use far less than their limits.
+
+    fits() runs inside the AdmissionController's write transaction, so two
+    requests can never both take the last of the headroom.
+    """
+
+    def __init__(
+        self,
+        host_memory: int,
+        host_cpus: float,
+        reserved_memory: int = 0,
+        memory_overcommit: float = 1.0,
+        cpu_overcommit: float = 1.0,
+    ):
+        self.host_memory = host_memory
+        self.host_cpus = host_cpus
+        self.memory_capacity = int(
+            max(host_memory - reserved_memory, 0) * memory_overcommit
+        )
+        self.cpu_capacity = host_cpus * cpu_overcommit
+        self._lock = threading.Lock()
+        self._counters = {"checked": 0, "refused_memory": 0, "refused_cpu": 0}
+
+    def committed(self, db) -> dict:
+        """Sessions, memory (bytes) and CPUs committed to active rows and warm containers."""
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        rows = db.execute(
+            f"""SELECT instance_type, memory_limit, cpu_limit FROM user_instances
+                WHERE status IN ({placeholders})""",
+            ACTIVE_STATUSES,
+        ).fetchall()
+        usage = {"sessions": len(rows), "memory": 0, "cpus": 0.0}
+        for row in rows:
+            memory, cpus = self._row_limits(
+                row["instance_type"], row["memory_limit"], row["cpu_limit"]
+            )
+            usage["memory"] += memory
+            usage["cpus"] += cpus
+        for instance_type, count in warm_pool.reserved().items():
+            spec = INSTANCE_TYPES[instance_type]
+            memory, cpus = parse_limits(spec.default_memory, spec.default_cpus)
+            usage["memory"] += memory * count
+            usage["cpus"] += cpus * count
+        return usage
+
+    @staticmethod
+    def _row_limits(instance_type, memory, cpus) -> tuple:
+        spec = INSTANCE_TYPES.get(instance_type or "rstudio", INSTANCE_TYPES["rstudio"])
+        try:
+            return parse_limits(
+                memory or spec.default_memory, cpus or spec.default_cpus
+            )
+        except ValueError:
+            # Rows from before limits were validated; count the type's defaults
+            return parse_limits(spec.default_memory, spec.default_cpus)
+
+    def fits(self, db, memory: int, cpus: float):
+        """None if a request for ``memory``/``cpus`` fits, else the reason it does not."""
+        usage = self.committed(db)
+        free_memory = self.memory_capacity - usage["memory"]
+        free_cpus = self.cpu_capacity - usage["cpus"]
+        with self._lock:
+            self._counters["checked"] += 1
+            if memory > free_memory:
+                self._counters["refused_memory"] += 1
+            elif cpus > free_cpus:
+                self._counters["refused_cpu"] += 1
+        if memory > self.memory_capacity:
+            return (
+                f"A {format_gb(memory)} session is larger than this server can host "
+                f"({format_gb(self.memory_capacity)}). Please request less memory."
+            )
+        if cpus > self.cpu_capacity:
+            return (
+                f"A {cpus:g}-CPU session is larger than this server can host "
+                f"({self.cpu_capacity:g} CPUs). Please request fewer CPUs."
+            )
+        if memory > free_memory:
+            return (
+                f"Not enough free memory: {format_gb(max(free_memory, 0))} of "
+                f"{format_gb(self.memory_capacity)} is available and {format_gb(memory)} "
+                "was requested. Request less memory or wait for another session to stop."
+            )
+        if cpus > free_cpus:
+            return (
+                f"Not enough free CPUs: {max(free_cpus, 0):g} of {self.cpu_capacity:g} "
+                f"are available and {cpus:g} were requested. Request fewer CPUs or wait "
+                "for another session to stop."
+            )
+        return None
+
+    def headroom(self, usage: dict) -> dict:
+        """Capacity and free resources for the dashboard, from committed()."""
+        return {
+            "memory_total_gb": round(self.memory_capacity / _GB, 1),
+            "memory_free_gb": round(
+                max(self.memory_capacity - usage["memory"], 0) / _GB, 1
+            ),
+            "cpus_total": round(self.cpu_capacity, 2),
+            "cpus_free": round(max(self.cpu_capacity - usage["cpus"], 0), 2),
+        }
+
+    def stats(self) -> dict:
+        db = get_db()
+        try:
+            usage = self.committed(db)
+        finally:
+            db.close()
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "host_memory_gb": round(self.host_memory / _GB, 1),
+            "host_cpus": self.host_cpus,
+            "committed_memory_gb": round(usage["memory"] / _GB, 1),
+            "committed_cpus": round(usage["cpus"], 2),
+            **self.headroom(usage),
+        }
+
+
+# Global scheduler, sized from the host unless HOST_MEMORY/HOST_CPUS are set
+resource_scheduler = ResourceScheduler(
+    parse_memory(HOST_MEMORY) if HOST_MEMORY else read_host_memory(),
+    float(HOST_CPUS) if HOST_CPUS else float(os.cpu_count() or 1),
+    reserved_memory=parse_memory(RESERVED_HOST_MEMORY),
+    memory_overcommit=MEMORY_OVERCOMMIT,
+    cpu_overcommit=CPU_OVERCOMMIT,
+)
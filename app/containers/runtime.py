@@ -0,0 +1,391 @@
+import http.client
+import json
+import logging
+import socket
+import threading
+import time
+from urllib.parse import quote, urlencode
+
+from app.core.config import (
+    DOCKER_SOCKET_PATH,
+    DOCKER_API_VERSION,
+    DOCKER_API_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_MEMORY_UNITS = {"b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+# How long a stop issued by this process is remembered (see stop_requested)
+_STOP_REQUEST_TTL_SECONDS = 300
+
+
+class DockerAPIError(Exception):
+    """Error response from the Docker Engine API."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ContainerNotFoundError(DockerAPIError):
+    """The referenced container (or image) does not exist."""
+
+
+class DockerUnavailableError(Exception):
+    """The Docker daemon socket could not be reached."""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to a unix domain socket instead of TCP."""
+
+    def __init__(self, socket_path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+        # http.client drops self.sock once a response owns the socket
+        self._unix_sock = sock
+
+    def shutdown(self):
+        """Unblock a reader in another thread (e.g. on a streaming response)."""
+        sock = getattr(self, "_unix_sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def parse_memory(value: str) -> int:
+    """Convert a docker-style memory string ('16g', '512m') to bytes."""
+    value = str(value).strip().lower()
+    if value and value[-1] in _MEMORY_UNITS:
+        return int(float(value[:-1]) * _MEMORY_UNITS[value[-1]])
+    return int(value)
+
+
+def parse_cpus(value: str) -> int:
+    """Convert a docker-style CPU count ('2', '0.5') to nano-CPUs."""
+    return int(round(float(value) * 1e9))
+
+
+def split_image_reference(image: str) -> tuple[str, str]:
+    """Split 'repo/name:tag' into ('repo/name', 'tag'); digests are kept whole."""
+    if "@" in image:
+        return image, ""
+    name, sep, tag = image.rpartition(":")
+    if sep and "/" not in tag:
+        return name, tag
+    return image, "latest"
+
+
+def iter_json_lines(response):
+    """Yield decoded objects from a newline-delimited JSON response stream."""
+    for line in response:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+class DockerClient:
+    """
+    Minimal Docker Engine API client over the local unix socket.
+
+    Each thread keeps one persistent keep-alive connection to the daemon, so
+    container operations skip both the fork+exec of the docker CLI and a new
+    API handshake. Pass ``socket_path`` to point it at a stub server.
+    """
+
+    def __init__(
+        self,
+        socket_path: str = DOCKER_SOCKET_PATH,
+        api_version: str = DOCKER_API_VERSION,
+        timeout: float = DOCKER_API_TIMEOUT_SECONDS,
+    ):
+        self.socket_path = socket_path
+        self.prefix = f"/{api_version.lstrip('/')}" if api_version else ""
+        self.timeout = timeout
+        self._local = threading.local()
+        self._stop_requested = {}
+        self._stop_lock = threading.Lock()
+
+    # --- Transport ---
+
+    def _connection(self) -> UnixHTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _request(self, method: str, path: str, params: dict = None, body=None):
+        url = self.prefix + path
+        if params:
+            url += "?" + urlencode(params)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        # A keep-alive connection may have been closed by the daemon while
+        # idle; reconnect once before giving up.
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (FileNotFoundError, ConnectionRefusedError, PermissionError) as e:
+                self._reset_connection()
+                raise DockerUnavailableError(
+                    f"Cannot reach Docker daemon at {self.socket_path}: {e}"
+                ) from e
+            except (
+                http.client.RemoteDisconnected,
+                http.client.CannotSendRequest,
+                http.client.ResponseNotReady,
+                BrokenPipeError,
+                ConnectionResetError,
+            ):
+                self._reset_connection()
+                if attempt:
+                    raise
+            except Exception:
+                self._reset_connection()
+                raise
+
+        self._raise_for_status(response, data)
+        return response.status, data
+
+    @staticmethod
+    def _raise_for_status(response, data: bytes):
+        if response.status < 400:
+            return
+        try:
+            message = json.loads(data).get("message", "")
+        except ValueError:
+            message = data.decode(errors="replace")
+        error_cls = ContainerNotFoundError if response.status == 404 else DockerAPIError
+        raise error_cls(response.status, message or response.reason)
+
+    def _open_stream(self, method: str, path: str, params: dict = None):
+        """
+        Issue a request on a dedicated, untimed connection and return the
+        open response. Used for long-running calls (image pulls) so they
+        neither hit the API timeout nor tie up the keep-alive connection.
+        """
+        url = self.prefix + path
+        if params:
+            url += "?" + urlencode(params)
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            conn.request(method, url)
+            response = conn.getresponse()
+        except (FileNotFoundError, ConnectionRefusedError, PermissionError) as e:
+            conn.close()
+            raise DockerUnavailableError(
+                f"Cannot reach Docker daemon at {self.socket_path}: {e}"
+            ) from e
+        if response.status >= 400:
+            data = response.read()
+            conn.close()
+            self._raise_for_status(response, data)
+        return conn, response
+
+    def _json(self, method: str, path: str, params: dict = None, body=None):
+        _, data = self._request(method, path, params=params, body=body)
+        return json.loads(data) if data else None
+
+    # --- Images ---
+
+    def pull_image(self, image: str):
+        """Pull an image, blocking until the daemon has finished."""
+        name, tag = split_image_reference(image)
+        params = {"fromImage": name}
+        if tag:
+            params["tag"] = tag
+        logger.info(f"Pulling image {image}")
+        conn, response = self._open_stream("POST", "/images/create", params=params)
+        try:
+            # Pull progress is streamed as JSON lines; errors arrive in-band
+            for event in iter_json_lines(response):
+                if "error" in event:
+                    raise DockerAPIError(500, event["error"])
+        finally:
+            conn.close()
+
+    def inspect_image(self, image: str) -> dict:
+        """Image metadata; raises ContainerNotFoundError if it is not present."""
+        return self._json("GET", f"/images/{quote(image, safe='/:@')}/json")
+
+    # --- Events ---
+
+    def open_event_stream(self, filters: dict = None, since: int = None):
+        """
+        Subscribe to the daemon's event stream.
+
+        Returns ``(connection, events)`` where ``events`` yields one dict per
+        event until the connection is closed. Close the connection to stop.
+        """
+        params = {}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        if since is not None:
+            params["since"] = str(int(since))
+        conn, response = self._open_stream("GET", "/events", params=params)
+        return conn, iter_json_lines(response)
+
+    # --- Containers ---
+
+    def create_container(
+        self,
+        name: str,
+        image: str,
+        environment: dict = None,
+        volumes: dict = None,
+        ports: dict = None,
+        memory: str = None,
+        cpus: str = None,
+        auto_remove: bool = True,
+        labels: dict = None,
+    ) -> str:
+        """
+        Create (but do not start) a container and return its ID.
+
+        ``volumes`` maps host paths to container paths and ``ports`` maps
+        container ports to host ports, mirroring ``-v`` and ``-p``.
+        """
+        host_config = {"AutoRemove": auto_remove}
+        if volumes:
+            host_config["Binds"] = [
+                f"{host}:{target}" for host, target in volumes.items()
+            ]
+        if ports:
+            host_config["PortBindings"] = {
+                f"{container_port}/tcp": [{"HostPort": str(host_port)}]
+                for container_port, host_port in ports.items()
+            }
+        if memory:
+            host_config["Memory"] = parse_memory(memory)
+        if cpus:
+            host_config["NanoCpus"] = parse_cpus(cpus)
+
+        body = {
+            "Image": image,
+            "Env": [f"{key}={value}" for key, value in (environment or {}).items()],
+            "ExposedPorts": {f"{port}/tcp": {} for port in (ports or {})},
+            "HostConfig": host_config,
+        }
+        if labels:
+            body["Labels"] = labels
+        result = self._json(
+            "POST", "/containers/create", params={"name": name}, body=body
+        )
+        return result["Id"]
+
+    def start_container(self, container: str):
+        self._request("POST", f"/containers/{quote(container)}/start")
+
+    def run_container(
+        self, name: str, image: str, pull_missing: bool = True, **kwargs
+    ) -> str:
+        """
+        Equivalent of `docker run -d`: pull if missing, create, start.
+
+        With ``pull_missing=False`` a missing image raises
+        ContainerNotFoundError instead of being pulled.
+        """
+        try:
+            container_id = self.create_container(name, image, **kwargs)
+        except ContainerNotFoundError:
+            if not pull_missing:
+                raise
+            # 404 on create means the image is not present locally
+            self.pull_image(image)
+            container_id = self.create_container(name, image, **kwargs)
+        try:
+            self.start_container(container_id)
+        except DockerAPIError:
+            # Do not leave a created-but-dead container holding the name
+            try:
+                self.remove_container(container_id, force=True)
+            except DockerAPIError:
+                pass
+            raise
+        return container_id
+
+    def stop_container(self, container: str, timeout: int = 10) -> bool:
+        """
+        Stop a container. Returns False if it was already stopped.
+
+        Raises ContainerNotFoundError if it does not exist.
+        """
+        now = time.monotonic()
+        with self._stop_lock:
+            self._stop_requested = {
+                name: at
+                for name, at in self._stop_requested.items()
+                if now - at < _STOP_REQUEST_TTL_SECONDS
+            }
+            self._stop_requested[container] = now
+        status, _ = self._request(
+            "POST", f"/containers/{quote(container)}/stop", params={"t": timeout}
+        )
+        return status != 304
+
+    def stop_requested(self, container: str) -> bool:
+        """Whether this process recently asked the daemon to stop ``container``."""
+        with self._stop_lock:
+            requested_at = self._stop_requested.get(container)
+        return (
+            requested_at is not None
+            and time.monotonic() - requested_at < _STOP_REQUEST_TTL_SECONDS
+        )
+
+    def remove_container(self, container: str, force: bool = False):
+        self._request(
+            "DELETE",
+            f"/containers/{quote(container)}",
+            params={"force": "true" if force else "false"},
+        )
+
+    def rename_container(self, container: str, new_name: str):
+        self._request(
+            "POST", f"/containers/{quote(container)}/rename", params={"name": new_name}
+        )
+
+    def inspect_container(self, container: str) -> dict:
+        return self._json("GET", f"/containers/{quote(container)}/json")
+
+    def list_containers(self, all: bool = False, filters: dict = None) -> list:
+        params = {"all": "true" if all else "false"}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        return self._json("GET", "/containers/json", params=params)
+
+    def container_exists(self, container: str) -> bool:
+        try:
+            self.inspect_container(container)
+            return True
+        except ContainerNotFoundError:
+            return False
+
+
+# Shared client for the application and maintenance scripts
+docker_client = DockerClient()
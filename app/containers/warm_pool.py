@@ -0,0 +1,392 @@
+import asyncio
+import logging
+import os
+import secrets
+import shutil
+import time
+from pathlib import Path
+
+from app.core.config import (
+    USER_DATA_BASE_DIR,
+    WARM_POOL_RSTUDIO_SIZE,
+    WARM_POOL_JUPYTERLAB_SIZE,
+    WARM_POOL_CHECK_SECONDS,
+)
+from app.containers.runtime import (
+    docker_client,
+    DockerAPIError,
+    ContainerNotFoundError,
+    parse_cpus,
+    parse_memory,
+)
+from app.containers.ports import port_allocator
+from app.containers.instance_types import INSTANCE_TYPES
+from app.containers.readiness import wait_until_ready
+from app.containers.images import image_manager
+
+logger = logging.getLogger(__name__)
+
+WARM_LABEL = "launchpad.warm-pool"
+WARM_NAME_PREFIX = "warm-"
+
+# Slot directories live next to the user directories so a claim is a
+# same-filesystem rename
+SLOT_BASE_DIR = USER_DATA_BASE_DIR / ".warm"
+
+# Written next to a slot while user data is being moved into it, so an
+# interrupted claim can be undone at the next startup
+_CLAIM_MARKER_SUFFIX = ".claim"
+
+
+class WarmContainer:
+    """An idle, running container waiting to be bound to a user."""
+
+    def __init__(
+        self, instance_type, container_id, name, host_port, secret, slot_dir, image
+    ):
+        self.instance_type = instance_type
+        self.container_id = container_id
+        self.name = name
+        self.host_port = host_port
+        self.secret = secret
+        self.slot_dir = slot_dir
+        self.image = image
+        self.created_at = time.monotonic()
+        self.claim_seconds = None
+
+
+def _merge_into(source: Path, target: Path):
+    """Move every entry of ``source`` into ``target``; existing entries in
+    ``target`` are replaced. Renames only, so it is cheap on one filesystem."""
+    for entry in os.scandir(source):
+        destination = target / entry.name
+        if destination.is_dir() and not destination.is_symlink():
+            shutil.rmtree(destination)
+        elif destination.exists() or destination.is_symlink():
+            destination.unlink()
+        os.rename(entry.path, destination)
+
+
+def _adopt_data_directory(slot_dir: Path, user_dir: Path):
+    """
+    Make ``slot_dir`` (already bind-mounted in a running container) become
+    ``user_dir``.
+
+    Docker cannot add a bind mount to a running container, but a bind mount
+    follows the directory, not its path. Moving the user's entries into the
+    slot and renaming the slot to the user's path leaves the container
+    working on the user's data, and the directory stays in place after the
+    container is gone.
+    """
+    marker = slot_dir.with_name(slot_dir.name + _CLAIM_MARKER_SUFFIX)
+    marker.write_text(str(user_dir))
+    if user_dir.exists():
+        _merge_into(user_dir, slot_dir)
+        os.rmdir(user_dir)
+    os.rename(slot_dir, user_dir)
+    marker.unlink()
+
+
+def _limits(memory: str, cpus: str):
+    """Limits as docker applies them (bytes, nano-CPUs); None if unparsable."""
+    try:
+        return parse_memory(memory), parse_cpus(cpus)
+    except (TypeError, ValueError):
+        return None
+
+
+def _remove_slot(slot_dir: Path):
+    """Delete an unclaimed slot; never one that may hold user data."""
+    if slot_dir.with_name(slot_dir.name + _CLAIM_MARKER_SUFFIX).exists():
+        logger.error(f"Not removing {slot_dir}: a claim into it did not complete.")
+        return
+    shutil.rmtree(slot_dir, ignore_errors=True)
+
+
+def recover_interrupted_claims():
+    """Put user data back where it belongs after a claim was interrupted."""
+    if not SLOT_BASE_DIR.exists():
+        return
+    for marker in SLOT_BASE_DIR.glob(f"*{_CLAIM_MARKER_SUFFIX}"):
+        slot_dir = marker.with_name(marker.name[: -len(_CLAIM_MARKER_SUFFIX)])
+        user_dir = Path(marker.read_text().strip())
+        if slot_dir.exists():
+            logger.warning(
+                f"Restoring data for {user_dir} from interrupted claim {slot_dir}"
+            )
+            user_dir.mkdir(parents=True, exist_ok=True)
+            _merge_into(slot_dir, user_dir)
+            slot_dir.rmdir()
+        marker.unlink()
+
+
+class WarmPool:
+    """
+    Keeps ``size`` idle, already-started containers per instance type.
+
+    Each warm container is started with its own password/token, a reserved
+    host port and an empty slot directory as its workspace. Claiming one for
+    a user renames the container, adopts the user's data directory (see
+    _adopt_data_directory) and hands over port and secret, so the session is
+    usable without waiting for a cold start. A background task replaces
+    claimed or dead containers.
+
+    Only requests with the type's default memory/CPU limits are served from
+    the pool; anything else falls back to a normal start.
+    """
+
+    def __init__(self, sizes: dict, check_seconds: float = WARM_POOL_CHECK_SECONDS):
+        self.sizes = {t: max(0, n) for t, n in sizes.items()}
+        self.check_seconds = check_seconds
+        self._idle = {t: [] for t in self.sizes}
+        self._filling = {t: 0 for t in self.sizes}
+        self._lock = None
+        self._wakeup = None
+        self._task = None
+        self._counters = {"claimed": 0, "misses": 0, "started": 0, "discarded": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.sizes.values())
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self._task is not None or not self.enabled:
+            return
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        # Fill as soon as an image becomes available instead of at the next check
+        image_manager.add_listener(self._wakeup.set)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Warm pool started with target sizes {self.sizes}.")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # --- Claiming ---
+
+    async def claim(
+        self,
+        instance_type: str,
+        container_name: str,
+        user_dir: Path,
+        memory: str,
+        cpus: str,
+    ):
+        """
+        Bind an idle container to a user. Returns the WarmContainer (now
+        named ``container_name`` and working on ``user_dir``) or None if
+        none is available, in which case the caller starts one normally.
+        """
+        if self._task is None or not self.sizes.get(instance_type):
+            return None
+        spec = INSTANCE_TYPES[instance_type]
+        # '4g' and '4096m' are the same limit
+        requested = _limits(memory, cpus)
+        if requested is None or requested != _limits(
+            spec.default_memory, spec.default_cpus
+        ):
+            self._counters["misses"] += 1
+            return None
+
+        while True:
+            async with self._lock:
+                idle = self._idle[instance_type]
+                warm = idle.pop(0) if idle else None
+            if warm is None:
+                self._counters["misses"] += 1
+                self._wakeup.set()
+                return None
+            started = time.monotonic()
+            try:
+                await asyncio.to_thread(self._bind, warm, container_name, user_dir)
+            except Exception as e:
+                logger.warning(f"Discarding warm container {warm.name}: {e}")
+                await asyncio.to_thread(self._discard, warm)
+                continue
+            warm.name = container_name
+            warm.claim_seconds = time.monotonic() - started
+            self._counters["claimed"] += 1
+            self._wakeup.set()
+            return warm
+
+    @staticmethod
+    def _bind(warm: WarmContainer, container_name: str, user_dir: Path):
+        state = docker_client.inspect_container(warm.container_id).get("State", {})
+        if not state.get("Running"):
+            raise RuntimeError("container is no longer running")
+        docker_client.rename_container(warm.container_id, container_name)
+        try:
+            _adopt_data_directory(warm.slot_dir, user_dir)
+        except OSError:
+            # Leave the user's data where it was; the container is discarded
+            recover_interrupted_claims()
+            raise
+
+    def _discard(self, warm: WarmContainer):
+        self._remove(warm)
+        _remove_slot(warm.slot_dir)
+
+    def release_claimed(self, warm: WarmContainer):
+        """
+        Remove a claimed container that could not be bound to its instance.
+        It already works on the user's data directory, so it cannot go back
+        to the pool; the directory itself is left in place.
+        """
+        self._remove(warm)
+
+    def _remove(self, warm: WarmContainer):
+        self._counters["discarded"] += 1
+        try:
+            docker_client.remove_container(warm.container_id, force=True)
+        except ContainerNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to remove warm container {warm.name}: {e}")
+        port_allocator.release(warm.host_port)
+
+    # --- Replenishing ---
+
+    async def _run(self):
+        try:
+            await asyncio.to_thread(self._remove_leftovers)
+        except Exception:
+            logger.error("Failed to remove leftover warm containers", exc_info=True)
+        while True:
+            try:
+                await self._prune_dead()
+                await self._fill()
+            except Exception:
+                logger.error("Warm pool maintenance failed", exc_info=True)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _remove_leftovers(self):
+        """Drop idle containers and slots left by a previous process."""
+        recover_interrupted_claims()
+        for container in docker_client.list_containers(
+            all=True, filters={"label": [WARM_LABEL]}
+        ):
+            names = [n.lstrip("/") for n in container.get("Names", [])]
+            # Claimed containers were renamed and belong to a user now
+            if any(n.startswith(WARM_NAME_PREFIX) for n in names):
+                try:
+                    docker_client.remove_container(container["Id"], force=True)
+                except DockerAPIError:
+                    pass
+        if SLOT_BASE_DIR.exists():
+            for slot in SLOT_BASE_DIR.iterdir():
+                if slot.is_dir():
+                    _remove_slot(slot)
+
+    async def _prune_dead(self):
+        async with self._lock:
+            candidates = [w for idle in self._idle.values() for w in idle]
+        for warm in candidates:
+            # Containers started from a digest that has since been replaced
+            # are retired too, so claims always get the current image
+            keep = warm.image == image_manager.pinned_image(warm.instance_type)
+            if keep:
+                try:
+                    state = await asyncio.to_thread(
+                        docker_client.inspect_container, warm.container_id
+                    )
+                    keep = state.get("State", {}).get("Running")
+                except ContainerNotFoundError:
+                    keep = False
+            if keep:
+                continue
+            async with self._lock:
+                idle = self._idle[warm.instance_type]
+                if warm not in idle:
+                    continue  # claimed meanwhile
+                idle.remove(warm)
+            await asyncio.to_thread(self._discard, warm)
+
+    async def _fill(self):
+        for instance_type, size in self.sizes.items():
+            while len(self._idle[instance_type]) + self._filling[instance_type] < size:
+                self._filling[instance_type] += 1
+                try:
+                    warm = await asyncio.to_thread(self._start_one, instance_type)
+                    if warm is None:
+                        break
+                    # Only hand out containers whose IDE already answers
+                    if await wait_until_ready(warm.host_port) is None:
+                        logger.error(f"Warm container {warm.name} never became ready.")
+                        await asyncio.to_thread(self._discard, warm)
+                        break
+                finally:
+                    self._filling[instance_type] -= 1
+                async with self._lock:
+                    self._idle[instance_type].append(warm)
+
+    def _start_one(self, instance_type: str):
+        image = image_manager.pinned_image(instance_type)
+        if image is None:
+            # Retried on the next check once the image manager has pulled it
+            return None
+        host_port = port_allocator.reserve(instance_type)
+        if host_port is None:
+            logger.warning(f"No free port for a warm {instance_type} container.")
+            return None
+        port_allocator.hold(host_port)
+        spec = INSTANCE_TYPES[instance_type]
+        name = f"{WARM_NAME_PREFIX}{instance_type}-{secrets.token_hex(4)}"
+        slot_dir = SLOT_BASE_DIR / name
+        secret = spec.new_secret()
+        try:
+            slot_dir.mkdir(parents=True)
+            try:
+                os.chown(slot_dir, spec.data_uid, spec.data_uid)
+            except OSError:
+                os.chmod(slot_dir, 0o777)
+            options = spec.run_options(
+                secret,
+                str(slot_dir.resolve()),
+                host_port,
+                spec.default_memory,
+                spec.default_cpus,
+            )
+            container_id = docker_client.run_container(
+                name,
+                image,
+                pull_missing=False,
+                labels={WARM_LABEL: instance_type},
+                **options,
+            )
+        except Exception as e:
+            logger.error(f"Failed to start warm {instance_type} container: {e}")
+            port_allocator.release(host_port)
+            _remove_slot(slot_dir)
+            return None
+        self._counters["started"] += 1
+        logger.info(f"Warm {instance_type} container {name} ready on port {host_port}.")
+        return WarmContainer(
+            instance_type, container_id[:12], name, host_port, secret, slot_dir, image
+        )
+
+    def reserved(self) -> dict:
+        """Warm containers per type that hold (or are about to hold) resources."""
+        return {t: len(self._idle[t]) + self._filling[t] for t in self.sizes}
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "sizes": self.sizes,
+            "idle": {t: len(idle) for t, idle in self._idle.items()},
+            "starting": dict(self._filling),
+        }
+
+
+# Global warm pool, started with the application when a size is configured
+warm_pool = WarmPool(
+    {"rstudio": WARM_POOL_RSTUDIO_SIZE, "jupyterlab": WARM_POOL_JUPYTERLAB_SIZE}
+)
@@ -44,6 +44,19 @@ if DB_MOUNT_PATH_STR:
 else:
     DATABASE_PATH = BASE_DIR / DATABASE_FILENAME
 
+# --- Database Pool Configuration ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+DB_LOCK_RETRIES = int(os.getenv("DB_LOCK_RETRIES", "3"))
+# Periodic cleanup, incremental vacuum and PRAGMA optimize (see app/db/maintenance.py)
+DB_MAINTENANCE_INTERVAL_MINUTES = float(
+    os.getenv("DB_MAINTENANCE_INTERVAL_MINUTES", "60")
+)
+DB_MAINTENANCE_BATCH_SIZE = int(os.getenv("DB_MAINTENANCE_BATCH_SIZE", "500"))
+DB_VACUUM_PAGES_PER_RUN = int(os.getenv("DB_VACUUM_PAGES_PER_RUN", "2000"))
+
 USER_DATA_MOUNT_PATH_STR = os.getenv("USER_DATA_MOUNT_PATH")
 if USER_DATA_MOUNT_PATH_STR:
     USER_DATA_BASE_DIR = Path(USER_DATA_MOUNT_PATH_STR)
@@ -80,6 +93,7 @@ JUPYTER_SESSION_EXPIRY_DAYS = int(os.getenv("JUPYTER_SESSION_EXPIRY_DAYS", "7"))
 # --- Application Configuration ---
 MAX_CONCURRENT_SESSIONS = int(os.getenv("MAX_CONCURRENT_SESSIONS", "20"))
 DEFAULT_SESSION_DAYS = int(os.getenv("DEFAULT_SESSION_DAYS", "2"))
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))  # Rows per admin listing page
 INITIAL_ADMIN_USERNAME = os.getenv("INITIAL_ADMIN_USERNAME", "admin")
 INITIAL_ADMIN_PASSWORD = os.getenv(
     "INITIAL_ADMIN_PASSWORD", "adminpass"
@@ -88,15 +102,97 @@ UVICORN_HOST = os.getenv("UVICORN_HOST", "0.0.0.0")
 UVICORN_PORT = int(os.getenv("UVICORN_PORT", "8001"))
 SESSION_DURATION_HOURS = int(os.getenv("SESSION_DURATION_HOURS", "8"))
 
+# --- Docker Engine API ---
+DOCKER_SOCKET_PATH = os.getenv("DOCKER_SOCKET_PATH", "/var/run/docker.sock")
+DOCKER_API_VERSION = os.getenv(
+    "DOCKER_API_VERSION", ""
+)  # e.g. "v1.41"; empty = daemon default
+DOCKER_API_TIMEOUT_SECONDS = float(os.getenv("DOCKER_API_TIMEOUT_SECONDS", "60"))
+
+# --- Provisioning Configuration ---
+PROVISIONING_CONCURRENCY = int(os.getenv("PROVISIONING_CONCURRENCY", "2"))
+PROVISIONING_JOB_TIMEOUT_SECONDS = float(
+    os.getenv("PROVISIONING_JOB_TIMEOUT_SECONDS", "900")
+)  # Covers a cold image pull
+PROVISIONING_QUEUE_MAXSIZE = int(os.getenv("PROVISIONING_QUEUE_MAXSIZE", "100"))
+
+# --- Resource Scheduler Configuration ---
+# Host capacity sessions are admitted against. Empty = read from the host
+# (/proc/meminfo and os.cpu_count()).
+HOST_MEMORY = os.getenv("HOST_MEMORY", "")  # e.g. "256g"
+HOST_CPUS = os.getenv("HOST_CPUS", "")
+RESERVED_HOST_MEMORY = os.getenv(
+    "RESERVED_HOST_MEMORY", "4g"
+)  # Kept for the OS and portal
+MEMORY_OVERCOMMIT = float(os.getenv("MEMORY_OVERCOMMIT", "1.0"))
+CPU_OVERCOMMIT = float(os.getenv("CPU_OVERCOMMIT", "2.0"))
+
+# --- Readiness Probe Configuration ---
+# Address the portal uses to reach published container ports
+READINESS_PROBE_HOST = os.getenv("READINESS_PROBE_HOST", "127.0.0.1")
+READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", "300"))
+READINESS_MAX_INTERVAL_SECONDS = float(os.getenv("READINESS_MAX_INTERVAL_SECONDS", "5"))
+
+# --- Expiry Reaper Configuration ---
+REAPER_CONCURRENCY = int(os.getenv("REAPER_CONCURRENCY", "4"))
+REAPER_RETRY_SECONDS = float(os.getenv("REAPER_RETRY_SECONDS", "60"))
+
+# --- Image Cache Configuration ---
+# How often the IDE images are re-pulled (0 = only at startup)
+IMAGE_REFRESH_HOURS = float(os.getenv("IMAGE_REFRESH_HOURS", "24"))
+
+# --- Warm Pool Configuration ---
+# Idle pre-started containers kept per instance type (0 disables the pool)
+WARM_POOL_RSTUDIO_SIZE = int(os.getenv("WARM_POOL_RSTUDIO_SIZE", "0"))
+WARM_POOL_JUPYTERLAB_SIZE = int(os.getenv("WARM_POOL_JUPYTERLAB_SIZE", "0"))
+WARM_POOL_CHECK_SECONDS = float(os.getenv("WARM_POOL_CHECK_SECONDS", "60"))
+
+# --- Live Updates Configuration ---
+# Dashboards receive instance/capacity changes over Server-Sent Events
+EVENT_STREAM_KEEPALIVE_SECONDS = float(
+    os.getenv("EVENT_STREAM_KEEPALIVE_SECONDS", "25")
+)
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv("EVENT_STREAM_QUEUE_SIZE", "100"))
+# Streams are closed after this long (browsers reconnect on their own) so
+# open dashboards never hold up a server restart indefinitely
+EVENT_STREAM_MAX_SECONDS = float(os.getenv("EVENT_STREAM_MAX_SECONDS", "300"))
+
+# --- Docker Events Configuration ---
+DOCKER_EVENTS_RECONNECT_SECONDS = float(
+    os.getenv("DOCKER_EVENTS_RECONNECT_SECONDS", "5")
+)
+
 # --- OTP Configuration ---
 OTP_VALIDITY_MINUTES = int(os.getenv("OTP_VALIDITY_MINUTES", "10"))
 OTP_LENGTH = int(os.getenv("OTP_LENGTH", "6"))
 MAX_OTP_ATTEMPTS = int(os.getenv("MAX_OTP_ATTEMPTS", "3"))
 MAX_OTP_REQUESTS_PER_HOUR = int(os.getenv("MAX_OTP_REQUESTS_PER_HOUR", "3"))
+# Per client IP, across all email addresses
+MAX_OTP_REQUESTS_PER_IP_PER_HOUR = int(
+    os.getenv("MAX_OTP_REQUESTS_PER_IP_PER_HOUR", "20")
+)
+MAX_OTP_ATTEMPTS_PER_IP_PER_HOUR = int(
+    os.getenv("MAX_OTP_ATTEMPTS_PER_IP_PER_HOUR", "30")
+)
+OTP_STATE_FLUSH_SECONDS = float(os.getenv("OTP_STATE_FLUSH_SECONDS", "2"))
+# Expired codes are deleted this long after expiry; at least 1 hour, since
+# the per-email request limit is reloaded from the last hour of codes
+OTP_RETENTION_HOURS = max(1.0, float(os.getenv("OTP_RETENTION_HOURS", "24")))
+# Proxies whose X-Real-IP header is trusted for the client address (comma-separated)
+TRUSTED_PROXY_IPS = [
+    ip.strip()
+    for ip in os.getenv("TRUSTED_PROXY_IPS", "127.0.0.1,::1").split(",")
+    if ip.strip()
+]
 
 # --- Session Configuration ---
 DEFAULT_SESSION_HOURS = int(os.getenv("DEFAULT_SESSION_HOURS", "24"))
 REMEMBER_ME_SESSION_DAYS = int(os.getenv("REMEMBER_ME_SESSION_DAYS", "7"))
+# Required; the portal refuses to start without it (see app/auth/security.py)
+SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY")
+SESSION_TOKEN_ALGORITHM = os.getenv("SESSION_TOKEN_ALGORITHM", "HS256")
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "1024"))
 
 # --- SMTP Email Configuration ---
 SMTP_USER = os.getenv("SMTP_USER")
@@ -109,3 +205,36 @@ EMAIL_HOST = os.getenv("EMAIL_HOST", "email-smtp.ap-southeast-1.amazonaws.com")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True").lower() == "true"
 EMAIL_USE_SSL = os.getenv("EMAIL_USE_SSL", "False").lower() == "true"
+
+# --- Email Outbox Configuration ---
+# Messages are queued in the email_outbox table and sent in the background
+EMAIL_SENDER_CONCURRENCY = int(
+    os.getenv("EMAIL_SENDER_CONCURRENCY", "2")
+)  # Pooled SMTP connections
+EMAIL_SMTP_TIMEOUT_SECONDS = float(os.getenv("EMAIL_SMTP_TIMEOUT_SECONDS", "30"))
+EMAIL_CONNECTION_IDLE_SECONDS = float(
+    os.getenv("EMAIL_CONNECTION_IDLE_SECONDS", "60")
+)  # Idle pooled connections are closed after this long
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "5"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "300"))
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "7"))
+# Jinja templates of notification emails; point elsewhere to rebrand without a deploy
+EMAIL_TEMPLATES_DIR = Path(
+    os.getenv("EMAIL_TEMPLATES_DIR") or TEMPLATES_JINJA_DIR / "email"
+)
+
+# --- Expiry Warning Configuration ---
+# Owners are emailed once when a running session will stop within this window
+EXPIRY_WARNING_MINUTES = float(os.getenv("EXPIRY_WARNING_MINUTES", "60"))
+EXPIRY_WARNING_INTERVAL_SECONDS = float(
+    os.getenv("EXPIRY_WARNING_INTERVAL_SECONDS", "60")
+)
+EXPIRY_EXTEND_HOURS = int(
+    os.getenv("EXPIRY_EXTEND_HOURS", "24")
+)  # Added by the email's extend link
+EXPIRY_MAX_EXTENSIONS = int(os.getenv("EXPIRY_MAX_EXTENSIONS", "3"))  # Per session
+# Public address of the portal, used for links in emails
+PORTAL_BASE_URL = os.getenv(
+    "PORTAL_BASE_URL", f"http://localhost:{UVICORN_PORT}"
+).rstrip("/")
@@ -0,0 +1,50 @@
+import secrets
+
+from app.db.database import get_db
+
+
+class ChangeCounters:
+    """
+    Per-table change versions used to build ETags for the JSON API.
+
+    The versions live in the ``table_versions`` table and are bumped by
+    triggers on every INSERT, UPDATE and DELETE (see migration 9), so a
+    write from any process (the cleanup script, another portal worker)
+    changes them and clients polling with If-None-Match see it. Reading
+    them is one primary-key lookup. The epoch changes on every restart so
+    an ETag never outlives configuration that also shapes the responses.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+
+    def _versions(self, tables) -> dict:
+        placeholders = ", ".join("?" for _ in tables)
+        db = get_db()
+        try:
+            rows = db.execute(
+                f"SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders})",
+                list(tables),
+            ).fetchall()
+        finally:
+            db.close()
+        return {row["table_name"]: row["version"] for row in rows}
+
+    def version(self, *tables: str) -> str:
+        """Combined version of ``tables``, e.g. '3.12'."""
+        versions = self._versions(tables)
+        return ".".join(str(versions.get(table, 0)) for table in tables)
+
+    def etag(self, scope: str, *tables: str) -> str:
+        """Weak ETag for a response that depends only on ``tables`` and ``scope``."""
+        return f'W/"{self.epoch}-{scope}-{self.version(*tables)}"'
+
+    def stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "versions": self._versions(("users", "user_instances")),
+        }
+
+
+# Global change counters, read by the API and the admin summary
+change_counters = ChangeCounters()
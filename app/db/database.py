@@ -1,173 +1,97 @@
 # filepath: /Users/mani/work/rstudio-portal/app/db/database.py
-import sqlite3
 import logging
+import sqlite3
+import time
 from datetime import datetime, timezone
 from app.core.config import (
     DATABASE_PATH,
     INITIAL_ADMIN_USERNAME,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_BUSY_TIMEOUT_MS,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_LOCK_RETRIES,
 )
+from app.db.pool import ConnectionPool
+from app.db.migrations import run_migrations
+from app.db.records import register_sqlite_types
 
 logger = logging.getLogger(__name__)
 
+# DATETIME columns are written in one format and read back as datetimes
+register_sqlite_types()
 
-def get_db():
-    # Ensure the parent directory for the database file exists
-    db_path_obj = DATABASE_PATH
-    db_path_obj.parent.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Connecting to database at: {db_path_obj}")
-    db = sqlite3.connect(str(db_path_obj))  # Use str() for Path object
-    db.row_factory = sqlite3.Row
-    return db
+# Shared pool; connections are opened lazily on first checkout
+_pool = ConnectionPool(
+    DATABASE_PATH,
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT_SECONDS,
+    busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+    cached_statements=DB_STATEMENT_CACHE_SIZE,
+    lock_retries=DB_LOCK_RETRIES,
+    detect_types=sqlite3.PARSE_DECLTYPES,
+)
 
+_AUTO_VACUUM_INCREMENTAL = 2
 
-def init_db():
-    # Ensure the parent directory for the database file exists before connecting
-    db_path_obj = DATABASE_PATH
-    db_path_obj.parent.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Initializing database at: {db_path_obj}")
-
-    conn = sqlite3.connect(str(db_path_obj))
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE NOT NULL,
-        is_admin BOOLEAN DEFAULT FALSE,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        last_login DATETIME,
-        lab_name TEXT
-    )
-    """
-    )
-    cursor.execute(
-        """
-    CREATE TABLE IF NOT EXISTS user_instances (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        container_name TEXT NOT NULL,
-        container_id TEXT,
-        port INTEGER NOT NULL,
-        password TEXT NOT NULL,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        expires_at DATETIME,
-        status TEXT DEFAULT 'requested',
-        stopped_at DATETIME,
-        instance_type TEXT DEFAULT 'rstudio',
-        memory_limit TEXT DEFAULT '16g',
-        cpu_limit TEXT DEFAULT '2.0',
-        storage_limit TEXT DEFAULT '200G',
-        session_days INTEGER DEFAULT 2,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
+
+def incremental_vacuum_enabled(conn) -> bool:
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == _AUTO_VACUUM_INCREMENTAL
+
+
+def enable_incremental_vacuum(conn) -> bool:
     """
-    )
+    Switch an existing database file to ``auto_vacuum = INCREMENTAL``.
 
-    # OTP tokens table
-    cursor.execute(
-        """
-    CREATE TABLE IF NOT EXISTS otp_tokens (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT NOT NULL,
-        token TEXT NOT NULL,
-        expires_at DATETIME NOT NULL,
-        attempts INTEGER DEFAULT 0,
-        used BOOLEAN DEFAULT FALSE,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
+    The mode only takes effect after a full VACUUM, which rewrites the
+    file and holds the write lock until it finishes, so this is only run
+    by scripts/enable_incremental_vacuum.py. Returns True if the file was
+    rebuilt.
     """
+    if incremental_vacuum_enabled(conn):
+        return False
+    started = time.monotonic()
+    conn.commit()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    logger.info(
+        f"Rebuilt the database for incremental vacuum in {time.monotonic() - started:.1f}s."
     )
-    # Check and add 'instance_type' column if it doesn't exist
-    cursor.execute("PRAGMA table_info(user_instances)")
-    columns = [column[1] for column in cursor.fetchall()]
-    if "instance_type" not in columns:
-        cursor.execute(
-            "ALTER TABLE user_instances ADD COLUMN instance_type TEXT DEFAULT 'rstudio'"
-        )
-        logger.info("Added 'instance_type' column to 'user_instances' table.")
-
-    # Add resource limit columns if they don't exist
-    if "memory_limit" not in columns:
-        cursor.execute(
-            "ALTER TABLE user_instances ADD COLUMN memory_limit TEXT DEFAULT '16g'"
-        )
-        logger.info("Added 'memory_limit' column to 'user_instances' table.")
-
-    if "cpu_limit" not in columns:
-        cursor.execute(
-            "ALTER TABLE user_instances ADD COLUMN cpu_limit TEXT DEFAULT '2.0'"
-        )
-        logger.info("Added 'cpu_limit' column to 'user_instances' table.")
-
-    if "storage_limit" not in columns:
-        cursor.execute(
-            "ALTER TABLE user_instances ADD COLUMN storage_limit TEXT DEFAULT '200G'"
-        )
-        logger.info("Added 'storage_limit' column to 'user_instances' table.")
-
-    # Add session_days column if it doesn't exist
-    if "session_days" not in columns:
-        cursor.execute(
-            "ALTER TABLE user_instances ADD COLUMN session_days INTEGER DEFAULT 2"
-        )
-        logger.info("Added 'session_days' column to 'user_instances' table.")
-
-    # Migration: Update lab_name constraint to allow NULL values
-    # Check if lab_name constraint needs to be updated (for existing databases)
-    cursor.execute("PRAGMA table_info(users)")
-    user_columns = {col[1]: col for col in cursor.fetchall()}
-
-    if "lab_name" in user_columns:
-        # Check if lab_name has NOT NULL constraint by attempting to insert NULL
-        try:
-            cursor.execute(
-                "INSERT INTO users (email, lab_name) VALUES ('test_null_check', NULL)"
-            )
-            cursor.execute("DELETE FROM users WHERE email = 'test_null_check'")
-            logger.info("lab_name column already allows NULL values.")
-        except sqlite3.IntegrityError:
-            # If we get here, lab_name has NOT NULL constraint and needs migration
-            logger.info("Migrating lab_name column to allow NULL values...")
+    return True
 
-            # Backup existing data
-            cursor.execute("CREATE TEMPORARY TABLE users_backup AS SELECT * FROM users")
 
-            # Drop and recreate the users table with updated schema
-            cursor.execute("DROP TABLE users")
-            cursor.execute(
-                """
-                CREATE TABLE users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    email TEXT UNIQUE NOT NULL,
-                    is_admin BOOLEAN DEFAULT FALSE,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    last_login DATETIME,
-                    lab_name TEXT
-                )
-                """
-            )
+def get_db():
+    """Check out a pooled connection. Call close() to return it to the pool."""
+    return _pool.connect()
+
+
+def get_pool_stats() -> dict:
+    """Counters for the shared connection pool (checkouts, waits, lock retries)."""
+    return _pool.stats()
+
 
-            # Restore data from backup
+def close_db_pool():
+    _pool.close_all()
+
+
+def init_db():
+    logger.info(f"Initializing database at: {DATABASE_PATH}")
+
+    conn = get_db()
+    try:
+        run_migrations(conn)
+
+        # Create initial admin user if not exists
+        admin_email = INITIAL_ADMIN_USERNAME
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM users WHERE email = ?", (admin_email,))
+        if not cursor.fetchone():
             cursor.execute(
-                """
-                INSERT INTO users (id, email, is_admin, created_at, last_login, lab_name)
-                SELECT id, email, is_admin, created_at, last_login, lab_name FROM users_backup
-                """
+                "INSERT INTO users (email, is_admin, created_at, lab_name) VALUES (?, ?, ?, ?)",
+                (admin_email, True, datetime.now(timezone.utc), "GeDaC"),
             )
-
-            # Drop backup table
-            cursor.execute("DROP TABLE users_backup")
-            logger.info("Successfully migrated lab_name column to allow NULL values.")
-
-    # Create initial admin user if not exists
-    admin_email = INITIAL_ADMIN_USERNAME
-    cursor.execute("SELECT * FROM users WHERE email = ?", (admin_email,))
-    if not cursor.fetchone():
-        cursor.execute(
-            "INSERT INTO users (email, is_admin, created_at, lab_name) VALUES (?, ?, ?, ?)",
-            (admin_email, True, datetime.now(timezone.utc), "GeDaC"),
-        )
-        logger.info(f"Admin user {admin_email} created.")
-    conn.commit()
-    conn.close()
+            logger.info(f"Admin user {admin_email} created.")
+        conn.commit()
+    finally:
+        conn.close()
     logger.info("Database initialized.")
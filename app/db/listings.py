@@ -0,0 +1,284 @@
+import base64
+import json
+import threading
+from datetime import date, datetime, timedelta
+
+from app.db.database import get_db
+from app.db.changes import change_counters
+from app.db.records import InstanceRecord, UserRecord, adapt_datetime
+from app.containers.instance_types import INSTANCE_TYPES
+
+INSTANCE_STATUSES = (
+    "requested",
+    "starting",
+    "running",
+    "stopped",
+    "stopped_expired",
+    "error",
+)
+
+# sort name -> (column, direction, label). Every sort is on an indexed
+# column with the row id as tie-breaker, so a page is one index range scan.
+INSTANCE_SORTS = {
+    "newest": ("created_at", "DESC", "Newest first"),
+    "oldest": ("created_at", "ASC", "Oldest first"),
+    "expiring": ("expires_at", "ASC", "Expiring soonest"),
+}
+
+_INSTANCE_COLUMNS = """
+    ui.id, ui.user_id, ui.container_name, ui.container_id, ui.port, ui.password,
+    ui.created_at, ui.expires_at, ui.status, ui.stopped_at, ui.instance_type,
+    ui.memory_limit, ui.cpu_limit, ui.storage_limit, ui.session_days,
+    u.email AS owner_email, u.lab_name AS owner_lab
+"""
+
+
+def encode_cursor(value, row_id: int) -> str:
+    if isinstance(value, datetime):
+        # Compared against the stored text, so use the stored format
+        value = adapt_datetime(value)
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (value, id) from a cursor, or None if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+class InstanceFilters:
+    """Validated filter and sort options for the admin instance listing."""
+
+    def __init__(
+        self,
+        status=None,
+        instance_type=None,
+        lab=None,
+        owner=None,
+        created_from=None,
+        created_to=None,
+        sort="newest",
+    ):
+        self.status = status if status in INSTANCE_STATUSES else None
+        self.instance_type = instance_type if instance_type in INSTANCE_TYPES else None
+        self.lab = lab or None
+        self.owner = owner.strip().lower() if owner and owner.strip() else None
+        self.created_from = _parse_date(created_from)
+        self.created_to = _parse_date(created_to)
+        self.sort = sort if sort in INSTANCE_SORTS else "newest"
+
+    @classmethod
+    def from_query(cls, params) -> "InstanceFilters":
+        return cls(
+            status=params.get("status"),
+            instance_type=params.get("instance_type"),
+            lab=params.get("lab"),
+            owner=params.get("owner"),
+            created_from=params.get("created_from"),
+            created_to=params.get("created_to"),
+            sort=params.get("sort"),
+        )
+
+    def as_params(self) -> dict:
+        """Non-default options, for building page links."""
+        params = {
+            "status": self.status,
+            "instance_type": self.instance_type,
+            "lab": self.lab,
+            "owner": self.owner,
+            "created_from": (
+                self.created_from.isoformat() if self.created_from else None
+            ),
+            "created_to": self.created_to.isoformat() if self.created_to else None,
+            "sort": self.sort if self.sort != "newest" else None,
+        }
+        return {key: value for key, value in params.items() if value}
+
+    def where_clause(self):
+        clauses, params = [], []
+        if self.status:
+            clauses.append("ui.status = ?")
+            params.append(self.status)
+        if self.instance_type:
+            clauses.append("ui.instance_type = ?")
+            params.append(self.instance_type)
+        if self.lab:
+            clauses.append("ui.user_id IN (SELECT id FROM users WHERE lab_name = ?)")
+            params.append(self.lab)
+        if self.owner:
+            # Prefix match as a range, so the unique index on email is used
+            clauses.append(
+                "ui.user_id IN (SELECT id FROM users WHERE email >= ? AND email < ?)"
+            )
+            params.extend([self.owner, self.owner + "\uffff"])
+        if self.created_from:
+            clauses.append("ui.created_at >= ?")
+            params.append(self.created_from.isoformat())
+        if self.created_to:
+            clauses.append("ui.created_at < ?")
+            params.append((self.created_to + timedelta(days=1)).isoformat())
+        if INSTANCE_SORTS[self.sort][0] == "expires_at":
+            clauses.append("ui.expires_at IS NOT NULL")
+        return clauses, params
+
+
+def fetch_instance_page(
+    filters: InstanceFilters, after: str = None, before: str = None, limit: int = 50
+) -> dict:
+    """
+    One page of instances using keyset pagination.
+
+    ``after``/``before`` are cursors from a previous page's ``next``/``prev``.
+    The page is read with ``(sort column, id)`` past the cursor, so its cost
+    does not depend on how far into the history it is.
+    """
+    column, direction, _ = INSTANCE_SORTS[filters.sort]
+    clauses, params = filters.where_clause()
+
+    backwards = before is not None and after is None
+    cursor = (
+        decode_cursor(before if backwards else after) if (after or before) else None
+    )
+    ascending = (direction == "ASC") != backwards
+    if cursor is not None:
+        comparison = ">" if ascending else "<"
+        clauses.append(f"(ui.{column}, ui.id) {comparison} (?, ?)")
+        params.extend(cursor)
+
+    order = "ASC" if ascending else "DESC"
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    db = get_db()
+    try:
+        rows = db.execute(
+            f"""SELECT {_INSTANCE_COLUMNS}
+                FROM user_instances ui JOIN users u ON ui.user_id = u.id
+                {where}
+                ORDER BY ui.{column} {order}, ui.id {order}
+                LIMIT ?""",
+            params + [limit + 1],
+        ).fetchall()
+    finally:
+        db.close()
+
+    more = len(rows) > limit
+    records = [InstanceRecord.from_row(row) for row in rows[:limit]]
+    if backwards:
+        records.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = cursor is not None, more
+    first, last = (records[0], records[-1]) if records else (None, None)
+    return {
+        "instances": records,
+        "next": (
+            encode_cursor(getattr(last, column), last.id) if has_next and last else None
+        ),
+        "prev": (
+            encode_cursor(getattr(first, column), first.id)
+            if has_prev and first
+            else None
+        ),
+    }
+
+
+def fetch_user_page(after: str = None, before: str = None, limit: int = 50) -> dict:
+    """One page of users ordered by id, with their instance counts."""
+    backwards = before is not None and after is None
+    cursor = (
+        decode_cursor(before if backwards else after) if (after or before) else None
+    )
+    where, params = "", []
+    if cursor is not None:
+        where = "WHERE id < ?" if backwards else "WHERE id > ?"
+        params.append(cursor[1])
+    order = "DESC" if backwards else "ASC"
+
+    db = get_db()
+    try:
+        rows = db.execute(
+            f"""SELECT id, email, is_admin, created_at, last_login, lab_name
+                FROM users {where} ORDER BY id {order} LIMIT ?""",
+            params + [limit + 1],
+        ).fetchall()
+        more = len(rows) > limit
+        users = [UserRecord.from_row(row) for row in rows[:limit]]
+        if backwards:
+            users.reverse()
+        activity = {}
+        if users:
+            placeholders = ", ".join("?" for _ in users)
+            activity = {
+                row["user_id"]: row
+                for row in db.execute(
+                    f"""SELECT user_id, COUNT(*) AS total,
+                               SUM(status = 'running') AS running
+                        FROM user_instances WHERE user_id IN ({placeholders})
+                        GROUP BY user_id""",
+                    [user.id for user in users],
+                ).fetchall()
+            }
+    finally:
+        db.close()
+
+    for user in users:
+        counts = activity.get(user.id)
+        user.instance_count = counts["total"] if counts else 0
+        user.running_count = counts["running"] if counts else 0
+    has_prev, has_next = (more, True) if backwards else (cursor is not None, more)
+    return {
+        "users": users,
+        "next": encode_cursor(None, users[-1].id) if has_next and users else None,
+        "prev": encode_cursor(None, users[0].id) if has_prev and users else None,
+    }
+
+
+_summary_lock = threading.Lock()
+_summary_cache = {"version": None, "summary": None}
+
+
+def admin_summary() -> dict:
+    """
+    Instance counts per status and user/admin totals for the overview cards.
+
+    Recomputed only after ``user_instances`` or ``users`` changed (see
+    ChangeCounters), so repeated page loads do not re-count the history.
+    """
+    version = change_counters.version("user_instances", "users")
+    with _summary_lock:
+        if _summary_cache["version"] == version:
+            return _summary_cache["summary"]
+    db = get_db()
+    try:
+        by_status = {
+            row["status"]: row["count"]
+            for row in db.execute(
+                "SELECT status, COUNT(*) AS count FROM user_instances GROUP BY status"
+            ).fetchall()
+        }
+        users = db.execute(
+            "SELECT COUNT(*) AS users, COALESCE(SUM(is_admin), 0) AS admins FROM users"
+        ).fetchone()
+    finally:
+        db.close()
+    summary = {
+        "by_status": by_status,
+        "instances": sum(by_status.values()),
+        "users": users["users"],
+        "admins": users["admins"],
+    }
+    with _summary_lock:
+        _summary_cache["version"] = version
+        _summary_cache["summary"] = summary
+    return summary
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from app.core.config import (
+    DB_MAINTENANCE_INTERVAL_MINUTES,
+    DB_MAINTENANCE_BATCH_SIZE,
+    DB_VACUUM_PAGES_PER_RUN,
+)
+from app.db.database import get_db, incremental_vacuum_enabled
+
+logger = logging.getLogger(__name__)
+
+# The first run waits for startup (image pulls, warm pool) to settle
+_STARTUP_DELAY_SECONDS = 60
+# Cleanup batches per table and run; the rest is left for the next run
+_MAX_BATCHES_PER_RUN = 200
+# Pause between batches so requests waiting for the write lock get a turn
+_BATCH_PAUSE_SECONDS = 0.05
+# Size samples kept for /admin/db-stats (two days at the default interval)
+_HISTORY_SIZE = 48
+
+
+class DatabaseMaintenance:
+    """
+    Keeps the SQLite file from growing without bound.
+
+    Every ``interval_seconds`` the registered cleanups delete old rows in
+    batches of ``batch_size``, each in its own short write transaction, so
+    provisioning and logins are never held up behind one long DELETE. The
+    pages freed are then returned to the filesystem with
+    ``PRAGMA incremental_vacuum`` (at most ``vacuum_pages`` per run) and
+    ``PRAGMA optimize`` refreshes the planner statistics. Databases created
+    before incremental vacuum was used skip that step until they are
+    converted with scripts/enable_incremental_vacuum.py. Each run records
+    the file size and row counts, so growth can be followed in
+    ``/admin/db-stats``.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = DB_MAINTENANCE_INTERVAL_MINUTES * 60,
+        batch_size: int = DB_MAINTENANCE_BATCH_SIZE,
+        vacuum_pages: int = DB_VACUUM_PAGES_PER_RUN,
+    ):
+        self.interval_seconds = interval_seconds
+        self.batch_size = max(1, batch_size)
+        self.vacuum_pages = max(0, vacuum_pages)
+        self._cleanups = {}
+        self._task = None
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=_HISTORY_SIZE)
+        self._last_run = None
+        self._incremental = None
+        self._counters = {
+            "runs": 0,
+            "failed_runs": 0,
+            "deleted_rows": 0,
+            "vacuumed_pages": 0,
+        }
+
+    def add_cleanup(self, table: str, cleanup):
+        """
+        Register ``cleanup(limit) -> int`` deleting at most ``limit`` old rows
+        of ``table`` and returning how many it deleted.
+        """
+        self._cleanups[table] = cleanup
+
+    def start(self):
+        """Must be called from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        await asyncio.sleep(min(_STARTUP_DELAY_SECONDS, self.interval_seconds))
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception:
+                with self._lock:
+                    self._counters["failed_runs"] += 1
+                logger.error("Database maintenance run failed", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def run_once(self) -> dict:
+        """Clean up, vacuum and optimize once; returns the size sample taken."""
+        started = time.monotonic()
+        deleted = {
+            table: self._clean(table, cleanup)
+            for table, cleanup in self._cleanups.items()
+        }
+        db = get_db()
+        try:
+            vacuumed = self._vacuum(db)
+            db.execute("PRAGMA optimize")
+            sample = self._sample(db)
+        finally:
+            db.close()
+        sample["deleted"] = deleted
+        sample["seconds"] = round(time.monotonic() - started, 3)
+        with self._lock:
+            self._history.append(sample)
+            self._last_run = sample["at"]
+            self._counters["runs"] += 1
+            self._counters["deleted_rows"] += sum(deleted.values())
+            self._counters["vacuumed_pages"] += vacuumed
+        if any(deleted.values()) or vacuumed:
+            logger.info(
+                f"Database maintenance deleted {deleted}, vacuumed {vacuumed} page(s); "
+                f"file is {sample['file_bytes']} bytes."
+            )
+        return sample
+
+    def _clean(self, table: str, cleanup) -> int:
+        total = 0
+        for _ in range(_MAX_BATCHES_PER_RUN):
+            try:
+                deleted = cleanup(self.batch_size)
+            except sqlite3.Error:
+                logger.error(f"Cleanup of {table} failed", exc_info=True)
+                break
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            time.sleep(_BATCH_PAUSE_SECONDS)
+        return total
+
+    def _vacuum(self, db) -> int:
+        if not self.vacuum_pages:
+            return 0
+        incremental = incremental_vacuum_enabled(db)
+        if not incremental and self._incremental is None:
+            logger.warning(
+                "The database does not use incremental vacuum, so freed pages stay in the file. "
+                "Run scripts/enable_incremental_vacuum.py while the portal is stopped."
+            )
+        self._incremental = incremental
+        if not incremental:
+            return 0
+        free_before = db.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free_before:
+            return 0
+        # execute() steps the pragma once, freeing a single page;
+        # executescript() runs it to completion
+        db.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})")
+        # In WAL mode the file only shrinks once the WAL is checkpointed
+        db.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        return free_before - db.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def _sample(self, db) -> dict:
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        page_count = db.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = db.execute("PRAGMA freelist_count").fetchone()[0]
+        rows = {
+            table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in self._cleanups
+        }
+        return {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "file_bytes": page_size * page_count,
+            "free_bytes": page_size * free_pages,
+            "rows": rows,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "interval_seconds": self.interval_seconds,
+                "incremental_vacuum": self._incremental,
+                "last_run": self._last_run,
+                "history": list(self._history),
+            }
+
+
+# Global maintenance job, started with the application
+database_maintenance = DatabaseMaintenance()
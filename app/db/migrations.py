@@ -0,0 +1,362 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _create_base_schema(cursor):
+    """Tables as they existed before versioned migrations, plus legacy upgrades."""
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        is_admin BOOLEAN DEFAULT FALSE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_login DATETIME,
+        lab_name TEXT
+    )
+    """
+    )
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS user_instances (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        container_name TEXT NOT NULL,
+        container_id TEXT,
+        port INTEGER NOT NULL,
+        password TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expires_at DATETIME,
+        status TEXT DEFAULT 'requested',
+        stopped_at DATETIME,
+        instance_type TEXT DEFAULT 'rstudio',
+        memory_limit TEXT DEFAULT '16g',
+        cpu_limit TEXT DEFAULT '2.0',
+        storage_limit TEXT DEFAULT '200G',
+        session_days INTEGER DEFAULT 2,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """
+    )
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS otp_tokens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL,
+        token TEXT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        attempts INTEGER DEFAULT 0,
+        used BOOLEAN DEFAULT FALSE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    )
+
+    # Databases created by older releases may lack later columns
+    cursor.execute("PRAGMA table_info(user_instances)")
+    columns = {column[1] for column in cursor.fetchall()}
+    for name, definition in (
+        ("instance_type", "TEXT DEFAULT 'rstudio'"),
+        ("memory_limit", "TEXT DEFAULT '16g'"),
+        ("cpu_limit", "TEXT DEFAULT '2.0'"),
+        ("storage_limit", "TEXT DEFAULT '200G'"),
+        ("session_days", "INTEGER DEFAULT 2"),
+    ):
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE user_instances ADD COLUMN {name} {definition}")
+            logger.info(f"Added '{name}' column to 'user_instances' table.")
+
+    # Older releases declared users.lab_name NOT NULL; rebuild the table
+    # so users can log in before choosing a lab
+    cursor.execute("PRAGMA table_info(users)")
+    user_columns = {col[1]: col for col in cursor.fetchall()}
+    lab_name = user_columns.get("lab_name")
+    if lab_name is not None and lab_name[3]:
+        logger.info("Migrating lab_name column to allow NULL values...")
+        cursor.execute("CREATE TEMPORARY TABLE users_backup AS SELECT * FROM users")
+        cursor.execute("DROP TABLE users")
+        cursor.execute(
+            """
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT UNIQUE NOT NULL,
+                is_admin BOOLEAN DEFAULT FALSE,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_login DATETIME,
+                lab_name TEXT
+            )
+            """
+        )
+        cursor.execute(
+            """
+            INSERT INTO users (id, email, is_admin, created_at, last_login, lab_name)
+            SELECT id, email, is_admin, created_at, last_login, lab_name FROM users_backup
+            """
+        )
+        cursor.execute("DROP TABLE users_backup")
+        logger.info("Successfully migrated lab_name column to allow NULL values.")
+
+
+def _add_lookup_indexes(cursor):
+    """Indexes for the status, per-user, expiry and OTP lookups."""
+    # Capacity counts and port/orphan scans filter on status alone
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_instances_status "
+        "ON user_instances (status)"
+    )
+    # Per-user limit checks and dashboard listings
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_instances_user_status "
+        "ON user_instances (user_id, status)"
+    )
+    # Expiry scans: status IN (...) AND expires_at < now
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_instances_status_expires "
+        "ON user_instances (status, expires_at)"
+    )
+    # Latest unused OTP for an email
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_otp_tokens_email_created "
+        "ON otp_tokens (email, created_at)"
+    )
+    # OTP cleanup by age
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_otp_tokens_expires "
+        "ON otp_tokens (expires_at)"
+    )
+
+
+def _add_readiness_columns(cursor):
+    """When the IDE first answered, and how long that took after start."""
+    cursor.execute("PRAGMA table_info(user_instances)")
+    columns = {column[1] for column in cursor.fetchall()}
+    if "ready_at" not in columns:
+        cursor.execute("ALTER TABLE user_instances ADD COLUMN ready_at DATETIME")
+    if "ready_seconds" not in columns:
+        cursor.execute("ALTER TABLE user_instances ADD COLUMN ready_seconds REAL")
+
+
+def _create_image_cache(cursor):
+    """Digests of the IDE images pulled on this host (see ImageManager)."""
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS image_cache (
+        image TEXT NOT NULL,
+        image_id TEXT NOT NULL,
+        repo_digest TEXT,
+        first_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (image, image_id)
+    )
+    """
+    )
+
+
+def _add_listing_indexes(cursor):
+    """Indexes for the paginated, filtered admin listing (app/db/listings.py)."""
+    # Unfiltered pages ordered by creation time (rowid breaks ties)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_instances_created "
+        "ON user_instances (created_at)"
+    )
+    # Status filter; also serves status-only lookups, replacing the
+    # single-column index from migration 2
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_instances_status_created "
+        "ON user_instances (status, created_at)"
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_user_instances_status")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_instances_type_created "
+        "ON user_instances (instance_type, created_at)"
+    )
+    # Owner and lab filters resolve to user ids first
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_instances_user_created "
+        "ON user_instances (user_id, created_at)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_lab ON users (lab_name)")
+
+
+# DATETIME columns, rewritten by _normalize_timestamps
+TIMESTAMP_COLUMNS = {
+    "users": ("created_at", "last_login"),
+    "user_instances": ("created_at", "expires_at", "stopped_at", "ready_at"),
+    "otp_tokens": ("created_at", "expires_at"),
+}
+
+
+def _normalize_timestamps(cursor):
+    """
+    Rewrite every stored timestamp as UTC 'YYYY-MM-DD HH:MM:SS'.
+
+    Older releases stored Python datetimes through sqlite3's default adapter
+    ('...HH:MM:SS.ffffff+00:00') next to CURRENT_TIMESTAMP values; from now
+    on the adapter in app/db/records.py writes the SQLite format.
+    """
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for column in columns:
+            normalized = f"strftime('%Y-%m-%d %H:%M:%S', {column})"
+            cursor.execute(
+                f"UPDATE {table} SET {column} = {normalized} "
+                f"WHERE {column} IS NOT NULL AND {column} <> {normalized}"
+            )
+            if cursor.rowcount:
+                logger.info(f"Normalized {cursor.rowcount} {table}.{column} values.")
+
+
+def _create_email_outbox(cursor):
+    """Queued outgoing email, drained by the EmailOutbox sender (app/mail/outbox.py)."""
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        subject TEXT,
+        body_text TEXT,
+        body_html TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        queued_at REAL NOT NULL,
+        next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expires_at DATETIME,
+        sent_at DATETIME,
+        smtp_seconds REAL,
+        delivery_seconds REAL
+    )
+    """
+    )
+    # The sender's claim query: due rows in 'pending' or with a lapsed lease
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_email_outbox_due "
+        "ON email_outbox (status, next_attempt_at)"
+    )
+
+
+def _add_expiry_warning_column(cursor):
+    """When the owner was warned that the session is about to expire."""
+    # Found with the (status, expires_at) index; reset when the session is extended
+    cursor.execute("PRAGMA table_info(user_instances)")
+    columns = {column[1] for column in cursor.fetchall()}
+    if "expiry_warned_at" not in columns:
+        cursor.execute(
+            "ALTER TABLE user_instances ADD COLUMN expiry_warned_at DATETIME"
+        )
+
+
+def _create_change_versions(cursor):
+    """
+    Per-table write counters kept by triggers, so ETags and cached
+    summaries see writes from every process (cleanup script included).
+    """
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """
+    )
+    for table in ("users", "user_instances"):
+        cursor.execute(
+            "INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)",
+            (table,),
+        )
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(
+                f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_versions SET version = version + 1
+                WHERE table_name = '{table}';
+            END
+            """
+            )
+
+
+def _add_extension_count_column(cursor):
+    """How many times the session was extended from an expiry warning."""
+    cursor.execute("PRAGMA table_info(user_instances)")
+    columns = {column[1] for column in cursor.fetchall()}
+    if "extension_count" not in columns:
+        cursor.execute(
+            "ALTER TABLE user_instances ADD COLUMN extension_count INTEGER NOT NULL DEFAULT 0"
+        )
+
+
+# Ordered list of (version, description, function). Append new migrations
+# with the next version number; never edit or reorder applied ones.
+MIGRATIONS = [
+    (1, "base schema", _create_base_schema),
+    (2, "lookup indexes", _add_lookup_indexes),
+    (3, "instance readiness columns", _add_readiness_columns),
+    (4, "image digest cache", _create_image_cache),
+    (5, "admin listing indexes", _add_listing_indexes),
+    (6, "normalize timestamps", _normalize_timestamps),
+    (7, "email outbox", _create_email_outbox),
+    (8, "expiry warning column", _add_expiry_warning_column),
+    (9, "table change versions", _create_change_versions),
+    (10, "instance extension count", _add_extension_count_column),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn) -> int:
+    """
+    Bring the schema up to LATEST_VERSION and return the number of
+    migrations applied.
+
+    The current version is read from ``PRAGMA user_version`` (a single
+    header read), so an up-to-date database costs one query at startup.
+    Each migration runs in its own transaction together with its
+    ``schema_version`` row and the ``user_version`` bump.
+    """
+    current = get_schema_version(conn)
+    if current >= LATEST_VERSION:
+        logger.info(f"Database schema is current (version {current}).")
+        return 0
+
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    )
+    conn.commit()
+
+    applied = 0
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migrate(conn.cursor())
+            conn.execute(
+                "INSERT OR REPLACE INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description),
+            )
+            # PRAGMA does not accept bound parameters; version is an int
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Schema migration {version} failed; rolled back.")
+            raise
+        applied += 1
+
+    logger.info(f"Database schema migrated from version {current} to {LATEST_VERSION}.")
+    return applied
@@ -0,0 +1,262 @@
+import sqlite3
+import logging
+import threading
+import time
+from pathlib import Path
+from queue import LifoQueue, Empty, Full
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+def _is_lock_error(exc: sqlite3.OperationalError) -> bool:
+    message = str(exc).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+class PooledCursor:
+    """Cursor wrapper that retries statements hitting a locked database."""
+
+    def __init__(self, pool: "ConnectionPool", cursor: sqlite3.Cursor):
+        self._pool = pool
+        self._cursor = cursor
+
+    def execute(self, sql, parameters=()):
+        self._pool._with_lock_retry(self._cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._pool._with_lock_retry(self._cursor.executemany, sql, seq_of_parameters)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """
+    Connection checked out from a ConnectionPool.
+
+    Exposes the subset of the sqlite3.Connection API used by the app. Calling
+    close() hands the underlying connection back to the pool instead of
+    closing it, so callers keep the familiar get_db() ... db.close() pattern.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return self._conn
+
+    def execute(self, sql, parameters=()):
+        return self._pool._with_lock_retry(self._connection().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._pool._with_lock_retry(
+            self._connection().executemany, sql, seq_of_parameters
+        )
+
+    def executescript(self, sql_script):
+        return self._pool._with_lock_retry(self._connection().executescript, sql_script)
+
+    def cursor(self) -> PooledCursor:
+        return PooledCursor(self._pool, self._connection().cursor())
+
+    def commit(self):
+        self._pool._with_lock_retry(self._connection().commit)
+
+    def rollback(self):
+        self._connection().rollback()
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool._release(conn)
+
+    def __getattr__(self, name):
+        return getattr(self._connection(), name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Mirror sqlite3.Connection: commit on success, roll back on error.
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __del__(self):
+        if self._conn is not None:
+            logger.warning("Pooled database connection was not closed; reclaiming it.")
+            self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived SQLite connections in WAL mode.
+
+    Connections are created lazily up to ``size``. When all are checked out,
+    callers wait up to ``timeout`` seconds for one to be returned. Each
+    connection keeps its own prepared statement cache (``cached_statements``),
+    which is only useful because connections now outlive a single request.
+    """
+
+    def __init__(
+        self,
+        database: Path,
+        size: int = 8,
+        timeout: float = 10.0,
+        busy_timeout_ms: int = 5000,
+        cached_statements: int = 256,
+        lock_retries: int = 3,
+        detect_types: int = 0,
+    ):
+        self.database = Path(database)
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.lock_retries = lock_retries
+        self.detect_types = detect_types
+
+        self._idle: LifoQueue = LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "lock_retries": 0,
+            "connections_created": 0,
+        }
+
+    def _new_connection(self) -> sqlite3.Connection:
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Opening pooled database connection to: {self.database}")
+        conn = sqlite3.connect(
+            str(self.database),
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,  # Connections move between threads via the pool
+            cached_statements=self.cached_statements,
+            detect_types=self.detect_types,
+        )
+        conn.row_factory = sqlite3.Row
+        # Applies only to a new, empty file (so it must precede WAL); existing
+        # files are converted with scripts/enable_incremental_vacuum.py
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _bump(self, key: str, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _with_lock_retry(self, fn, *args):
+        delay = 0.05
+        for attempt in range(self.lock_retries + 1):
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as e:
+                if not _is_lock_error(e) or attempt == self.lock_retries:
+                    raise
+                self._bump("lock_retries")
+                logger.warning(
+                    f"Database locked, retrying in {delay:.2f}s "
+                    f"(attempt {attempt + 1}/{self.lock_retries})"
+                )
+                time.sleep(delay)
+                delay *= 2
+
+    def connect(self) -> PooledConnection:
+        """Check a connection out of the pool, creating or waiting as needed."""
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            create = False
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+            if create:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                self._bump("connections_created")
+            else:
+                self._bump("waits")
+                started = time.monotonic()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except Empty:
+                    self._bump("timeouts")
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s "
+                        f"(pool size {self.size})"
+                    )
+                finally:
+                    self._bump("wait_seconds", time.monotonic() - started)
+
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._in_use += 1
+        return PooledConnection(self, conn)
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, Full) as e:
+            logger.warning(f"Discarding pooled database connection: {e}")
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        """Return a snapshot of pool counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["wait_seconds"] = round(snapshot["wait_seconds"], 4)
+            snapshot.update(
+                size=self.size,
+                open_connections=self._created,
+                in_use=self._in_use,
+                idle=self._idle.qsize(),
+            )
+        return snapshot
+
+    def close_all(self):
+        """Close every idle connection (used on application shutdown)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            conn.close()
@@ -0,0 +1,111 @@
+import logging
+import sqlite3
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# The one format every DATETIME column is stored in: UTC, second precision,
+# exactly what SQLite's CURRENT_TIMESTAMP and datetime('now') produce, so
+# values written from Python and from SQL compare and sort as text.
+DB_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def adapt_datetime(value: datetime) -> str:
+    """Store a datetime in DB_TIMESTAMP_FORMAT (naive values are taken as UTC)."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime(DB_TIMESTAMP_FORMAT)
+
+
+def convert_datetime(value: bytes):
+    """Read a DATETIME column as an aware UTC datetime."""
+    try:
+        parsed = datetime.fromisoformat(value.decode())
+    except ValueError:
+        logger.warning(f"Unreadable DATETIME value {value!r}; returning None")
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def register_sqlite_types():
+    """
+    Register the datetime adapter and the DATETIME converter.
+
+    Only connections opened with ``detect_types=sqlite3.PARSE_DECLTYPES``
+    convert on read; the adapter applies to every connection.
+    """
+    sqlite3.register_adapter(datetime, adapt_datetime)
+    sqlite3.register_converter("DATETIME", convert_datetime)
+
+
+class Record:
+    """
+    Lightweight view of a row.
+
+    Subclasses list their columns in ``__slots__``; columns missing from
+    the query are None. Templates read fields as attributes and the JSON
+    API uses as_dict().
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Record":
+        record = cls.__new__(cls)
+        keys = set(row.keys())
+        for field in cls.__slots__:
+            setattr(record, field, row[field] if field in keys else None)
+        return record
+
+    def as_dict(self, exclude: tuple = ()) -> dict:
+        return {
+            field: getattr(self, field)
+            for field in self.__slots__
+            if field not in exclude
+        }
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={getattr(self, 'id', None)!r})"
+
+
+class InstanceRecord(Record):
+    """A user_instances row, optionally joined with its owner."""
+
+    __slots__ = (
+        "id",
+        "user_id",
+        "container_name",
+        "container_id",
+        "port",
+        "password",
+        "created_at",
+        "expires_at",
+        "status",
+        "stopped_at",
+        "instance_type",
+        "memory_limit",
+        "cpu_limit",
+        "storage_limit",
+        "session_days",
+        "ready_at",
+        "ready_seconds",
+        "owner_email",
+        "owner_lab",
+    )
+
+
+class UserRecord(Record):
+    """A users row with the instance counts shown on the admin dashboard."""
+
+    __slots__ = (
+        "id",
+        "email",
+        "is_admin",
+        "created_at",
+        "last_login",
+        "lab_name",
+        "instance_count",
+        "running_count",
+    )
@@ -0,0 +1,98 @@
+import logging
+import threading
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+from app.core.config import EMAIL_TEMPLATES_DIR, SMTP_FROM_NAME
+from app.mail.outbox import email_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class EmailTemplates:
+    """
+    Notification emails rendered from Jinja templates.
+
+    A notification ``kind`` is three files in ``directory``:
+    ``<kind>.subject.txt``, ``<kind>.txt`` and ``<kind>.html`` (which may
+    extend ``base.html`` for the shared branding). load() compiles all of
+    them once at startup, so a broken template stops the portal from
+    starting instead of failing a send, and rendering a message only
+    substitutes its variables. Every template also sees ``brand``
+    (SMTP_FROM_NAME). Templates are not reloaded; restart the portal after
+    editing them.
+    """
+
+    def __init__(self, directory=EMAIL_TEMPLATES_DIR):
+        self.directory = directory
+        self._env = Environment(
+            loader=FileSystemLoader(str(directory)),
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False,
+        )
+        self._env.globals["brand"] = SMTP_FROM_NAME
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> list:
+        """Compile every notification kind in the directory; returns the kinds."""
+        kinds = sorted(
+            path.name[: -len(".subject.txt")]
+            for path in self.directory.glob("*.subject.txt")
+        )
+        for kind in kinds:
+            self._templates(kind)
+        logger.info(f"Loaded email templates: {', '.join(kinds) or 'none'}")
+        return kinds
+
+    def _templates(self, kind: str) -> tuple:
+        with self._lock:
+            templates = self._compiled.get(kind)
+            if templates is None:
+                templates = tuple(
+                    self._env.get_template(f"{kind}{suffix}")
+                    for suffix in (".subject.txt", ".txt", ".html")
+                )
+                self._compiled[kind] = templates
+        return templates
+
+    def render(self, kind: str, **context) -> tuple:
+        """Subject, plain text and HTML body of a ``kind`` notification."""
+        subject, text, html = self._templates(kind)
+        return (
+            # A newline in the subject would end the header
+            " ".join(subject.render(context).split()),
+            text.render(context).strip(),
+            html.render(context),
+        )
+
+
+def notify(kind: str, recipient: str, expires_at=None, **context) -> int:
+    """
+    Render a ``kind`` notification for ``recipient`` and queue it in the
+    email outbox; returns the outbox id. Messages still unsent at
+    ``expires_at`` are dropped.
+    """
+    subject, body_text, body_html = email_templates.render(kind, **context)
+    return email_outbox.enqueue(
+        kind, recipient, subject, body_text, body_html, expires_at=expires_at
+    )
+
+
+def notify_many(kind: str, notices: list) -> int:
+    """
+    Render ``(recipient, expires_at, context)`` notices and queue them in
+    one outbox transaction; returns how many were queued.
+    """
+    messages = [
+        (recipient, *email_templates.render(kind, **context), expires_at)
+        for recipient, expires_at, context in notices
+    ]
+    return email_outbox.enqueue_many(kind, messages)
+
+
+# Global templates, compiled at startup
+email_templates = EmailTemplates()
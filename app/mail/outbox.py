@@ -0,0 +1,446 @@
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from app.core.config import (
+    SMTP_FROM_EMAIL,
+    SMTP_FROM_NAME,
+    EMAIL_SENDER_CONCURRENCY,
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_RETRY_BASE_SECONDS,
+    EMAIL_RETRY_MAX_SECONDS,
+    EMAIL_OUTBOX_RETENTION_DAYS,
+)
+from app.db.database import get_db
+from app.mail.smtp import SMTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# A claimed message is retried by any sender once this lease lapses, e.g.
+# after the process that claimed it died mid-send
+_LEASE_SECONDS = 300
+# Upper bound on the sender's sleep, so idle connections get closed and
+# leases from other processes are picked up
+_MAX_SLEEP_SECONDS = 60
+_PRUNE_INTERVAL_SECONDS = 3600
+_FROM_HEADER = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
+
+
+def _build_message(row) -> MIMEMultipart:
+    message = MIMEMultipart("alternative")
+    message["Subject"] = row["subject"]
+    message["From"] = _FROM_HEADER
+    message["To"] = row["recipient"]
+    message.attach(MIMEText(row["body_text"], "plain", "utf-8"))
+    if row["body_html"]:
+        message.attach(MIMEText(row["body_html"], "html", "utf-8"))
+    return message
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Whether retrying ``error`` cannot help (rejected address or message)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Bad credentials are a configuration problem; keep the message
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class EmailOutbox:
+    """
+    Persisted queue of outgoing email with a background sender.
+
+    enqueue() only inserts an ``email_outbox`` row and wakes the sender, so
+    request handlers never wait on SMTP. The sender task claims due rows
+    (under the database write lock, with a lease, so several portal
+    processes can share the table), sends them in parallel over pooled
+    SMTP connections and records the SMTP time and the delivery latency
+    from enqueue to acceptance. Temporary failures are retried with
+    exponential backoff up to ``max_attempts``; messages still unsent at
+    their ``expires_at`` (e.g. an OTP that is no longer valid) are dropped.
+
+    Subjects and bodies are cleared once a message is sent or given up,
+    so delivered access codes do not stay in the table. Handlers
+    registered with on_give_up() are told about messages that were never
+    delivered.
+    """
+
+    def __init__(
+        self,
+        pool: SMTPConnectionPool = None,
+        concurrency: int = EMAIL_SENDER_CONCURRENCY,
+        max_attempts: int = EMAIL_MAX_ATTEMPTS,
+        retry_base_seconds: float = EMAIL_RETRY_BASE_SECONDS,
+        retry_max_seconds: float = EMAIL_RETRY_MAX_SECONDS,
+        retention_days: int = EMAIL_OUTBOX_RETENTION_DAYS,
+    ):
+        self.pool = pool or SMTPConnectionPool()
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.retention_days = retention_days
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._give_up_handlers = {}
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self._counters = {
+            "queued": 0,
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "expired": 0,
+            "reconnects": 0,
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] += amount
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Must be called from the running event loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Email outbox sender started.")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.pool.close_idle)
+
+    # --- Queueing ---
+
+    def on_give_up(self, kind: str, handler):
+        """Call ``handler(recipient)`` when a ``kind`` message fails for good or expires."""
+        self._give_up_handlers[kind] = handler
+
+    def enqueue(
+        self,
+        kind: str,
+        recipient: str,
+        subject: str,
+        body_text: str,
+        body_html: str = None,
+        expires_at=None,
+    ) -> int:
+        """Queue a message for the sender and return its id. Safe from any thread."""
+        db = get_db()
+        try:
+            cursor = db.execute(
+                """INSERT INTO email_outbox
+                   (kind, recipient, subject, body_text, body_html, queued_at, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    kind,
+                    recipient,
+                    subject,
+                    body_text,
+                    body_html,
+                    time.time(),
+                    expires_at,
+                ),
+            )
+            db.commit()
+        finally:
+            db.close()
+        self._count("queued")
+        self._wake()
+        return cursor.lastrowid
+
+    def enqueue_many(self, kind: str, messages: list) -> int:
+        """
+        Queue ``(recipient, subject, body_text, body_html, expires_at)``
+        messages in one transaction; returns how many were queued.
+        """
+        if not messages:
+            return 0
+        queued_at = time.time()
+        db = get_db()
+        try:
+            db.executemany(
+                """INSERT INTO email_outbox
+                   (kind, recipient, subject, body_text, body_html, queued_at, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (
+                        kind,
+                        recipient,
+                        subject,
+                        body_text,
+                        body_html,
+                        queued_at,
+                        expires_at,
+                    )
+                    for recipient, subject, body_text, body_html, expires_at in messages
+                ],
+            )
+            db.commit()
+        finally:
+            db.close()
+        self._count("queued", len(messages))
+        self._wake()
+        return len(messages)
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # --- Sender ---
+
+    async def _run(self):
+        while True:
+            # Cleared before looking at the table, so a message queued
+            # while this iteration runs wakes the next wait
+            self._wakeup.clear()
+            try:
+                due, expired = await asyncio.to_thread(
+                    self._claim, self.concurrency * 5
+                )
+                for row in expired:
+                    self._count("expired")
+                    self._give_up(row)
+                if due:
+                    semaphore = asyncio.Semaphore(self.concurrency)
+
+                    async def deliver(row):
+                        async with semaphore:
+                            await self._deliver(row)
+
+                    await asyncio.gather(*(deliver(row) for row in due))
+                    continue
+                await asyncio.to_thread(self._housekeeping)
+                timeout = await asyncio.to_thread(self._seconds_until_due)
+            except Exception:
+                logger.error("Email outbox sender iteration failed", exc_info=True)
+                timeout = _MAX_SLEEP_SECONDS
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim(self, limit: int) -> tuple:
+        """Lease up to ``limit`` due messages; also expire ones past ``expires_at``."""
+        db = get_db()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute(
+                    """SELECT id, kind, recipient, subject, body_text, body_html,
+                              attempts, queued_at,
+                              expires_at IS NOT NULL AND expires_at <= datetime('now') AS expired
+                       FROM email_outbox
+                       WHERE status IN ('pending', 'sending')
+                       AND next_attempt_at <= datetime('now')
+                       ORDER BY next_attempt_at, id
+                       LIMIT ?""",
+                    (limit,),
+                ).fetchall()
+                due = [row for row in rows if not row["expired"]]
+                expired = [row for row in rows if row["expired"]]
+                db.executemany(
+                    """UPDATE email_outbox SET status = 'sending',
+                       next_attempt_at = datetime('now', ?) WHERE id = ?""",
+                    [(f"+{_LEASE_SECONDS} seconds", row["id"]) for row in due],
+                )
+                db.executemany(
+                    """UPDATE email_outbox SET status = 'expired', subject = NULL,
+                       body_text = NULL, body_html = NULL WHERE id = ?""",
+                    [(row["id"],) for row in expired],
+                )
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+        finally:
+            db.close()
+        return due, expired
+
+    async def _deliver(self, row):
+        try:
+            smtp_seconds = await asyncio.to_thread(self._send, _build_message(row))
+        except Exception as e:
+            await asyncio.to_thread(self._record_failure, row, e)
+            return
+        await asyncio.to_thread(self._record_sent, row, smtp_seconds)
+
+    def _send(self, message) -> float:
+        """Send on a pooled connection and return the seconds SMTP took."""
+        while True:
+            connection, reused = self.pool.acquire()
+            started = time.monotonic()
+            try:
+                connection.send_message(message)
+            except smtplib.SMTPRecipientsRefused:
+                # The connection is fine; the address is not
+                self.pool.release(connection)
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self.pool.release(connection, healthy=False)
+                if reused:
+                    # Dropped by the server while idle; try a fresh connection
+                    self._count("reconnects")
+                    continue
+                raise
+            except BaseException:
+                self.pool.release(connection, healthy=False)
+                raise
+            self.pool.release(connection)
+            return time.monotonic() - started
+
+    def _record_sent(self, row, smtp_seconds: float):
+        delivery_seconds = max(time.time() - row["queued_at"], 0.0)
+        db = get_db()
+        try:
+            db.execute(
+                """UPDATE email_outbox
+                   SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP,
+                       smtp_seconds = ?, delivery_seconds = ?, last_error = NULL,
+                       subject = NULL, body_text = NULL, body_html = NULL
+                   WHERE id = ?""",
+                (round(smtp_seconds, 3), round(delivery_seconds, 3), row["id"]),
+            )
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._counters["sent"] += 1
+            self._latencies.append(delivery_seconds)
+        logger.info(
+            f"Sent {row['kind']} email {row['id']} to {row['recipient']} "
+            f"in {smtp_seconds:.2f}s ({delivery_seconds:.2f}s after it was queued)"
+        )
+
+    def _record_failure(self, row, error: Exception):
+        attempts = row["attempts"] + 1
+        give_up = attempts >= self.max_attempts or _is_permanent(error)
+        db = get_db()
+        try:
+            if give_up:
+                db.execute(
+                    """UPDATE email_outbox
+                       SET status = 'failed', attempts = ?, last_error = ?,
+                           subject = NULL, body_text = NULL, body_html = NULL
+                       WHERE id = ?""",
+                    (attempts, str(error)[:500], row["id"]),
+                )
+            else:
+                delay = min(
+                    self.retry_base_seconds * 2 ** (attempts - 1),
+                    self.retry_max_seconds,
+                )
+                db.execute(
+                    """UPDATE email_outbox
+                       SET status = 'pending', attempts = ?, last_error = ?,
+                           next_attempt_at = datetime('now', ?)
+                       WHERE id = ?""",
+                    (attempts, str(error)[:500], f"+{int(delay)} seconds", row["id"]),
+                )
+            db.commit()
+        finally:
+            db.close()
+        if give_up:
+            self._count("failed")
+            logger.error(
+                f"Giving up on {row['kind']} email {row['id']} to {row['recipient']} "
+                f"after {attempts} attempt(s): {error}"
+            )
+            self._give_up(row)
+        else:
+            self._count("retried")
+            logger.warning(
+                f"Sending {row['kind']} email {row['id']} failed (attempt {attempts}): "
+                f"{error}; retrying in {int(delay)}s"
+            )
+
+    def _give_up(self, row):
+        handler = self._give_up_handlers.get(row["kind"])
+        if handler is None:
+            return
+        try:
+            handler(row["recipient"])
+        except Exception:
+            logger.error(
+                f"Give-up handler for {row['kind']} email failed", exc_info=True
+            )
+
+    def _seconds_until_due(self) -> float:
+        db = get_db()
+        try:
+            due = db.execute(
+                """SELECT CAST(strftime('%s', MIN(next_attempt_at)) AS INTEGER) AS due
+                   FROM email_outbox WHERE status IN ('pending', 'sending')"""
+            ).fetchone()["due"]
+        finally:
+            db.close()
+        if due is None:
+            return _MAX_SLEEP_SECONDS
+        return min(max(due - time.time(), 0.0), _MAX_SLEEP_SECONDS)
+
+    def _housekeeping(self):
+        self.pool.close_idle(self.pool.idle_seconds)
+        if time.monotonic() - self._last_prune < _PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = time.monotonic()
+        db = get_db()
+        try:
+            cursor = db.execute(
+                """DELETE FROM email_outbox
+                   WHERE status IN ('sent', 'failed', 'expired')
+                   AND created_at < datetime('now', ?)""",
+                (f"-{self.retention_days} days",),
+            )
+            db.commit()
+        finally:
+            db.close()
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} old email outbox row(s).")
+
+    def stats(self) -> dict:
+        db = get_db()
+        try:
+            by_status = {
+                row["status"]: row["count"]
+                for row in db.execute(
+                    "SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status"
+                ).fetchall()
+            }
+        finally:
+            db.close()
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+        latency = None
+        if latencies:
+            latency = {
+                "samples": len(latencies),
+                "avg_seconds": round(sum(latencies) / len(latencies), 3),
+                "p95_seconds": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+                "max_seconds": round(latencies[-1], 3),
+            }
+        return {
+            **counters,
+            "by_status": by_status,
+            "delivery_latency": latency,
+            "connections": self.pool.stats(),
+        }
+
+
+# Global outbox used for all outgoing email
+email_outbox = EmailOutbox()
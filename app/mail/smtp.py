@@ -0,0 +1,138 @@
+import logging
+import smtplib
+import threading
+import time
+
+from app.core.config import (
+    SMTP_USER,
+    SMTP_PASSWORD,
+    EMAIL_HOST,
+    EMAIL_PORT,
+    EMAIL_USE_SSL,
+    EMAIL_USE_TLS,
+    EMAIL_SMTP_TIMEOUT_SECONDS,
+    EMAIL_CONNECTION_IDLE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    """
+    Authenticated SMTP connections kept open between messages.
+
+    Connecting, the TLS handshake and AUTH cost several round trips (most of
+    the time of a single send to SES), so the sender borrows a connection
+    with acquire() and hands it back with release(). Connections idle for
+    ``idle_seconds`` or longer are closed instead of reused, since servers
+    drop idle clients; a connection that failed mid-send is discarded
+    rather than returned.
+    """
+
+    def __init__(
+        self,
+        host: str = EMAIL_HOST,
+        port: int = EMAIL_PORT,
+        use_ssl: bool = EMAIL_USE_SSL,
+        use_tls: bool = EMAIL_USE_TLS,
+        timeout: float = EMAIL_SMTP_TIMEOUT_SECONDS,
+        idle_seconds: float = EMAIL_CONNECTION_IDLE_SECONDS,
+    ):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self._idle = []  # (connection, returned at)
+        self._lock = threading.Lock()
+        self._counters = {
+            "connects": 0,
+            "reused": 0,
+            "discarded": 0,
+            "connect_seconds": 0.0,
+        }
+
+    def _connect(self) -> smtplib.SMTP:
+        started = time.monotonic()
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if not self.use_ssl and self.use_tls:
+                connection.starttls()
+            connection.login(SMTP_USER, SMTP_PASSWORD)
+        except BaseException:
+            _close(connection)
+            raise
+        with self._lock:
+            self._counters["connects"] += 1
+            self._counters["connect_seconds"] += time.monotonic() - started
+        logger.info(f"Opened SMTP connection to {self.host}:{self.port}")
+        return connection
+
+    def acquire(self) -> tuple:
+        """
+        (connection, reused). Raises smtplib/OS errors if a new connection
+        cannot be opened.
+        """
+        now = time.monotonic()
+        stale = []
+        connection = None
+        with self._lock:
+            while self._idle:
+                candidate, returned_at = self._idle.pop()
+                if now - returned_at < self.idle_seconds:
+                    connection = candidate
+                    self._counters["reused"] += 1
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            _close(candidate)
+        if connection is not None:
+            return connection, True
+        return self._connect(), False
+
+    def release(self, connection: smtplib.SMTP, healthy: bool = True):
+        if not healthy:
+            self._discard(connection)
+            return
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def _discard(self, connection: smtplib.SMTP):
+        with self._lock:
+            self._counters["discarded"] += 1
+        _close(connection)
+
+    def close_idle(self, max_idle: float = None):
+        """Close connections idle for longer than ``max_idle`` (all if None)."""
+        now = time.monotonic()
+        with self._lock:
+            if max_idle is None:
+                closing, self._idle = self._idle, []
+            else:
+                closing = [entry for entry in self._idle if now - entry[1] >= max_idle]
+                self._idle = [
+                    entry for entry in self._idle if now - entry[1] < max_idle
+                ]
+        for connection, _ in closing:
+            _close(connection)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["idle"] = len(self._idle)
+        stats["connect_seconds"] = round(stats["connect_seconds"], 3)
+        return stats
+
+
+def _close(connection: smtplib.SMTP):
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, OSError):
+        try:
+            connection.close()
+        except OSError:
+            pass
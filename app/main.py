@@ -1,11 +1,9 @@
-import os
+import asyncio
 import logging
-import secrets
-import subprocess
+import socket
 import sqlite3
 from datetime import datetime, timezone
-from pathlib import Path
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
 
 from fastapi import FastAPI, Request, Form, status, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
@@ -15,42 +13,75 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 # Import configurations, database, and auth functions from new modules
 from app.core.config import (
-    USER_DATA_BASE_DIR,
     STATIC_DIR,
     TEMPLATES_JINJA_DIR,
-    RSTUDIO_MIN_PORT,
-    RSTUDIO_MAX_PORT,
     RSTUDIO_DEFAULT_MEMORY,
     RSTUDIO_DEFAULT_CPUS,
-    RSTUDIO_DOCKER_IMAGE,
-    JUPYTER_DOCKER_IMAGE,
-    JUPYTER_MIN_PORT,
-    JUPYTER_MAX_PORT,
     JUPYTER_DEFAULT_MEMORY,
     JUPYTER_DEFAULT_CPUS,
     INITIAL_ADMIN_USERNAME,  # Used for admin detection
     RSTUDIO_USER_STORAGE_LIMIT,
-    MAX_CONCURRENT_SESSIONS,
     DEFAULT_SESSION_DAYS,
     LAB_NAMES,
+    ADMIN_PAGE_SIZE,
+)
+from app.db.database import get_db, init_db, get_pool_stats, close_db_pool
+from app.db.records import InstanceRecord
+from app.db.maintenance import database_maintenance
+from app.db.listings import (
+    INSTANCE_STATUSES,
+    INSTANCE_SORTS,
+    InstanceFilters,
+    fetch_instance_page,
+    fetch_user_page,
+    admin_summary,
 )
-from app.db.database import get_db, init_db
 from app.auth.security import (
+    SESSION_COOKIE_NAME,
     get_current_user,
     get_current_active_user,
     create_user_session,
+    revoke_session_token,
+    decode_extend_token,
     is_valid_nus_email,
 )
 from app.auth.otp import get_otp_service
+from app.auth.rate_limit import otp_guard, client_ip
+from app.auth.user_cache import user_cache
+from app.mail.outbox import email_outbox
+from app.mail.notifications import email_templates
+from app.containers.provisioning import provisioning_queue
+from app.containers.instance_types import INSTANCE_TYPES
+from app.containers.instances import instance_service, InstanceRequestError
+from app.containers.ports import port_allocator, ACTIVE_STATUSES
+from app.containers.reaper import expiry_reaper
+from app.containers.expiry_notices import expiry_notifier
+from app.containers.events import container_event_monitor
+from app.containers.warm_pool import warm_pool
+from app.containers.images import image_manager
+from app.containers.live_status import status_broadcaster, capacity_snapshot
+from app.containers.admission import admission_controller
+from app.containers.resources import resource_scheduler
+from app.containers.runtime import (
+    docker_client,
+    ContainerNotFoundError,
+    DockerAPIError,
+    DockerUnavailableError,
+)
+from app.routers import api
 
 
 class UserMiddleware(BaseHTTPMiddleware):
     """Middleware to populate request.state.user for templates"""
 
     async def dispatch(self, request: Request, call_next):
-        # Get user from cookies and populate request.state
-        user = get_current_user(request)
-        request.state.user = user
+        if request.url.path.startswith("/static/"):
+            # Static assets never need the user; skip the lookup entirely
+            request.state.user = None
+            return await call_next(request)
+        # Get user from cookies and populate request.state; route
+        # dependencies reuse this result instead of querying again
+        get_current_user(request)
         response = await call_next(request)
         return response
 
@@ -60,6 +91,9 @@ app = FastAPI()
 # Add user middleware
 app.add_middleware(UserMiddleware)
 
+# JSON API used by the dashboards for incremental updates
+app.include_router(api.router)
+
 # Mount static files using STATIC_DIR from config
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 # Setup templates using TEMPLATES_JINJA_DIR from config
@@ -71,54 +105,60 @@ logger = logging.getLogger(__name__)  # Keep logger setup
 init_db()
 
 
+@app.on_event("startup")
+async def start_provisioning_workers():
+    status_broadcaster.start()
+    # Pulls the IDE images in the background; requests wait for it
+    image_manager.start()
+    provisioning_queue.start()
+    # After orphaned requests are failed, so their ports count as free
+    port_allocator.rebuild()
+    expiry_reaper.start()
+    # Reconciles against the running containers, then follows Docker events
+    container_event_monitor.start()
+    warm_pool.start()
+    # Compiled once; a broken email template fails startup, not a send
+    email_templates.load()
+    # Sends queued email (OTP codes) in the background
+    email_outbox.start()
+    # OTP rate limits live in memory; attempt counts are written behind
+    await asyncio.to_thread(otp_guard.load)
+    otp_guard.start()
+    # Deletes expired OTP codes, vacuums and optimizes the database
+    database_maintenance.start()
+    # Emails owners before their sessions expire, with an extend link
+    expiry_notifier.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_background_workers():
+    # Ends open dashboard event streams so the server can stop
+    status_broadcaster.stop()
+    container_event_monitor.stop()
+    await warm_pool.stop()
+    await provisioning_queue.stop()
+    await expiry_notifier.stop()
+    await expiry_reaper.stop()
+    await image_manager.stop()
+    await email_outbox.stop()
+    await otp_guard.stop()
+    await database_maintenance.stop()
+    close_db_pool()
+
+
 # --- Helper Functions ---
 
 
-def ensure_user_data_directory(user_dir: Path) -> bool:
-    """
-    Ensure a user data directory exists for RStudio containers.
-    
-    Creates the directory if it doesn't exist. Attempts to set ownership to UID 1000
-    (rstudio user in Docker containers) but continues if this fails.
-    
-    Args:
-        user_dir: Path to the user-specific data directory to create/ensure
-        
-    Returns:
-        True if directory exists and is usable, False otherwise
-    """
-    try:
-        # Ensure parent directory exists first
-        user_dir.parent.mkdir(parents=True, exist_ok=True)
-        # Create user-specific directory if it doesn't exist
-        user_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Try to set ownership to UID 1000 (rstudio user) - only if we can
-        try:
-            os.chown(user_dir, 1000, 1000)
-            os.chmod(user_dir, 0o755)
-            logging.info(f"Set ownership of '{user_dir}' to 1000:1000")
-        except (PermissionError, OSError) as chown_err:
-            # Can't chown - try chmod to 777 as fallback
-            try:
-                os.chmod(user_dir, 0o777)
-                logging.warning(f"Could not chown '{user_dir}': {chown_err}. Set to 777 instead.")
-            except (PermissionError, OSError):
-                # Can't even chmod - directory might still work if permissions are already OK
-                logging.warning(f"Could not change permissions on '{user_dir}'. Continuing anyway.")
-        
-        logging.info(f"User data directory '{user_dir}' is ready")
-        return True
-        
-    except PermissionError as perm_err:
-        logging.error(f"Permission denied for user data directory '{user_dir}': {perm_err}")
-        return False
-    except OSError as os_err:
-        logging.error(f"OS error with user data directory '{user_dir}': {os_err}")
-        return False
-    except Exception as e:
-        logging.error(f"Unexpected error with user data directory '{user_dir}': {e}", exc_info=True)
-        return False
+def _set_session_cookie(response, session_data: dict):
+    """Store a signed session token from create_user_session() in a cookie."""
+    response.set_cookie(
+        key=SESSION_COOKIE_NAME,
+        value=session_data["token"],
+        httponly=True,
+        samesite="Lax",
+        secure=False,  # Set to True in production with HTTPS
+        expires=session_data["expires_at"] if session_data["remember_me"] else None,
+    )
 
 
 # --- Routes ---
@@ -158,6 +198,21 @@ async def request_otp_action(request: Request, email: str = Form(...)):
             },
         )
 
+    # Refuse rate-limited requests before anything is written
+    otp_service = get_otp_service()
+    ip = client_ip(request)
+    allowed, message = otp_service.can_request_otp(email, ip)
+    if not allowed:
+        return templates.TemplateResponse(
+            "login.html",
+            {
+                "request": request,
+                "error": message,
+                "title": "Login",
+                "email_value": email,
+            },
+        )
+
     # Check if user exists, if not create them automatically
     db = get_db()
     user = db.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
@@ -180,11 +235,13 @@ async def request_otp_action(request: Request, email: str = Form(...)):
                 (email, is_admin_val, datetime.now(timezone.utc), None),
             )
             db.commit()
+            user_cache.invalidate(email)
             logger.info(f"Auto-registered new user: {email}")
 
         except sqlite3.Error as e:
             logger.error(f"Error auto-registering user {email}: {str(e)}")
             db.rollback()
+            db.close()
             return templates.TemplateResponse(
                 "login.html",
                 {
@@ -198,8 +255,7 @@ async def request_otp_action(request: Request, email: str = Form(...)):
     db.close()
 
     # Request OTP (works for both existing and newly created users)
-    otp_service = get_otp_service()
-    success, message = otp_service.create_otp(email)
+    success, message = otp_service.create_otp(email, ip)
 
     if success:
         return templates.TemplateResponse(
@@ -236,7 +292,7 @@ async def verify_otp_action(
 
     # Verify OTP
     otp_service = get_otp_service()
-    success, message = otp_service.verify_otp(email, otp_code)
+    success, message = otp_service.verify_otp(email, otp_code, client_ip(request))
 
     if success:
         # Update last login
@@ -247,27 +303,13 @@ async def verify_otp_action(
         )
         db.commit()
         db.close()
+        user_cache.invalidate(email)
 
         # Create session
         session_data = create_user_session(email, remember_me)
 
         response = RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
-        response.set_cookie(
-            key="user_email",
-            value=email,
-            httponly=True,
-            samesite="Lax",
-            secure=False,  # Set to True in production with HTTPS
-            expires=session_data["expires_at"] if remember_me else None,
-        )
-        response.set_cookie(
-            key="session_expires",
-            value=session_data["expires_at"].isoformat(),
-            httponly=True,
-            samesite="Lax",
-            secure=False,  # Set to True in production with HTTPS
-            expires=session_data["expires_at"] if remember_me else None,
-        )
+        _set_session_cookie(response, session_data)
         return response
     else:
         return templates.TemplateResponse(
@@ -298,54 +340,19 @@ async def dashboard(
             (current_user["id"],),
         ).fetchall()
     else:
-        # Regular users only see running sessions
+        # Regular users see running sessions plus ones still being provisioned
+        # or that failed to start, since provisioning finishes after the redirect
         raw_instances = db.execute(
-            "SELECT * FROM user_instances WHERE user_id = ? AND status = 'running' ORDER BY created_at DESC",
+            "SELECT * FROM user_instances WHERE user_id = ? AND status IN ('running', 'starting', 'requested', 'error') ORDER BY created_at DESC",
             (current_user["id"],),
         ).fetchall()
 
-    # Get current session count for display before closing db
-    current_running_sessions = db.execute(
-        "SELECT COUNT(*) as count FROM user_instances WHERE status = 'running'"
-    ).fetchone()["count"]
-
     db.close()
 
-    processed_instances = []
-    for raw_instance in raw_instances:
-        instance_dict = dict(
-            raw_instance
-        )  # Convert Row to dict for easier modification
-        for field in ["created_at", "expires_at", "stopped_at"]:
-            value = instance_dict.get(field)
-            if value and isinstance(value, str):
-                try:
-                    # Handles "YYYY-MM-DD HH:MM:SS.ffffff" or "YYYY-MM-DDTHH:MM:SS.ffffff"
-                    # and also "YYYY-MM-DD HH:MM:SS" if space is used as separator
-                    instance_dict[field] = datetime.fromisoformat(
-                        value.replace(" ", "T")
-                    )
-                except ValueError:
-                    # Fallback for "YYYY-MM-DD HH:MM:SS" if fromisoformat fails (e.g. older Python or truly different format)
-                    try:
-                        instance_dict[field] = datetime.strptime(
-                            value, "%Y-%m-%d %H:%M:%S"
-                        )
-                    except ValueError as e_strptime:
-                        logging.warning(
-                            f"Could not parse date string '{value}' for field '{field}' in instance ID {instance_dict.get('id')}. Error: {e_strptime}. Setting to None."
-                        )
-                        instance_dict[field] = (
-                            None  # Set to None to prevent template error
-                        )
-            elif not isinstance(value, datetime) and value is not None:
-                # If it's not a string, not a datetime, and not None (e.g., int/float from other storage types)
-                logging.warning(
-                    f"Unexpected type '{type(value)}' for date field '{field}' in instance ID {instance_dict.get('id')}. Setting to None."
-                )
-                instance_dict[field] = None
+    # Session slots in use and free memory/CPUs, as seen by admission control
+    capacity = capacity_snapshot()
 
-        processed_instances.append(instance_dict)
+    instances = [InstanceRecord.from_row(row) for row in raw_instances]
 
     # Get base URL for RStudio links
     base_url = str(request.base_url).rstrip("/")
@@ -355,7 +362,7 @@ async def dashboard(
         {
             "request": request,
             "user": current_user,
-            "instances": processed_instances,  # Pass processed instances
+            "instances": instances,
             "base_url": base_url,
             "title": "Dashboard",
             "memory_limit": RSTUDIO_DEFAULT_MEMORY,  # Uses imported RSTUDIO_DEFAULT_MEMORY
@@ -363,8 +370,9 @@ async def dashboard(
             "storage_limit": RSTUDIO_USER_STORAGE_LIMIT,  # Uses imported RSTUDIO_USER_STORAGE_LIMIT
             "jupyter_memory_limit": JUPYTER_DEFAULT_MEMORY,  # Uses imported JUPYTER_DEFAULT_MEMORY
             "jupyter_cpu_limit": JUPYTER_DEFAULT_CPUS,  # Uses imported JUPYTER_DEFAULT_CPUS
-            "current_sessions": current_running_sessions,  # Current running sessions
-            "max_sessions": MAX_CONCURRENT_SESSIONS,  # Maximum allowed sessions
+            "current_sessions": capacity["current_sessions"],  # Sessions holding a slot
+            "max_sessions": capacity["max_sessions"],  # Maximum allowed sessions
+            "capacity": capacity,  # Memory/CPU headroom
             "default_session_days": DEFAULT_SESSION_DAYS,  # Default session duration
             "lab_names": LAB_NAMES,  # Available lab names for selection
         },
@@ -409,6 +417,7 @@ async def select_lab(
             (lab_name, current_user["id"]),
         )
         db.commit()
+        user_cache.invalidate(current_user["email"])
 
         return JSONResponse(
             content={"success": True, "message": f"Lab updated to {lab_name}"}
@@ -426,253 +435,57 @@ async def select_lab(
         db.close()
 
 
-@app.post("/request_rstudio")
-async def request_rstudio_instance(
+@app.post("/request/{instance_type}")
+async def request_instance(
+    instance_type: str,
     request: Request,
     current_user: dict = Depends(get_current_active_user),
-    memory_limit: str = Form(RSTUDIO_DEFAULT_MEMORY),
-    cpu_limit: str = Form(RSTUDIO_DEFAULT_CPUS),
-    storage_limit: str = Form(RSTUDIO_USER_STORAGE_LIMIT),
+    memory_limit: str = Form(None),
+    cpu_limit: str = Form(None),
+    storage_limit: str = Form(None),
     session_days: int = Form(DEFAULT_SESSION_DAYS),
-):  # Uses imported get_current_active_user
-    db = get_db()  # Uses imported get_db
-    # Check if user already has a running or requested instance
-    existing_instance_row = db.execute(  # Renamed for clarity and fetching status
-        "SELECT id, status FROM user_instances WHERE user_id = ? AND "
-        "(status = 'running' OR status = 'requested')",
-        (current_user["id"],),
-    ).fetchone()
-
-    if existing_instance_row:
-        db.close()
-        message = "You already have an active session or one is being prepared."
-        if existing_instance_row["status"] == "requested":
-            # E501: Line shortened
-            message = (
-                "An instance is currently being set up for you. "
-                "Please check the dashboard again shortly."
-            )
-        elif existing_instance_row["status"] == "running":
-            # E501: Line shortened
-            message = (
-                "You already have a running instance. "
-                "Please stop the current one before launching a new one."
-            )
-
-        encoded_message = quote(message)  # URL encode the message
-        # E501: Line shortened
-        return RedirectResponse(
-            url=f"/dashboard?message={encoded_message}",
-            status_code=status.HTTP_302_FOUND,
-        )
-
-    # Check global session limit
-    total_running_sessions = db.execute(
-        "SELECT COUNT(*) as count FROM user_instances WHERE status = 'running'"
-    ).fetchone()["count"]
-
-    if total_running_sessions >= MAX_CONCURRENT_SESSIONS:
-        db.close()
-        message = (
-            f"System capacity reached. Currently {total_running_sessions}/{MAX_CONCURRENT_SESSIONS} sessions are running. "
-            "Please wait for another user to stop their session before requesting a new one."
-        )
-        encoded_message = quote(message)
+):
+    """Launch an instance of any registered type (see instance_types.py)."""
+    spec = INSTANCE_TYPES.get(instance_type)
+    if spec is None:
         return RedirectResponse(
-            url=f"/dashboard?error={encoded_message}",
+            url="/dashboard?error=" + quote("Unknown instance type."),
             status_code=status.HTTP_302_FOUND,
         )
-
-    email_full = current_user["email"]
-    # Extract the part before '@' for container and directory naming
-    email_username = email_full.split("@")[0] if "@" in email_full else email_full
-
-    # Construct container_name using the email username part
-    container_name = f"rstudio-{email_username}-{secrets.token_hex(4)}"
-    rstudio_password = secrets.token_urlsafe(12)
-
-    # Find an available port (very basic, improve for production)
-    used_ports_rows = db.execute(
-        "SELECT port FROM user_instances WHERE status = 'running'"
-    ).fetchall()
-    used_ports = {row["port"] for row in used_ports_rows}
-
-    host_port = RSTUDIO_MIN_PORT  # Use imported RSTUDIO_MIN_PORT
-    while host_port in used_ports:
-        host_port += 1
-        if host_port > RSTUDIO_MAX_PORT:  # Use imported RSTUDIO_MAX_PORT
-            db.close()
-            # Return redirect with error message instead of raising exception
-            error_message = quote(
-                "No available ports for RStudio. Please try again later or contact an administrator."
-            )
-            return RedirectResponse(
-                url=f"/dashboard?error={error_message}",
-                status_code=status.HTTP_302_FOUND,
-            )
-
-    # Use email_username for the user-specific data directory path
-    user_specific_data_dir = (
-        USER_DATA_BASE_DIR / email_username
-    )  # Uses imported USER_DATA_BASE_DIR
-    
-    # Ensure user data directory exists with proper permissions
-    if not ensure_user_data_directory(user_specific_data_dir):
-        db.close()
-        # Safely get directory permissions info for logging
-        perm_info = "unknown"
-        try:
-            if USER_DATA_BASE_DIR.exists():
-                perm_info = oct(USER_DATA_BASE_DIR.stat().st_mode)
-            else:
-                perm_info = "does not exist"
-        except (OSError, PermissionError):
-            perm_info = "cannot access (permission denied)"
-        
-        logging.error(
-            f"Failed to ensure user data directory '{user_specific_data_dir}'. "
-            f"Parent directory '{USER_DATA_BASE_DIR}' permissions: {perm_info}"
-        )
-        error_message = quote(
-            "Permission error: Unable to create user data directory. Please contact an administrator."
+    try:
+        message = await instance_service.request(
+            current_user,
+            spec,
+            memory_limit or spec.default_memory,
+            cpu_limit or spec.default_cpus,
+            storage_limit or spec.default_storage,
+            session_days,
         )
+    except InstanceRequestError as e:
         return RedirectResponse(
-            url=f"/dashboard?error={error_message}",
+            url=f"/dashboard?{e.category}={quote(str(e))}",
             status_code=status.HTTP_302_FOUND,
         )
-
-    # Store request in DB first
-    cursor = db.cursor()
-    cursor.execute(
-        """INSERT INTO user_instances
-           (user_id, container_name, port, password, status, instance_type, memory_limit, cpu_limit, storage_limit, session_days)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (
-            current_user["id"],
-            container_name,
-            host_port,
-            rstudio_password,
-            "requested",
-            "rstudio",
-            memory_limit,
-            cpu_limit,
-            storage_limit,
-            session_days,
-        ),
+    return RedirectResponse(
+        url="/dashboard?message=" + quote(message),
+        status_code=status.HTTP_302_FOUND,
     )
-    db.commit()
-    instance_id = (
-        cursor.lastrowid
-    )  # Remove parentheses; lastrowid is a property, not a method
-    db.close()
 
-    try:
-        # Run Docker container
-        # This is a blocking call, for production use Celery or similar
-        # background task manager
-        cmd = [
-            "docker",
-            "run",
-            "-d",
-            "--name",
-            container_name,
-            "--memory",
-            memory_limit,  # Use custom memory limit
-            "--cpus",
-            cpu_limit,  # Use custom CPU limit
-            "-e",
-            f"PASSWORD={rstudio_password}",
-            "-v",
-            f"{user_specific_data_dir.resolve()}:/home/rstudio",
-            "--rm",
-            "-p",
-            f"{host_port}:8787",  # Map host port to RStudio's internal port 8787
-            # "-e",
-            # f"USER={email_username}",  # Use email_username for the RStudio USER env variable
-        ]
-        cmd.append(RSTUDIO_DOCKER_IMAGE)  # Use imported RSTUDIO_DOCKER_IMAGE
-
-        logging.info(
-            f"Attempting to run RStudio container with command: {' '.join(cmd)}"
-        )
 
-        try:
-            process_result = subprocess.run(
-                cmd, check=True, capture_output=True, text=True
-            )  # Corrected variable name
-            container_id_full = process_result.stdout.strip()
-            container_id_short = container_id_full[
-                :12
-            ]  # Docker typically shows short IDs
-
-            db_update = get_db()  # Uses imported get_db
-            db_update.execute(
-                """UPDATE user_instances
-                   SET container_id = ?, status = 'running',
-                       expires_at = datetime('now', ?)
-                   WHERE id = ?""",
-                (
-                    container_id_short,
-                    f"+{session_days} days",  # Use custom session_days
-                    instance_id,
-                ),
-            )
-            db_update.commit()
-            db_update.close()
+# Form targets from before /request/{instance_type}, kept for existing links
 
-        except subprocess.CalledProcessError as e:
-            logging.error(
-                f"Failed to start RStudio container {container_name}. Error: {e.stderr}"
-            )
-            # Attempt to update DB status to 'error'
-            db_update_error = get_db()
-            try:
-                db_update_error.execute(
-                    "UPDATE user_instances SET status = 'error' WHERE id = ?",
-                    (instance_id,),
-                )
-                db_update_error.commit()
-                logging.info(
-                    f"Instance {instance_id} status updated to 'error' after subprocess failure."
-                )
-            except Exception as db_err_inner:
-                logging.error(
-                    f"Failed to update instance {instance_id} to status 'error' after subprocess failure: {db_err_inner}"
-                )
-            finally:
-                db_update_error.close()
 
-            error_message = quote(
-                f"Failed to start RStudio container: {e.stderr.strip()}"
-            )
-            return RedirectResponse(
-                url=f"/dashboard?error={error_message}",
-                status_code=status.HTTP_302_FOUND,
-            )
-
-    except Exception as e:
-        db_exc = get_db()
-        db_exc.execute(
-            "UPDATE user_instances SET status = 'error' WHERE id = ?",
-            (instance_id,),
-        )
-        db_exc.commit()
-        db_exc.close()
-        logging.error(
-            f"Unexpected error in request_rstudio_instance for instance {instance_id}: {str(e)}",
-            exc_info=True,
-        )
-        error_message = quote(
-            f"An unexpected error occurred while preparing your RStudio instance: {str(e)}"
-        )
-        return RedirectResponse(
-            url=f"/dashboard?error={error_message}", status_code=status.HTTP_302_FOUND
-        )
-
-    return RedirectResponse(
-        url="/dashboard?message="
-        + quote(f"RStudio instance '{container_name}' is being prepared."),
-        status_code=status.HTTP_302_FOUND,
+@app.post("/request_rstudio")
+async def request_rstudio_instance(
+    request: Request,
+    current_user: dict = Depends(get_current_active_user),
+    memory_limit: str = Form(None),
+    cpu_limit: str = Form(None),
+    storage_limit: str = Form(None),
+    session_days: int = Form(DEFAULT_SESSION_DAYS),
+):
+    return await request_instance(
+        "rstudio", request, current_user, memory_limit, cpu_limit, storage_limit, session_days
     )
 
 
@@ -680,258 +493,13 @@ async def request_rstudio_instance(
 async def request_jupyterlab_instance(
     request: Request,
     current_user: dict = Depends(get_current_active_user),
-    memory_limit: str = Form(JUPYTER_DEFAULT_MEMORY),
-    cpu_limit: str = Form(JUPYTER_DEFAULT_CPUS),
-    storage_limit: str = Form(RSTUDIO_USER_STORAGE_LIMIT),
+    memory_limit: str = Form(None),
+    cpu_limit: str = Form(None),
+    storage_limit: str = Form(None),
     session_days: int = Form(DEFAULT_SESSION_DAYS),
-):  # Uses imported get_current_active_user
-    db = get_db()  # Uses imported get_db
-    existing_instance_row = db.execute(
-        "SELECT id, status FROM user_instances WHERE user_id = ? AND "
-        "(status = 'running' OR status = 'requested')",  # This check might need refinement if users can have one of each
-        (current_user["id"],),
-    ).fetchone()
-
-    # For now, let's assume a user can have one active instance of any type.
-    # This can be changed later to allow one RStudio AND one JupyterLab.
-    if existing_instance_row:
-        db.close()
-        message = "You already have an active session or one is being prepared."
-        if existing_instance_row["status"] == "requested":
-            # E501: Line shortened
-            message = (
-                "An instance is currently being set up for you. "
-                "Please check the dashboard again shortly."
-            )
-        elif existing_instance_row["status"] == "running":
-            # E501: Line shortened
-            message = (
-                "You already have a running instance. "
-                "Please stop the current one before launching a new one."
-            )
-
-        encoded_message = quote(message)  # URL encode the message
-        # E501: Line shortened
-        return RedirectResponse(
-            url=f"/dashboard?message={encoded_message}",
-            status_code=status.HTTP_302_FOUND,
-        )
-
-    # Check global session limit
-    total_running_sessions = db.execute(
-        "SELECT COUNT(*) as count FROM user_instances WHERE status = 'running'"
-    ).fetchone()["count"]
-
-    if total_running_sessions >= MAX_CONCURRENT_SESSIONS:
-        db.close()
-        message = (
-            f"System capacity reached. Currently {total_running_sessions}/{MAX_CONCURRENT_SESSIONS} sessions are running. "
-            "Please wait for another user to stop their session before requesting a new one."
-        )
-        encoded_message = quote(message)
-        return RedirectResponse(
-            url=f"/dashboard?error={encoded_message}",
-            status_code=status.HTTP_302_FOUND,
-        )
-
-    email_full = current_user["email"]
-    email_username = email_full.split("@")[0] if "@" in email_full else email_full
-    container_name = f"jupyterlab-{email_username}-{secrets.token_hex(4)}"
-    jupyter_token = secrets.token_urlsafe(24)  # Generate a secure token
-
-    # Find an available port for JupyterLab
-    used_ports_rows = db.execute(
-        "SELECT port FROM user_instances WHERE status = 'running'"
-    ).fetchall()
-    used_ports = {row["port"] for row in used_ports_rows}
-
-    host_port = JUPYTER_MIN_PORT  # Use imported JUPYTER_MIN_PORT
-    while host_port in used_ports:
-        host_port += 1
-        if host_port > JUPYTER_MAX_PORT:  # Use imported JUPYTER_MAX_PORT
-            db.close()
-            error_message = quote(
-                "No available ports for JupyterLab. Please try again later or contact an administrator."
-            )
-            return RedirectResponse(
-                url=f"/dashboard?error={error_message}",
-                status_code=status.HTTP_302_FOUND,
-            )
-
-    # Use email_username for the user-specific data directory path
-    user_specific_data_dir = (
-        USER_DATA_BASE_DIR / email_username
-    )  # Uses imported USER_DATA_BASE_DIR
-    
-    # Ensure user data directory exists with proper permissions
-    if not ensure_user_data_directory(user_specific_data_dir):
-        db.close()
-        # Safely get directory permissions info for logging
-        perm_info = "unknown"
-        try:
-            if USER_DATA_BASE_DIR.exists():
-                perm_info = oct(USER_DATA_BASE_DIR.stat().st_mode)
-            else:
-                perm_info = "does not exist"
-        except (OSError, PermissionError):
-            perm_info = "cannot access (permission denied)"
-        
-        logging.error(
-            f"Failed to ensure user data directory '{user_specific_data_dir}'. "
-            f"Parent directory '{USER_DATA_BASE_DIR}' permissions: {perm_info}"
-        )
-        error_message = quote(
-            "Permission error: Unable to create user data directory. Please contact an administrator."
-        )
-        return RedirectResponse(
-            url=f"/dashboard?error={error_message}",
-            status_code=status.HTTP_302_FOUND,
-        )
-
-    # Store request in DB first
-    cursor = db.cursor()
-    cursor.execute(
-        """INSERT INTO user_instances
-           (user_id, container_name, port, password, status, instance_type, memory_limit, cpu_limit, storage_limit, session_days)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (
-            current_user["id"],
-            container_name,
-            host_port,
-            jupyter_token,
-            "requested",
-            "jupyterlab",
-            memory_limit,
-            cpu_limit,
-            storage_limit,
-            session_days,
-        ),
-    )
-    db.commit()
-    instance_id = (
-        cursor.lastrowid
-    )  # Remove parentheses; lastrowid is a property, not a method
-    db.close()
-
-    try:
-        cmd = [
-            "docker",
-            "run",
-            "-d",
-            "--name",
-            container_name,
-            "--memory",
-            memory_limit,  # Use custom memory limit
-            "--cpus",
-            cpu_limit,  # Use custom CPU limit
-            "-e",
-            f"JUPYTER_TOKEN={jupyter_token}",  # Pass the token
-            "-e",
-            "JUPYTER_ENABLE_LAB=yes",
-            # Grant sudo access if needed, or manage permissions carefully
-            # "-e", "GRANT_SUDO=yes",
-            # "-u", "root", # If running as root to chown, then drop privileges. Or use NB_UID/NB_GID.
-            # For simplicity, let jovyan user own the work directory.
-            # Ensure user_specific_data_dir has correct permissions for Docker to write if jovyan is not root.
-            "-v",
-            f"{user_specific_data_dir.resolve()}:/home/jovyan/work",
-            "--rm",
-            "-p",
-            f"{host_port}:8888",  # JupyterLab typically runs on 8888
-            "-e",
-            f"JUPYTER_TOKEN={jupyter_token}",  # Pass the token
-            # For JupyterLab, the user inside the container is often 'jovyan' or configurable.
-            # The UID/GID mapping is crucial. The datascience-notebook often uses UID 1000 (jovyan).
-            # We need to ensure the mounted directory has correct permissions for this user.
-            # Example: "-u", "1000:100", # Run as jovyan user (UID 1000) and users group (GID 100)
-            # This might need to be configurable or handled by the Docker image itself.
-            # For now, let's assume the image handles user permissions or the user_specific_data_dir is world-writable enough.
-            # The -e NB_USER=$email_username and -e NB_UID=$(id -u) might be useful if the image supports it.
-            # The jupyter/docker-stacks images often create a user 'jovyan' with UID 1000.
-            # Let's add a CHOWN_HOME='yes' and CHOWN_EXTRA_OPTS='-R' which some images use to fix permissions.
-            # Also, NB_PREFIX might be useful if running behind a proxy, but not essential for direct access.
-            "-e",
-            "CHOWN_HOME=yes",
-            "-e",
-            "CHOWN_EXTRA_OPTS=-R",
-            # Grant sudo access to the jovyan user if needed for package installs, though generally better to build custom image
-            # "-e", "GRANT_SUDO=yes", # Uncomment if sudo access is needed inside container
-        ]
-        cmd.append(JUPYTER_DOCKER_IMAGE)  # Use imported JUPYTER_DOCKER_IMAGE
-        # Add --user $(id -u):$(id -g) if running on Linux and want to map to host user,
-        # but this can be problematic with pre-built images expecting a specific internal user.
-        # For jupyter/datascience-notebook, it's usually better to let it run as 'jovyan'
-        # and ensure the volume permissions are correct on the host.
-
-        logging.info(
-            f"Attempting to run JupyterLab container with command: {' '.join(cmd)}"
-        )
-        try:
-            process_result = subprocess.run(
-                cmd, check=True, capture_output=True, text=True
-            )
-            container_id_full = process_result.stdout.strip()
-            container_id_short = container_id_full[:12]
-
-            db_update = get_db()  # Uses imported get_db
-            db_update.execute(
-                """UPDATE user_instances
-                   SET container_id = ?, status = 'running',
-                       expires_at = datetime('now', ?)
-                   WHERE id = ?""",
-                (
-                    container_id_short,
-                    f"+{session_days} days",  # Use custom session_days
-                    instance_id,
-                ),
-            )
-            db_update.commit()
-            db_update.close()
-
-        except subprocess.CalledProcessError as e:
-            logging.error(
-                f"Failed to start JupyterLab container {container_name}. Error: {e.stderr}"
-            )
-            db_update_error = get_db()
-            try:
-                db_update_error.execute(
-                    "UPDATE user_instances SET status = 'error' WHERE id = ?",
-                    (instance_id,),
-                )
-                db_update_error.commit()
-            finally:
-                db_update_error.close()
-            error_message = quote(
-                f"Failed to start JupyterLab container: {e.stderr.strip()}"
-            )
-            return RedirectResponse(
-                url=f"/dashboard?error={error_message}",
-                status_code=status.HTTP_302_FOUND,
-            )
-
-    except Exception as e:
-        db_exc = get_db()
-        db_exc.execute(
-            "UPDATE user_instances SET status = 'error' WHERE id = ?",
-            (instance_id,),
-        )
-        db_exc.commit()
-        db_exc.close()
-        logging.error(
-            f"Unexpected error in request_jupyterlab_instance for instance {instance_id}: {str(e)}",
-            exc_info=True,
-        )
-        error_message = quote(
-            f"An unexpected error occurred while preparing your JupyterLab instance: {str(e)}"
-        )
-        return RedirectResponse(
-            url=f"/dashboard?error={error_message}", status_code=status.HTTP_302_FOUND
-        )
-
-    return RedirectResponse(
-        url="/dashboard?message="
-        + quote(f"JupyterLab instance '{container_name}' is being prepared."),
-        status_code=status.HTTP_302_FOUND,
+):
+    return await request_instance(
+        "jupyterlab", request, current_user, memory_limit, cpu_limit, storage_limit, session_days
     )
 
 
@@ -991,60 +559,49 @@ async def stop_instance_action(
         # Step 1: Attempt to stop the Docker container
         docker_stopped_or_not_found = False
         try:
-            stop_cmd = ["docker", "stop", container_name]
-            logging.info(f"Executing: {' '.join(stop_cmd)}")
-            stop_process = subprocess.run(
-                stop_cmd,
-                capture_output=True,
-                text=True,
-                check=False,
-                timeout=60,  # Added timeout
+            logging.info(f"Stopping container {container_name} via Docker API")
+            was_running = await asyncio.to_thread(
+                docker_client.stop_container, container_name
             )
-
-            if stop_process.returncode == 0:
+            if was_running:
                 logging.info(
                     f"Successfully sent stop command to container {container_name}."
                 )
                 success_message_parts.append(
                     f"Instance '{container_name}' stop command processed."
                 )
-                docker_stopped_or_not_found = True
             else:
-                stderr_msg = stop_process.stderr.strip()
-                logging.warning(
-                    f"Output from 'docker stop {container_name}': {stderr_msg}"
+                logging.info(f"Container {container_name} was already stopped.")
+                success_message_parts.append(
+                    f"Instance '{container_name}' was already stopped/removed."
                 )
-                if "No such container" in stderr_msg:
-                    logging.info(f"Container {container_name} was already removed.")
-                    success_message_parts.append(
-                        f"Instance '{container_name}' was already stopped/removed."
-                    )
-                    docker_stopped_or_not_found = True
-                elif "is already in progress" in stderr_msg.lower():
-                    logging.info(
-                        f"Container {container_name} removal was already in progress."
-                    )
-                    success_message_parts.append(
-                        f"Instance '{container_name}' stop/removal was already in progress."
-                    )
-                    docker_stopped_or_not_found = True
-                else:
-                    error_accumulator.append(
-                        f"Docker stop issue: {stderr_msg if stderr_msg else 'Unknown error from docker stop'}"
-                    )
-        except FileNotFoundError:
-            logging.error(
-                "Docker command not found. Ensure Docker is installed and in PATH."
-            )
-            error_accumulator.append(
-                "Docker command not found. Please contact an administrator."
+            docker_stopped_or_not_found = True
+        except ContainerNotFoundError:
+            logging.info(f"Container {container_name} was already removed.")
+            success_message_parts.append(
+                f"Instance '{container_name}' was already stopped/removed."
             )
-        except PermissionError:
-            logging.error("Permission denied when trying to run Docker command.")
+            docker_stopped_or_not_found = True
+        except DockerAPIError as api_err:
+            logging.warning(f"Docker stop of {container_name} failed: {api_err}")
+            if "is already in progress" in api_err.message.lower():
+                logging.info(
+                    f"Container {container_name} removal was already in progress."
+                )
+                success_message_parts.append(
+                    f"Instance '{container_name}' stop/removal was already in progress."
+                )
+                docker_stopped_or_not_found = True
+            else:
+                error_accumulator.append(
+                    f"Docker stop issue: {api_err.message or 'Unknown error from docker stop'}"
+                )
+        except DockerUnavailableError as unavailable_err:
+            logging.error(f"Docker daemon unavailable: {unavailable_err}")
             error_accumulator.append(
-                "Permission issue with Docker. Please contact an administrator."
+                "Docker is not reachable. Please contact an administrator."
             )
-        except subprocess.TimeoutExpired:
+        except socket.timeout:
             logging.error(f"Docker stop command timed out for {container_name}.")
             error_accumulator.append(
                 f"Stopping instance '{container_name}' timed out. It may still be processing."
@@ -1082,6 +639,10 @@ async def stop_instance_action(
                 (db_status_to_set, stopped_at_value, instance_id),
             )
             db.commit()
+            status_broadcaster.changed([instance_id])
+            if db_status_to_set == "stopped":
+                port_allocator.release(instance["port"])
+                expiry_reaper.cancel(instance_id)
             logging.info(
                 f"Instance {instance_id} (Container: {container_name}) status updated to '{db_status_to_set}', stopped_at={stopped_at_value.isoformat() if stopped_at_value else 'None'} in DB."
             )
@@ -1137,6 +698,7 @@ async def stop_instance_action(
                         (instance_id,),
                     )
                     db.commit()
+                    status_broadcaster.changed([instance_id])
                     logging.info(
                         f"Instance {instance_id} status updated to 'error' due to critical exception."
                     )
@@ -1189,9 +751,41 @@ async def delete_instance(
             status_code=status.HTTP_302_FOUND,
         )
 
+    if not current_user["is_admin"] and instance["user_id"] != current_user["id"]:
+        db.close()
+        error_message = quote(
+            "Instance not found or you are not authorized to delete it."
+        )
+        return RedirectResponse(
+            url=f"/dashboard?error={error_message}",
+            status_code=status.HTTP_302_FOUND,
+        )
+
+    if instance["status"] in ACTIVE_STATUSES:
+        # Its container may still hold the port; stop it first
+        db.close()
+        error_message = quote("Stop the instance before deleting it.")
+        return RedirectResponse(
+            url=f"/dashboard?error={error_message}",
+            status_code=status.HTTP_302_FOUND,
+        )
+
     try:
-        db.execute("DELETE FROM user_instances WHERE id = ?", (instance_id,))
+        # Conditional so a row (re)started meanwhile is not deleted
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        cursor = db.execute(
+            f"DELETE FROM user_instances WHERE id = ? AND status NOT IN ({placeholders})",
+            (instance_id, *ACTIVE_STATUSES),
+        )
         db.commit()
+        if cursor.rowcount != 1:
+            error_message = quote("Stop the instance before deleting it.")
+            return RedirectResponse(
+                url=f"/dashboard?error={error_message}",
+                status_code=status.HTTP_302_FOUND,
+            )
+        status_broadcaster.removed(instance["user_id"], instance_id)
+        expiry_reaper.cancel(instance_id)
         success_message = quote(
             f"Instance record '{instance['container_name']}' deleted successfully."
         )
@@ -1211,12 +805,85 @@ async def delete_instance(
         db.close()
 
 
+def _extend_page(request: Request, instance_id: int, token: str, **context):
+    return templates.TemplateResponse(
+        "extend_session.html",
+        {
+            "request": request,
+            "instance_id": instance_id,
+            "token": token,
+            "extend_hours": expiry_notifier.extend_hours,
+            **context,
+        },
+    )
+
+
+@app.get("/extend_instance/{instance_id}", response_class=HTMLResponse)
+async def extend_instance_page(request: Request, instance_id: int, token: str = ""):
+    """
+    Confirmation page for the extend link in an expiry warning email
+    (signed, no login needed). Mail scanners fetch links, so this page
+    changes nothing; the form posts back to extend the session.
+    """
+    decoded = decode_extend_token(token)
+    if decoded is None or decoded[0] != instance_id:
+        return _extend_page(
+            request, instance_id, "", error="This extend link is invalid or has expired."
+        )
+    offer = await expiry_notifier.extension_offer(instance_id, decoded[1])
+    if offer is None:
+        return _extend_page(
+            request,
+            instance_id,
+            "",
+            error="This session was already extended or is no longer running.",
+        )
+    return _extend_page(request, instance_id, token, offer=offer)
+
+
+@app.post("/extend_instance/{instance_id}", response_class=HTMLResponse)
+async def extend_instance_action(
+    request: Request, instance_id: int, token: str = Form("")
+):
+    """Extend the session confirmed on the page above."""
+    decoded = decode_extend_token(token)
+    if decoded is None or decoded[0] != instance_id:
+        return _extend_page(
+            request, instance_id, "", error="This extend link is invalid or has expired."
+        )
+    expires_at = await expiry_notifier.extend(instance_id, decoded[1])
+    if expires_at is None:
+        return _extend_page(
+            request,
+            instance_id,
+            "",
+            error=(
+                "This session was already extended, is no longer running, "
+                "or has been extended as often as allowed."
+            ),
+        )
+    return _extend_page(
+        request,
+        instance_id,
+        "",
+        success=f"Session extended until {expires_at.strftime('%Y-%m-%d %H:%M UTC')}.",
+    )
+
+
 @app.get("/logout")
 async def logout(request: Request):
     response = RedirectResponse(
         url="/login?message=Successfully logged out", status_code=status.HTTP_302_FOUND
     )
+    # Revoke the token so a copied cookie stops working too
+    token = request.cookies.get(SESSION_COOKIE_NAME)
+    if token:
+        revoke_session_token(token)
     # Delete cookies with the same parameters they were set with
+    response.delete_cookie(
+        key=SESSION_COOKIE_NAME, httponly=True, samesite="Lax", secure=False
+    )
+    # Cookies used by sessions created before signed tokens
     response.delete_cookie(
         key="user_email", httponly=True, samesite="Lax", secure=False
     )
@@ -1235,8 +902,8 @@ async def admin_dashboard(
     ),  # Uses imported get_current_active_user
 ):
     """
-    Admin dashboard that displays all users and their RStudio instances.
-    Simplified version with direct database access (no threading).
+    Admin dashboard with one page of instances (filtered and sorted from the
+    query string) and one page of users, plus overview counts.
     """
     # Check if user is admin
     if not current_user["is_admin"]:
@@ -1247,115 +914,57 @@ async def admin_dashboard(
         )
 
     try:
-        # Connect to database
-        db = get_db()
-
-        # Get all users
-        users_data = db.execute(
-            "SELECT id, email, is_admin, created_at, lab_name FROM users ORDER BY id"
-        ).fetchall()
-
-        # Get all instances with user information and ordered status
-        instances_data = db.execute(
-            """
-            SELECT ui.id, ui.user_id, ui.container_name, ui.container_id, ui.port, ui.password,
-                   ui.created_at, ui.expires_at, ui.status, ui.stopped_at, ui.instance_type,
-                   u.email as owner_email
-            FROM user_instances ui
-            JOIN users u ON ui.user_id = u.id
-            ORDER BY
-                CASE ui.status
-                    WHEN 'running' THEN 1
-                    WHEN 'requested' THEN 2
-                    WHEN 'stopped' THEN 3
-                    WHEN 'error' THEN 4
-                    ELSE 5
-                END,
-                ui.created_at DESC
-        """
-        ).fetchall()
-
-        # Process users data
-        users_list = []
-        for user_row in users_data:
-            user_dict = dict(user_row)
-
-            # Process created_at date for each user
-            if user_dict.get("created_at"):
-                raw_created_at = user_dict["created_at"]
-                if isinstance(raw_created_at, str):
-                    try:
-                        user_dict["created_at"] = datetime.fromisoformat(
-                            raw_created_at.replace(" ", "T")
-                        )
-                    except ValueError:
-                        try:
-                            user_dict["created_at"] = datetime.strptime(
-                                raw_created_at, "%Y-%m-%d %H:%M:%S.%f"
-                            )
-                        except ValueError:
-                            try:
-                                user_dict["created_at"] = datetime.strptime(
-                                    raw_created_at, "%Y-%m-%d %H:%M:%S"
-                                )
-                            except ValueError:
-                                logger.warning(
-                                    f"Could not parse created_at for user {user_dict['id']}: {raw_created_at}"
-                                )
-                                user_dict["created_at"] = None
-                elif not isinstance(raw_created_at, datetime):
-                    logger.warning(
-                        f"Unexpected type for created_at for user {user_dict['id']}: {type(raw_created_at)}"
-                    )
-                    user_dict["created_at"] = None
-
-            users_list.append(user_dict)
-
-        # Process instances data
-        processed_instances = []
-        for instance_row in instances_data:
-            instance_dict = dict(instance_row)
-
-            # Process date fields for each instance
-            for field in ["created_at", "expires_at", "stopped_at"]:
-                value = instance_dict.get(field)
-                if value and isinstance(value, str):
-                    try:
-                        instance_dict[field] = datetime.fromisoformat(
-                            value.replace(" ", "T")
-                        )
-                    except ValueError:
-                        try:
-                            instance_dict[field] = datetime.strptime(
-                                value, "%Y-%m-%d %H:%M:%S"
-                            )
-                        except ValueError:
-                            logging.warning(
-                                f"Could not parse date string '{value}' for field '{field}' in instance ID {instance_dict.get('id')}. Setting to None."
-                            )
-                            instance_dict[field] = None
-                elif not isinstance(value, datetime) and value is not None:
-                    logging.warning(
-                        f"Unexpected type '{type(value)}' for date field '{field}' in instance ID {instance_dict.get('id')}. Setting to None."
-                    )
-                    instance_dict[field] = None
-
-            processed_instances.append(instance_dict)
+        params = request.query_params
+        filters = InstanceFilters.from_query(params)
+        instance_cursor = {
+            key: params[key] for key in ("after", "before") if params.get(key)
+        }
+        instance_page = fetch_instance_page(
+            filters,
+            after=params.get("after"),
+            before=params.get("before"),
+            limit=ADMIN_PAGE_SIZE,
+        )
+        user_page = fetch_user_page(
+            after=params.get("users_after"),
+            before=params.get("users_before"),
+            limit=ADMIN_PAGE_SIZE,
+        )
+        summary = admin_summary()
+
+        def page_url(**cursor):
+            return "/admin?" + urlencode({**filters.as_params(), **cursor})
+
+        pagination = {
+            "next": page_url(after=instance_page["next"]) if instance_page["next"] else None,
+            "prev": page_url(before=instance_page["prev"]) if instance_page["prev"] else None,
+            "users_next": page_url(**instance_cursor, users_after=user_page["next"])
+            if user_page["next"]
+            else None,
+            "users_prev": page_url(**instance_cursor, users_before=user_page["prev"])
+            if user_page["prev"]
+            else None,
+        }
 
         # Get base URL for RStudio links
         base_url = str(request.base_url).rstrip("/")
 
-        # Close database connection
-        db.close()
-
-        # Render template with all data
+        # Render template with the requested page
         return templates.TemplateResponse(
             "admin_dashboard.html",
             {
                 "request": request,
                 "user": current_user,
-                "users": users_list,
-                "instances": processed_instances,
+                "users": user_page["users"],
+                "instances": instance_page["instances"],
+                "summary": summary,
+                "filters": filters,
+                "filter_active": bool(filters.as_params()),
+                "pagination": pagination,
+                "statuses": INSTANCE_STATUSES,
+                "instance_types": INSTANCE_TYPES,
+                "sorts": INSTANCE_SORTS,
+                "lab_names": LAB_NAMES,
                 "base_url": base_url,
                 "title": "Admin Dashboard",
                 "memory_limit": RSTUDIO_DEFAULT_MEMORY,  # Add memory limit
@@ -1394,6 +1003,57 @@ async def admin_dashboard(
         )
 
 
+@app.get("/admin/provisioning-stats")
+async def admin_provisioning_stats(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """Provisioning queue depth, per-job timings and free ports for admins."""
+    if not current_user["is_admin"]:
+        return JSONResponse(content={"error": "Not authorized"}, status_code=403)
+    return JSONResponse(
+        content={
+            **provisioning_queue.stats(),
+            "ports": port_allocator.stats(),
+            "expiry": expiry_reaper.stats(),
+            "expiry_warnings": expiry_notifier.stats(),
+            "events": container_event_monitor.stats(),
+            "warm_pool": warm_pool.stats(),
+            "images": image_manager.stats(),
+            "requests": instance_service.stats(),
+            "admission": admission_controller.stats(),
+            "resources": resource_scheduler.stats(),
+            "live_updates": status_broadcaster.stats(),
+        }
+    )
+
+
+@app.get("/admin/db-stats")
+async def admin_db_stats(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """Connection pool counters, user cache hit rates, OTP limiter counters and table sizes for admins."""
+    if not current_user["is_admin"]:
+        return JSONResponse(content={"error": "Not authorized"}, status_code=403)
+    return JSONResponse(
+        content={
+            **get_pool_stats(),
+            "user_cache": user_cache.stats(),
+            "otp_guard": otp_guard.stats(),
+            "maintenance": database_maintenance.stats(),
+        }
+    )
+
+
+@app.get("/admin/email-stats")
+async def admin_email_stats(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """Email outbox counters, delivery latency and SMTP connection reuse for admins."""
+    if not current_user["is_admin"]:
+        return JSONResponse(content={"error": "Not authorized"}, status_code=403)
+    return JSONResponse(content=await asyncio.to_thread(email_outbox.stats))
+
+
 # Add uvicorn startup if this file is run directly (for development)
 if __name__ == "__main__":
     import uvicorn
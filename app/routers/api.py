@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import time
+
+from fastapi import APIRouter, Depends, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.core.config import (
+    EVENT_STREAM_KEEPALIVE_SECONDS,
+    EVENT_STREAM_MAX_SECONDS,
+    ADMIN_PAGE_SIZE,
+)
+from app.db.database import get_db
+from app.db.changes import change_counters
+from app.db.listings import (
+    InstanceFilters,
+    fetch_instance_page,
+    fetch_user_page,
+    admin_summary,
+)
+from app.auth.security import get_current_active_user
+from app.containers.live_status import (
+    status_broadcaster,
+    capacity_snapshot,
+    format_event,
+)
+from app.containers.warm_pool import warm_pool
+
+router = APIRouter(prefix="/api/v1")
+
+# Statuses a regular user's dashboard lists (admins see all of their own)
+DASHBOARD_STATUSES = ("running", "starting", "requested", "error")
+
+_INSTANCE_FIELDS = (
+    "id, container_name, instance_type, status, port, created_at, expires_at, "
+    "stopped_at, ready_seconds, memory_limit, cpu_limit, storage_limit, session_days"
+)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" match each other
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def conditional_json(request: Request, etag: str, build) -> Response:
+    """
+    304 if the client already has ``etag``, else the JSON from ``build()``.
+
+    ``build`` is only called when the data may have changed, so an
+    unchanged poll costs no database query.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=jsonable_encoder(build()), headers=headers)
+
+
+def _query_scope(request: Request) -> str:
+    """Short digest of the query string, so each page/filter has its own ETag."""
+    return hashlib.sha1(str(request.query_params).encode()).hexdigest()[:12]
+
+
+def _forbidden() -> JSONResponse:
+    return JSONResponse(
+        content={"error": "Not authorized"}, status_code=status.HTTP_403_FORBIDDEN
+    )
+
+
+# --- Current user ---
+
+
+@router.get("/instances")
+async def list_my_instances(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """The current user's instances, as listed on their dashboard."""
+
+    def build():
+        query = f"SELECT {_INSTANCE_FIELDS} FROM user_instances WHERE user_id = ?"
+        params = [current_user["id"]]
+        if not current_user["is_admin"]:
+            query += f" AND status IN ({', '.join('?' for _ in DASHBOARD_STATUSES)})"
+            params.extend(DASHBOARD_STATUSES)
+        query += " ORDER BY created_at DESC"
+        db = get_db()
+        try:
+            rows = db.execute(query, params).fetchall()
+        finally:
+            db.close()
+        return {"instances": [dict(row) for row in rows]}
+
+    etag = change_counters.etag(f"u{current_user['id']}", "user_instances")
+    return conditional_json(request, etag, build)
+
+
+@router.get("/instances/{instance_id}")
+async def get_my_instance(
+    instance_id: int,
+    request: Request,
+    current_user: dict = Depends(get_current_active_user),
+):
+    """Status of one of the current user's instances."""
+    # The scope includes the owner, so a matching ETag was issued to them
+    etag = change_counters.etag(
+        f"u{current_user['id']}-i{instance_id}", "user_instances"
+    )
+    if _etag_matches(request, etag):
+        return conditional_json(request, etag, None)
+    db = get_db()
+    try:
+        row = db.execute(
+            f"SELECT {_INSTANCE_FIELDS} FROM user_instances WHERE id = ? AND user_id = ?",
+            (instance_id, current_user["id"]),
+        ).fetchone()
+    finally:
+        db.close()
+    if row is None:
+        return JSONResponse(
+            content={"error": "Instance not found"},
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    return conditional_json(request, etag, lambda: dict(row))
+
+
+@router.get("/capacity")
+async def get_capacity(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """Session slots in use against the maximum, and free memory/CPUs."""
+    # Warm containers also commit resources but do not touch user_instances
+    warm = "-".join(str(count) for count in warm_pool.reserved().values())
+    return conditional_json(
+        request,
+        change_counters.etag(f"capacity{warm}", "user_instances"),
+        capacity_snapshot,
+    )
+
+
+@router.get("/events")
+async def stream_events(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Server-Sent Events stream of the current user's instance transitions
+    (``instance``) and system-wide session count changes (``capacity``).
+    A ``resync`` event means updates were dropped and the client should
+    re-fetch /api/v1/instances.
+    """
+    subscriber = status_broadcaster.subscribe(current_user["id"])
+    close_at = time.monotonic() + EVENT_STREAM_MAX_SECONDS
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            yield await asyncio.to_thread(status_broadcaster.capacity_event)
+            while not status_broadcaster.closing:
+                remaining = close_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(
+                        subscriber.queue.get(),
+                        timeout=min(EVENT_STREAM_KEEPALIVE_SECONDS, remaining),
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    yield format_event("resync", {})
+                    continue
+                yield message
+        finally:
+            status_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Admin ---
+
+
+@router.get("/admin/instances")
+async def admin_list_instances(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """
+    One page of instances with their owner, filtered and sorted like the
+    admin dashboard (same query parameters), plus the overview counts.
+    """
+    if not current_user["is_admin"]:
+        return _forbidden()
+    params = request.query_params
+    filters = InstanceFilters.from_query(params)
+
+    def build():
+        page = fetch_instance_page(
+            filters,
+            after=params.get("after"),
+            before=params.get("before"),
+            limit=ADMIN_PAGE_SIZE,
+        )
+        # Credentials are only shown on the dashboard itself
+        page["instances"] = [
+            record.as_dict(exclude=("password",)) for record in page["instances"]
+        ]
+        page["summary"] = admin_summary()
+        return page
+
+    etag = change_counters.etag(
+        f"admin-instances-{_query_scope(request)}", "user_instances", "users"
+    )
+    return conditional_json(request, etag, build)
+
+
+@router.get("/admin/users")
+async def admin_list_users(
+    request: Request, current_user: dict = Depends(get_current_active_user)
+):
+    """One page of registered users with their instance counts."""
+    if not current_user["is_admin"]:
+        return _forbidden()
+    params = request.query_params
+
+    def build():
+        page = fetch_user_page(
+            after=params.get("after"),
+            before=params.get("before"),
+            limit=ADMIN_PAGE_SIZE,
+        )
+        page["users"] = [record.as_dict() for record in page["users"]]
+        return page
+
+    etag = change_counters.etag(
+        f"admin-users-{_query_scope(request)}", "user_instances", "users"
+    )
+    return conditional_json(request, etag, build)
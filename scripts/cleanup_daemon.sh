@@ -62,7 +62,7 @@ cleanup_expired_instances() {
     log "Starting cleanup of expired RStudio instances..."
 
     # Query for expired instances
-    local query="SELECT id, container_name, user_id FROM user_instances WHERE status = 'running' AND expires_at < datetime('now');"
+    local query="SELECT id, container_name, user_id FROM user_instances WHERE status IN ('starting', 'running') AND expires_at < datetime('now');"
     local expired_instances
 
     expired_instances=$(sqlite3 "$DB_FILE" "$query" 2>/dev/null) || {
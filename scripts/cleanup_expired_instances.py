@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
+import argparse
 import sqlite3
-import subprocess
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import dotenv
 import logging
@@ -16,6 +19,15 @@ logging.basicConfig(
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 dotenv.load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
 
+# Make the app package importable for the shared Docker API client
+sys.path.insert(0, str(PROJECT_ROOT))
+from app.containers.runtime import (  # noqa: E402
+    docker_client,
+    ContainerNotFoundError,
+    DockerAPIError,
+    DockerUnavailableError,
+)
+
 # Database Configuration
 DB_MOUNT_PATH_STR = os.getenv("DB_MOUNT_PATH")
 DATABASE_FILENAME = os.getenv("DATABASE_FILENAME", "db.sqlite3")
@@ -48,13 +60,13 @@ def get_db_connection():
 
 
 def find_expired_instances(db_conn):
-    """Finds user instances that are past their expiration date and are 'running'."""
+    """Finds user instances that are past their expiration date and still live."""
     try:
         cursor = db_conn.cursor()
         query = """
             SELECT id, container_name, user_id
             FROM user_instances
-            WHERE status = 'running' AND expires_at < DATETIME('now')
+            WHERE status IN ('starting', 'running') AND expires_at < DATETIME('now')
         """
         cursor.execute(query)
         instances = cursor.fetchall()
@@ -71,40 +83,36 @@ def stop_and_remove_container(container_name):
         return False
     try:
         logging.info(f"Attempting to stop container: {container_name}")
-        subprocess.run(
-            ["docker", "stop", container_name],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
+        docker_client.stop_container(container_name)
         logging.info(f"Successfully stopped container: {container_name}")
 
         logging.info(f"Attempting to remove container: {container_name}")
-        subprocess.run(
-            ["docker", "rm", container_name], check=True, capture_output=True, text=True
-        )
+        try:
+            docker_client.remove_container(container_name)
+        except ContainerNotFoundError:
+            # Containers started with --rm (AutoRemove) disappear on stop
+            pass
         logging.info(f"Successfully removed container: {container_name}")
         return True
-    except subprocess.CalledProcessError as e:
-        logging.error(
-            f"Failed to stop/remove container {container_name}. Error: {e.stderr}"
+    except ContainerNotFoundError:
+        logging.info(
+            f"Container {container_name} does not exist, likely already removed."
         )
-        # If stop fails, rm might also fail or container might not exist.
-        # Check if container still exists before trying to remove if stop failed.
-        # For simplicity, we assume if stop worked, rm should be attempted.
-        # If stop failed, it might be already stopped/removed.
-        # Check if container exists
-        check_exists_ps = subprocess.run(
-            ["docker", "ps", "-a", "-f", f"name={container_name}"],
-            capture_output=True,
-            text=True,
+        return True  # Effectively removed
+    except DockerAPIError as e:
+        logging.error(
+            f"Failed to stop/remove container {container_name}. Error: {e.message}"
         )
-        if container_name not in check_exists_ps.stdout:
+        # If stop failed, the container might already be stopped/removed.
+        if not docker_client.container_exists(container_name):
             logging.info(
                 f"Container {container_name} does not exist, likely already removed."
             )
             return True  # Effectively removed
         return False
+    except (DockerUnavailableError, OSError) as e:
+        logging.error(f"Could not reach Docker to manage {container_name}: {e}")
+        return False
     except Exception as e:
         logging.error(
             f"An unexpected error occurred while managing container {container_name}: {e}"
@@ -112,21 +120,57 @@ def stop_and_remove_container(container_name):
         return False
 
 
-def update_instance_status_in_db(db_conn, instance_id, new_status="stopped_expired"):
-    """Updates the status of a user instance in the database."""
+def update_instance_statuses_in_db(db_conn, instance_ids, new_status="stopped_expired"):
+    """Updates the status of several user instances in a single transaction."""
+    if not instance_ids:
+        return True
     try:
-        cursor = db_conn.cursor()
-        query = "UPDATE user_instances SET status = ?, container_id = NULL WHERE id = ?"
-        cursor.execute(query, (new_status, instance_id))
-        db_conn.commit()
-        logging.info(f"Updated instance ID {instance_id} status to '{new_status}'.")
+        with db_conn:
+            db_conn.executemany(
+                """UPDATE user_instances
+                   SET status = ?, container_id = NULL, stopped_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status IN ('starting', 'running')""",
+                [(new_status, instance_id) for instance_id in instance_ids],
+            )
+        logging.info(
+            f"Updated {len(instance_ids)} instance(s) to status '{new_status}'."
+        )
         return True
     except sqlite3.Error as e:
-        logging.error(f"Error updating instance ID {instance_id} in database: {e}")
+        logging.error(f"Error updating instances {list(instance_ids)} in database: {e}")
         return False
 
 
-def main():
+def cleanup_instance(instance):
+    """Stops and removes one instance's container. Returns (instance, ok, seconds)."""
+    started = time.monotonic()
+    ok = stop_and_remove_container(instance["container_name"])
+    return instance, ok, time.monotonic() - started
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stop and remove expired RStudio/JupyterLab instances."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="List expired instances without stopping containers or updating the database.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=int(os.getenv("CLEANUP_MAX_WORKERS", "8")),
+        help="Number of containers to stop/remove concurrently (default: 8).",
+    )
+    args = parser.parse_args(argv)
+    if args.max_workers < 1:
+        parser.error("--max-workers must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
     logging.info("Starting RStudio cleanup script...")
 
     if not DATABASE.exists():
@@ -145,30 +189,50 @@ def main():
             return
 
         logging.info(f"Found {len(expired_instances)} expired instance(s) to process.")
-        cleaned_count = 0
-        for instance in expired_instances:
-            logging.info(
-                f"Processing instance ID: {instance['id']}, "
-                f"Container: {instance['container_name']}"
-            )
-            if stop_and_remove_container(instance["container_name"]):
-                if update_instance_status_in_db(db_conn, instance["id"]):
-                    cleaned_count += 1
-                else:
-                    # E501: Line shortened
-                    logging.error(
-                        f"Failed to update database for instance ID: {instance['id']} "
-                        "after container removal."
-                    )
+        if args.dry_run:
+            for instance in expired_instances:
+                logging.info(
+                    f"[dry-run] Would stop instance ID: {instance['id']}, "
+                    f"Container: {instance['container_name']}"
+                )
+            return
+
+        # Stopping waits up to the container's grace period, so run the
+        # Docker calls concurrently and write all status changes at once
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+            results = list(executor.map(cleanup_instance, expired_instances))
+
+        cleaned_ids = []
+        for instance, ok, seconds in results:
+            if ok:
+                cleaned_ids.append(instance["id"])
             else:
-                # E501: Line shortened
                 logging.warning(
                     f"Could not stop/remove container {instance['container_name']}. "
                     f"Database not updated for instance ID: {instance['id']}."
                 )
+
+        if not update_instance_statuses_in_db(db_conn, cleaned_ids):
+            logging.error(
+                f"Failed to update database for instance IDs: {cleaned_ids} "
+                "after container removal."
+            )
+            cleaned_ids = []
+
+        elapsed = time.monotonic() - started
+        logging.info("Per-container timings:")
+        for instance, ok, seconds in sorted(results, key=lambda r: r[2], reverse=True):
+            logging.info(
+                f"  {instance['container_name']:<40} "
+                f"{'ok' if ok else 'FAILED':<6} {seconds:6.2f}s"
+            )
+        durations = [seconds for _, _, seconds in results]
         logging.info(
-            f"Successfully cleaned up {cleaned_count} of "  # E501: Line shortened
-            f"{len(expired_instances)} expired instances."
+            f"Successfully cleaned up {len(cleaned_ids)} of "
+            f"{len(expired_instances)} expired instances in {elapsed:.2f}s "
+            f"({args.max_workers} workers; slowest {max(durations):.2f}s, "
+            f"total container time {sum(durations):.2f}s)."
         )
 
     finally:
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+import dotenv
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Load environment variables from .env file in the project root
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+dotenv.load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+
+sys.path.insert(0, str(PROJECT_ROOT))
+from app.core.config import DATABASE_PATH  # noqa: E402
+from app.db.database import (  # noqa: E402
+    close_db_pool,
+    enable_incremental_vacuum,
+    get_db,
+    incremental_vacuum_enabled,
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Rebuild the portal database once with VACUUM so the maintenance job can "
+            "return freed pages with PRAGMA incremental_vacuum. The rebuild holds the "
+            "write lock until it finishes; stop the portal first."
+        )
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only report whether the database already uses incremental vacuum.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not Path(DATABASE_PATH).exists():
+        logging.error(f"Database file not found at {DATABASE_PATH}. Exiting.")
+        return 1
+    db = get_db()
+    try:
+        if args.check:
+            enabled = incremental_vacuum_enabled(db)
+            logging.info(
+                f"Incremental vacuum is {'enabled' if enabled else 'not enabled'}."
+            )
+            return 0 if enabled else 2
+        if not enable_incremental_vacuum(db):
+            logging.info("The database already uses incremental vacuum; nothing to do.")
+    finally:
+        db.close()
+        close_db_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())